@@ -1,12 +1,23 @@
-from __future__ import print_function
+from __future__ import annotations, print_function
 
+import datetime as dt
+import json
 import logging
+import os
 import sys
 from argparse import ArgumentParser, Namespace
+from dataclasses import replace
 from pathlib import Path
-from typing import Callable, Dict
+from typing import TYPE_CHECKING, Callable, Dict, Optional
 
-from s3pypi import __prog__, __version__, core
+from s3pypi import __prog__, __version__
+from s3pypi.compression import ENCODINGS
+from s3pypi.exceptions import S3PyPiError
+
+# Commands import their modules when they run, so that `--help` and argument
+# errors don't wait for boto3 to load.
+if TYPE_CHECKING:
+    from s3pypi import core
 
 logging.basicConfig()
 log = logging.getLogger(__prog__)
@@ -16,6 +27,14 @@ def string_dict(text: str) -> Dict[str, str]:
     return dict(tuple(item.strip().split("=", 1)) for item in text.split(","))  # type: ignore
 
 
+def byte_size(text: str) -> int:
+    units = {"K": 1024, "M": 1024**2, "G": 1024**3}
+    text = text.strip().upper().rstrip("B")
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
 def build_arg_parser() -> ArgumentParser:
     p = ArgumentParser(prog=__prog__)
     p.add_argument("-V", "--version", action="version", version=__version__)
@@ -24,9 +43,11 @@ def build_arg_parser() -> ArgumentParser:
     commands = p.add_subparsers(help="Commands", required=True)
 
     def add_command(
-        func: Callable[[core.Config, Namespace], None], help: str
+        func: Callable[[core.Config, Namespace], None],
+        help: str,
+        name: Optional[str] = None,
     ) -> ArgumentParser:
-        name = func.__name__.replace("_", "-")
+        name = name or func.__name__.replace("_", "-")
         cmd = commands.add_parser(name, help=help)
         cmd.set_defaults(func=func)
         return cmd
@@ -53,12 +74,311 @@ def build_arg_parser() -> ArgumentParser:
     g.add_argument(
         "-f", "--force", action="store_true", help="Overwrite existing files."
     )
+    up.add_argument(
+        "--no-progress",
+        dest="progress",
+        action="store_false",
+        help="Don't report upload progress.",
+    )
+    up.add_argument(
+        "--resume",
+        action="store_true",
+        help=(
+            "Continue an interrupted upload of the same files: skip files that were "
+            "uploaded and indexes that were updated."
+        ),
+    )
+    up.add_argument(
+        "--transaction-log",
+        metavar="FILE",
+        type=Path,
+        help=(
+            "Where to record the progress of the upload "
+            "(default: a file in ~/.cache/s3pypi/transactions/)."
+        ),
+    )
 
     d = add_command(delete, help="Delete packages from S3.")
     d.add_argument("name", help="Package name.")
     d.add_argument("version", help="Package version.")
     build_s3_args(d)
 
+    m = add_command(mirror, help="Mirror packages from an upstream index to S3.")
+    m.add_argument(
+        "requirements",
+        nargs="+",
+        metavar="NAME[==VERSION]",
+        help="The packages to mirror, optionally pinned to a single version.",
+    )
+    m.add_argument(
+        "--index-url",
+        metavar="URL",
+        help="Base URL of the upstream simple index (default: PyPI).",
+    )
+    build_s3_args(m)
+    m.add_argument(
+        "--put-root-index",
+        action="store_true",
+        help="Write a root index that lists all available package names.",
+    )
+    m.add_argument(
+        "-j",
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Maximum number of parallel downloads (default: %(default)s).",
+    )
+    m.add_argument(
+        "--max-bandwidth",
+        metavar="BYTES",
+        type=byte_size,
+        help="Maximum total download rate per second. Example: '10M'",
+    )
+    m.add_argument(
+        "--no-progress",
+        dest="progress",
+        action="store_false",
+        help="Don't report upload progress.",
+    )
+
+    sv = add_command(serve, help="Run an upload server for tools like twine.")
+    build_s3_args(sv)
+    sv.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Address to listen on (default: %(default)s).",
+    )
+    sv.add_argument(
+        "--port",
+        type=int,
+        default=8080,
+        help="Port to listen on (default: %(default)s).",
+    )
+    sv.add_argument(
+        "--batch-window",
+        metavar="SECONDS",
+        type=float,
+        default=2.0,
+        help=(
+            "Time to wait for more uploads of the same package before committing "
+            "them to its index in one go (default: %(default)s)."
+        ),
+    )
+    sv.add_argument(
+        "--put-root-index",
+        action="store_true",
+        help="Update the root index when a new package is uploaded.",
+    )
+    sv.add_argument(
+        "-f", "--force", action="store_true", help="Overwrite existing files."
+    )
+    sv.add_argument(
+        "--username",
+        default="__token__",
+        help="Username that clients must upload with (default: %(default)s).",
+    )
+    sv.add_argument(
+        "--password",
+        default=os.environ.get("S3PYPI_SERVE_PASSWORD"),
+        help=(
+            "Password that clients must upload with. "
+            "Defaults to the S3PYPI_SERVE_PASSWORD environment variable."
+        ),
+    )
+
+    sd = add_command(sync_down, help="Download packages from S3 to a directory.")
+    sd.add_argument(
+        "dest",
+        type=Path,
+        help="The local directory to sync to. It can be served as a package index.",
+    )
+    sd.add_argument(
+        "projects",
+        nargs="*",
+        metavar="NAME",
+        help="Packages to sync (default: all packages listed in the root index).",
+    )
+    build_s3_args(sd)
+    sd.add_argument(
+        "-j",
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Maximum number of parallel downloads (default: %(default)s).",
+    )
+    sd.add_argument(
+        "--delete",
+        action="store_true",
+        help="Remove local files that have been deleted from S3.",
+    )
+
+    pr = add_command(promote, help="Copy a release to another prefix or bucket.")
+    pr.add_argument("name", help="Package name.")
+    pr.add_argument("version", help="Package version.")
+    build_s3_args(pr)
+    pr.add_argument(
+        "--to-bucket",
+        metavar="BUCKET",
+        help="The S3 bucket to copy to (default: the source bucket).",
+    )
+    pr.add_argument(
+        "--to-prefix",
+        metavar="PREFIX",
+        help="The prefix to copy to (default: no prefix).",
+    )
+    pr.add_argument(
+        "--put-root-index",
+        action="store_true",
+        help="Write a root index at the destination.",
+    )
+    pr.add_argument(
+        "-f", "--force", action="store_true", help="Overwrite existing files."
+    )
+
+    rp = add_command(
+        replicate, help="Copy new and changed files to another bucket or endpoint."
+    )
+    rp.add_argument(
+        "projects",
+        nargs="*",
+        metavar="NAME",
+        help="Packages to replicate (default: all packages).",
+    )
+    build_s3_args(rp)
+    g = rp.add_mutually_exclusive_group(required=True)
+    g.add_argument("--to-bucket", metavar="BUCKET", help="The S3 bucket to copy to.")
+    g.add_argument(
+        "--to-local-dir", metavar="DIR", type=Path, help="The directory to copy to."
+    )
+    rp.add_argument(
+        "--to-prefix",
+        metavar="PREFIX",
+        help="The prefix to copy to (default: no prefix).",
+    )
+    rp.add_argument(
+        "--to-s3-endpoint-url",
+        metavar="URL",
+        help="S3 endpoint URL of the destination (default: the source endpoint).",
+    )
+    rp.add_argument("--to-profile", help="AWS profile for the destination.")
+    rp.add_argument("--to-region", help="AWS region of the destination.")
+    rp.add_argument(
+        "-j",
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Maximum number of files to copy in parallel (default: %(default)s).",
+    )
+    rp.add_argument(
+        "--delete",
+        action="store_true",
+        help="Remove files from the destination that don't exist in the source.",
+    )
+    rp.add_argument(
+        "--put-root-index",
+        action="store_true",
+        help="Write a root index at the destination.",
+    )
+
+    bf = add_command(
+        backfill_metadata, help="Extract metadata from existing wheels on S3."
+    )
+    bf.add_argument(
+        "projects",
+        nargs="*",
+        metavar="NAME",
+        help="Packages to backfill (default: all packages).",
+    )
+    build_s3_args(bf)
+    bf.add_argument(
+        "-j",
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Maximum number of wheels to read in parallel (default: %(default)s).",
+    )
+    bf.add_argument(
+        "--batch-size",
+        type=int,
+        default=100,
+        help="Number of files to add to an index at once (default: %(default)s).",
+    )
+
+    ls = add_command(list_projects, help="List all packages.", name="list")
+    build_s3_args(ls)
+    ls.add_argument(
+        "--latest",
+        action="store_true",
+        help="Also show the latest version and number of files of each package.",
+    )
+    ls.add_argument("--json", action="store_true", help="Print the output as JSON.")
+    ls.add_argument(
+        "-j",
+        "--concurrency",
+        type=int,
+        default=16,
+        help="Maximum number of indexes to fetch in parallel (default: %(default)s).",
+    )
+
+    sh = add_command(show, help="Show the versions, files and hashes of packages.")
+    sh.add_argument("projects", nargs="+", metavar="NAME", help="Package names.")
+    build_s3_args(sh)
+    sh.add_argument("--json", action="store_true", help="Print the output as JSON.")
+    sh.add_argument(
+        "-j",
+        "--concurrency",
+        type=int,
+        default=16,
+        help="Maximum number of indexes to fetch in parallel (default: %(default)s).",
+    )
+
+    gc = add_command(
+        collect_garbage, help="Delete stored blobs that no index uses.", name="gc"
+    )
+    build_s3_args(gc)
+    gc.add_argument(
+        "--grace-period",
+        metavar="HOURS",
+        type=float,
+        default=24,
+        help="Keep blobs modified in this period (default: %(default)s).",
+    )
+    gc.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only print the blobs that would be deleted.",
+    )
+
+    rc = add_command(
+        repair_catalog,
+        help="Update the catalog from all package indexes and a listing of the bucket.",
+    )
+    build_s3_args(rc)
+    rc.add_argument(
+        "--put-root-index",
+        action="store_true",
+        help="Also write the root index from the repaired catalog.",
+    )
+
+    ch = add_command(changes, help="Print the changes recorded in the journal.")
+    build_s3_args(ch)
+    ch.add_argument(
+        "--since",
+        metavar="SEQ",
+        type=int,
+        default=0,
+        help="Only print changes after this sequence number.",
+    )
+
+    lk = add_command(locks, help="Show held locks and lock statistics in DynamoDB.")
+    lk.add_argument("table", help="DynamoDB table.")
+    lk.add_argument(
+        "--stats",
+        action="store_true",
+        help="Show wait and hold times per key (recorded with `--lock-stats`).",
+    )
+    build_aws_args(lk)
+
     ul = add_command(force_unlock, help="Release a stuck lock in DynamoDB.")
     ul.add_argument("table", help="DynamoDB table.")
     ul.add_argument("lock_id", help="ID of the lock to release.")
@@ -73,7 +393,14 @@ def build_aws_args(p: ArgumentParser) -> None:
 
 
 def build_s3_args(p: ArgumentParser) -> None:
-    p.add_argument("-b", "--bucket", required=True, help="The S3 bucket to upload to.")
+    g = p.add_mutually_exclusive_group(required=True)
+    g.add_argument("-b", "--bucket", help="The S3 bucket to upload to.")
+    g.add_argument(
+        "--local-dir",
+        metavar="DIR",
+        type=Path,
+        help="Use a local (or network-mounted) directory instead of an S3 bucket.",
+    )
     p.add_argument("--prefix", help="Optional prefix to use for S3 object names.")
 
     build_aws_args(p)
@@ -104,28 +431,310 @@ def build_s3_args(p: ArgumentParser) -> None:
             "This provides compatibility with custom HTTPS proxies or S3 website endpoints."
         ),
     )
+    p.add_argument(
+        "--index-compression",
+        choices=ENCODINGS,
+        help="Store index pages compressed with the given Content-Encoding.",
+    )
     p.add_argument(
         "--locks-table",
         metavar="TABLE",
         help="DynamoDB table to use for locking (default: `<bucket>-locks`).",
     )
+    p.add_argument(
+        "--lock-stats",
+        action="store_true",
+        help="Record lock wait and hold times in the locks table.",
+    )
+    p.add_argument(
+        "--journal",
+        action="store_true",
+        help=(
+            "Start a journal of index changes in the bucket, if there is none yet. "
+            "Once started, all index changes are recorded."
+        ),
+    )
+    p.add_argument(
+        "--blob-store",
+        action="store_true",
+        help=(
+            "Store files once per bucket under their SHA-256, shared by all prefixes, "
+            "and skip uploading files that are already stored. "
+            "Use `s3pypi gc` to delete files that are no longer used."
+        ),
+    )
+    p.add_argument(
+        "--rate-limits",
+        metavar="LIMITS",
+        type=string_dict,
+        default={},
+        help=(
+            "Maximum requests per second for each class of requests: S3 `read` "
+            "and `write` requests, and DynamoDB `lock` requests. Rates are lowered "
+            "automatically when AWS throttles requests. Example: 'read=500,write=300'"
+        ),
+    )
+    p.add_argument(
+        "--index-max-age",
+        metavar="SECONDS",
+        type=int,
+        default=0,
+        help=(
+            "Let a CDN cache index pages for this long (`s-maxage`). "
+            "Use with --cloudfront-distribution-id so changed pages are invalidated."
+        ),
+    )
+    p.add_argument(
+        "--cloudfront-distribution-id",
+        metavar="ID",
+        help="CloudFront distribution to invalidate changed index pages in.",
+    )
+    p.add_argument(
+        "--cloudfront-endpoint-url",
+        metavar="URL",
+        help="Optional custom CloudFront endpoint URL.",
+    )
 
 
 def upload(cfg: core.Config, args: Namespace) -> None:
+    from s3pypi import core
+    from s3pypi.progress import Progress
+    from s3pypi.transaction import TransactionLog
+
+    target = str(cfg.local_dir) if cfg.local_dir else f"s3://{cfg.s3.bucket}"
+    path = args.transaction_log or TransactionLog.default_path(
+        "/".join(filter(None, [cfg.s3.endpoint_url, target, cfg.s3.prefix])),
+        args.dist,
+    )
     core.upload_packages(
         cfg,
         args.dist,
         put_root_index=args.put_root_index,
         strict=args.strict,
         force=args.force,
+        progress=Progress() if args.progress else None,
+        transaction_log=TransactionLog(path, resume=args.resume),
     )
 
 
 def delete(cfg: core.Config, args: Namespace) -> None:
+    from s3pypi import core
+
     core.delete_package(cfg, name=args.name, version=args.version)
 
 
+def mirror(cfg: core.Config, args: Namespace) -> None:
+    from s3pypi import upstream
+    from s3pypi.progress import Progress
+
+    upstream.mirror_packages(
+        cfg,
+        args.requirements,
+        upstream.MirrorConfig(
+            index_url=args.index_url or upstream.DEFAULT_INDEX_URL,
+            concurrency=args.concurrency,
+            max_bandwidth=args.max_bandwidth,
+        ),
+        put_root_index=args.put_root_index,
+        progress=Progress() if args.progress else None,
+    )
+
+
+def serve(cfg: core.Config, args: Namespace) -> None:
+    from s3pypi import server
+
+    if not args.password:
+        raise S3PyPiError(
+            "The upload server requires a password: "
+            "set --password or S3PYPI_SERVE_PASSWORD"
+        )
+
+    server.serve(
+        cfg,
+        server.ServerConfig(
+            host=args.host,
+            port=args.port,
+            batch_window=args.batch_window,
+            put_root_index=args.put_root_index,
+            force=args.force,
+            username=args.username,
+            password=args.password,
+        ),
+    )
+
+
+def sync_down(cfg: core.Config, args: Namespace) -> None:
+    from s3pypi import sync
+
+    sync.sync_down(
+        cfg,
+        args.dest,
+        args.projects,
+        sync.SyncConfig(concurrency=args.concurrency, delete=args.delete),
+    )
+
+
+def promote(cfg: core.Config, args: Namespace) -> None:
+    from s3pypi import core
+
+    dest_cfg = replace(
+        cfg,
+        s3=replace(
+            cfg.s3,
+            bucket=args.to_bucket or cfg.s3.bucket,
+            prefix=args.to_prefix,
+            locks_table=None if args.to_bucket else cfg.s3.locks_table,
+        ),
+    )
+    core.promote_package(
+        cfg,
+        dest_cfg,
+        name=args.name,
+        version=args.version,
+        put_root_index=args.put_root_index,
+        force=args.force,
+    )
+
+
+def replicate(cfg: core.Config, args: Namespace) -> None:
+    from s3pypi import replicate
+
+    dest_cfg = replace(
+        cfg,
+        s3=replace(
+            cfg.s3,
+            bucket=args.to_bucket or "",
+            prefix=args.to_prefix,
+            profile=args.to_profile or cfg.s3.profile,
+            region=args.to_region or cfg.s3.region,
+            endpoint_url=args.to_s3_endpoint_url or cfg.s3.endpoint_url,
+            locks_table=None,
+            cloudfront_distribution_id=None,
+        ),
+        local_dir=args.to_local_dir,
+    )
+    replicate.replicate(
+        cfg,
+        dest_cfg,
+        args.projects,
+        replicate.ReplicateConfig(
+            concurrency=args.concurrency,
+            delete=args.delete,
+            put_root_index=args.put_root_index,
+        ),
+    )
+
+
+def backfill_metadata(cfg: core.Config, args: Namespace) -> None:
+    from s3pypi import backfill
+
+    backfill.backfill_metadata(
+        cfg,
+        args.projects,
+        backfill.BackfillConfig(
+            concurrency=args.concurrency, batch_size=args.batch_size
+        ),
+    )
+
+
+def list_projects(cfg: core.Config, args: Namespace) -> None:
+    from s3pypi import core, query
+
+    storage = core.build_storage(cfg)
+    if not args.latest:
+        names = query.list_projects(storage)
+        print(json.dumps(names, indent=2) if args.json else "\n".join(names))
+        return
+
+    projects = query.summarize_projects(storage, args.concurrency)
+    if args.json:
+        data = {
+            name: {"latest_version": p.latest_version, "files": p.files}
+            for name, p in projects.items()
+        }
+        print(json.dumps(data, indent=2))
+        return
+
+    print(f"{'NAME':40} {'LATEST':20} {'FILES':>6}")
+    for name, p in projects.items():
+        print(f"{name:40} {p.latest_version or '-':20} {p.files:6}")
+
+
+def show(cfg: core.Config, args: Namespace) -> None:
+    from s3pypi import core, query
+
+    storage = core.build_storage(cfg)
+    directories = [core.normalize_package_name(name) for name in args.projects]
+    indexes = query.get_indexes(storage, directories, args.concurrency)
+
+    missing = [d for d, index in indexes.items() if not index.filenames]
+    if missing:
+        raise S3PyPiError(f"Package not found: {', '.join(missing)}")
+
+    data = {d: query.describe_project(index) for d, index in indexes.items()}
+    if args.json:
+        print(json.dumps(data, indent=2))
+        return
+
+    for directory, versions in data.items():
+        print(directory)
+        for version, files in versions.items():
+            print(f"  {version or '(unknown version)'}")
+            for file in files:
+                print(f"    {file['filename']}  {file['hash'] or ''}".rstrip())
+
+
+def collect_garbage(cfg: core.Config, args: Namespace) -> None:
+    from s3pypi import blobs
+
+    blobs.collect_garbage(
+        cfg, dt.timedelta(hours=args.grace_period), dry_run=args.dry_run
+    )
+
+
+def repair_catalog(cfg: core.Config, args: Namespace) -> None:
+    from s3pypi import core
+
+    core.repair_catalog(cfg, put_root_index=args.put_root_index)
+
+
+def changes(cfg: core.Config, args: Namespace) -> None:
+    from s3pypi import core
+
+    for change in core.read_changes(cfg, args.since):
+        print(json.dumps(change.to_dict()))
+
+
+def locks(cfg: core.Config, args: Namespace) -> None:
+    from s3pypi import core
+
+    held, stats = core.list_locks(cfg, args.table)
+    now = dt.datetime.now(dt.timezone.utc)
+
+    if args.stats:
+        print(
+            f"{'KEY':30} {'ACQUIRED':>9} {'TIMEOUTS':>9} {'AVG WAIT':>9} {'AVG HOLD':>9}"
+        )
+        for s in sorted(stats, key=lambda s: s.wait_seconds, reverse=True):
+            n = max(s.acquisitions, 1)
+            print(
+                f"{s.key or s.lock_id:30} {s.acquisitions:9} {s.timeouts:9} "
+                f"{s.wait_seconds / n:8.2f}s {s.hold_seconds / n:8.2f}s"
+            )
+        return
+
+    print(f"{'LOCK ID':40} {'KEY':20} {'OWNER':30} {'AGE':>8}")
+    for lock in sorted(held, key=lambda lock: lock.acquired_at):
+        age = int((now - lock.acquired_at).total_seconds())
+        print(
+            f"{lock.lock_id:40} {lock.key or '?':20} {lock.owner:30} "
+            f"{age // 60:5}m{age % 60:02}s"
+        )
+
+
 def force_unlock(cfg: core.Config, args: Namespace) -> None:
+    from s3pypi import core
+
     core.force_unlock(cfg, args.table, args.lock_id)
 
 
@@ -133,9 +742,11 @@ def main(*raw_args: str) -> None:
     args = build_arg_parser().parse_args(raw_args or sys.argv[1:])
     log.setLevel(logging.DEBUG if args.verbose else logging.INFO)
 
+    from s3pypi import core
+
     cfg = core.Config(
         s3=core.S3Config(
-            bucket=args.bucket,
+            bucket=args.bucket or "",
             prefix=args.prefix,
             profile=args.profile,
             region=args.region,
@@ -144,6 +755,14 @@ def main(*raw_args: str) -> None:
             put_kwargs=args.s3_put_args,
             index_html=args.index_html,
             locks_table=args.locks_table,
+            index_compression=args.index_compression,
+            lock_stats=args.lock_stats,
+            index_max_age=args.index_max_age,
+            cloudfront_distribution_id=args.cloudfront_distribution_id,
+            cloudfront_endpoint_url=args.cloudfront_endpoint_url,
+            journal=args.journal,
+            blob_store=args.blob_store,
+            rate_limits=args.rate_limits,
         )
         if hasattr(args, "bucket")
         else core.S3Config(
@@ -151,11 +770,12 @@ def main(*raw_args: str) -> None:
             profile=args.profile,
             region=args.region,
         ),
+        local_dir=getattr(args, "local_dir", None),
     )
 
     try:
         args.func(cfg, args)
-    except core.S3PyPiError as e:
+    except S3PyPiError as e:
         sys.exit(f"ERROR: {e}")
 
 
@@ -0,0 +1,128 @@
+import logging
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+
+import botocore
+
+from s3pypi import __prog__
+from s3pypi.core import Config, build_storage, normalize_package_name
+from s3pypi.exceptions import S3PyPiError
+from s3pypi.index import FileMetadata, Hash
+from s3pypi.metadata import parse_core_metadata, read_wheel_metadata
+from s3pypi.storage import Storage
+
+log = logging.getLogger(__prog__)
+
+
+@dataclass
+class BackfillConfig:
+    concurrency: int = 8
+    batch_size: int = 100
+    buffer_size: int = 64 * 1024
+
+
+Extracted = Tuple[str, Hash, Optional[str]]
+
+
+def backfill_metadata(
+    cfg: Config,
+    projects: Optional[List[str]] = None,
+    backfill: BackfillConfig = BackfillConfig(),
+) -> None:
+    """Extract core metadata from wheels that were uploaded without it.
+
+    Only the zip central directory and the METADATA entry of each wheel are
+    read, using ranged reads. The metadata is stored next to the wheel as
+    `<filename>.metadata` and referenced from the index (PEP 658).
+    """
+    with build_storage(cfg) as storage:
+        if projects:
+            directories = [normalize_package_name(p) for p in projects]
+        elif catalog := storage.get_catalog():
+            directories = list(catalog.projects)
+        else:
+            directories = [d.rstrip("/") for d in storage.list_directories()]
+
+        failures = 0
+        with ThreadPoolExecutor(max_workers=backfill.concurrency) as executor:
+            pending: Dict[str, Dict[Future, str]] = {}
+            for directory, index in zip(
+                directories, executor.map(storage.get_index, directories)
+            ):
+                futures = pending[directory] = {}
+                for filename in index.filenames:
+                    metadata = index.metadata.get(filename, FileMetadata())
+                    if filename.endswith(".whl") and not metadata.core_metadata:
+                        future = executor.submit(
+                            extract,
+                            storage,
+                            storage.locate(directory, index, filename),
+                            filename,
+                            metadata,
+                            backfill,
+                        )
+                        futures[future] = filename
+
+            for directory, futures in pending.items():
+                batch: List[Extracted] = []
+                for future, filename in futures.items():
+                    try:
+                        if result := future.result():
+                            batch.append(result)
+                    except (
+                        EOFError,
+                        OSError,
+                        S3PyPiError,
+                        zipfile.BadZipFile,
+                        botocore.exceptions.BotoCoreError,
+                        botocore.exceptions.ClientError,
+                    ) as e:
+                        log.error("Failed to read %s/%s: %s", directory, filename, e)
+                        failures += 1
+
+                    if len(batch) >= backfill.batch_size:
+                        commit(storage, directory, batch)
+                        batch = []
+                if batch:
+                    commit(storage, directory, batch)
+
+    if failures:
+        raise S3PyPiError(f"Failed to read metadata from {failures} files")
+
+
+def extract(
+    storage: Storage,
+    directory: str,
+    filename: str,
+    metadata: FileMetadata,
+    backfill: BackfillConfig,
+) -> Optional[Extracted]:
+    size = metadata.size or storage.distribution_size(directory, filename)
+    data = read_wheel_metadata(
+        filename,
+        partial(storage.read_range, directory, filename),
+        size,
+        backfill.buffer_size,
+    )
+    if data is None:
+        log.warning("No METADATA found in %s/%s", directory, filename)
+        return None
+
+    log.info("Extracted metadata from %s/%s", directory, filename)
+    storage.put_metadata(directory, filename, data)
+    requires_python = parse_core_metadata(data).get("Requires-Python")
+    return filename, Hash.of_bytes("sha256", data), requires_python
+
+
+def commit(storage: Storage, directory: str, batch: List[Extracted]) -> None:
+    log.debug("Updating %d entries in %s", len(batch), directory)
+    with storage.locked_index(directory) as index:
+        for filename, hash_, requires_python in batch:
+            if filename not in index.filenames:
+                continue  # Deleted in the meantime.
+            metadata = index.metadata.setdefault(filename, FileMetadata())
+            metadata.core_metadata = hash_
+            metadata.requires_python = metadata.requires_python or requires_python
@@ -0,0 +1,102 @@
+import datetime as dt
+import logging
+import posixpath
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from typing import Dict, List, Set
+
+import botocore
+
+from s3pypi import __prog__
+from s3pypi.compression import decompress
+from s3pypi.core import Config
+from s3pypi.exceptions import S3PyPiError
+from s3pypi.index import Index
+from s3pypi.storage import S3Storage
+
+log = logging.getLogger(__prog__)
+
+
+def collect_garbage(
+    cfg: Config,
+    grace_period: dt.timedelta = dt.timedelta(days=1),
+    dry_run: bool = False,
+    concurrency: int = 16,
+) -> List[str]:
+    """Delete blobs that no index in the bucket links to, and return their keys.
+
+    Blobs are shared by all prefixes, so the index pages under every prefix are
+    read. Blobs that were modified within the grace period are kept, because
+    an upload stores (or touches) the blob before it adds the file to the index.
+    """
+    if cfg.local_dir:
+        raise S3PyPiError("Blob storage is only supported in S3 buckets")
+
+    storage = S3Storage(replace(cfg.s3, prefix=None))
+    client = storage.s3.meta.client
+    blob_prefix = f"{storage.blob_directory}/"
+
+    blobs: Dict[str, dt.datetime] = {}
+    pages = []
+    for page in client.get_paginator("list_objects_v2").paginate(Bucket=cfg.s3.bucket):
+        for obj in page.get("Contents", []):
+            key = obj["Key"]
+            if key.startswith(blob_prefix):
+                blobs[key] = obj["LastModified"]
+            elif key.endswith("/") or posixpath.basename(key) == "index.html":
+                pages.append(key)
+
+    def read_links(key: str) -> Set[str]:
+        response = client.get_object(Bucket=cfg.s3.bucket, Key=key)
+        html = decompress(
+            response["Body"].iter_chunks(), response.get("ContentEncoding", "")
+        )
+        base = key[: key.rfind("/") + 1]
+        return {
+            posixpath.dirname(
+                posixpath.normpath(base + urllib.parse.unquote(href.partition("#")[0]))
+            )
+            for href in Index.parse(html.decode()).hrefs.values()
+        }
+
+    # Any error aborts, so a blob is never deleted because a page wasn't read.
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        referenced = set().union(*executor.map(read_links, pages))
+
+    cutoff = dt.datetime.now(dt.timezone.utc) - grace_period
+    candidates = [
+        key
+        for key, modified in blobs.items()
+        if posixpath.dirname(key) not in referenced and modified < cutoff
+    ]
+
+    def still_unused(key: str) -> bool:
+        # Uploads touch the blobs they reuse before linking them, which the
+        # listing from before reading the index pages doesn't show.
+        try:
+            response = client.head_object(Bucket=cfg.s3.bucket, Key=key)
+        except botocore.exceptions.ClientError:
+            return False
+        return response["LastModified"] < cutoff
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        checked = executor.map(still_unused, candidates)
+        garbage = sorted(key for key, ok in zip(candidates, checked) if ok)
+    log.info(
+        "Found %d unused of %d blob files in %d index pages",
+        len(garbage),
+        len(blobs),
+        len(pages),
+    )
+
+    for i in range(0, len(garbage), 1000):
+        batch = garbage[i : i + 1000]
+        for key in batch:
+            log.info("%s %s", "Would delete" if dry_run else "Deleting", key)
+        if not dry_run:
+            client.delete_objects(
+                Bucket=cfg.s3.bucket,
+                Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+            )
+    return garbage
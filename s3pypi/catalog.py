@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterable, Optional, Tuple
+
+from s3pypi.exceptions import S3PyPiError
+from s3pypi.index import Index, parse_distribution_id
+
+VersionKey = Tuple[Tuple[int, ...], ...]
+
+_version_re = re.compile(
+    r"""
+    ^v?(?:(?P<epoch>\d+)!)?
+    (?P<release>\d+(?:\.\d+)*)
+    (?:[-_.]?(?P<pre>a|b|c|rc|alpha|beta|pre|preview)[-_.]?(?P<pre_n>\d*))?
+    (?:-(?P<post_n1>\d+)|[-_.]?(?:post|rev|r)[-_.]?(?P<post_n2>\d*))?
+    (?:[-_.]?dev[-_.]?(?P<dev_n>\d*))?
+    (?:\+[a-z0-9.]+)?$
+    """,
+    re.IGNORECASE | re.VERBOSE,
+)
+_pre_ranks = {"a": 0, "alpha": 0, "b": 1, "beta": 1}
+
+
+def version_key(version: str) -> VersionKey:
+    """Sort key that orders PEP 440 versions; invalid versions sort first."""
+    m = _version_re.match(version.strip())
+    if not m:
+        return ((-1,),)
+
+    release = [int(n) for n in m["release"].split(".")]
+    while len(release) > 1 and release[-1] == 0:
+        release.pop()
+
+    post = m["post_n1"] or m["post_n2"]
+    is_post = post is not None
+    is_dev = m["dev_n"] is not None
+
+    if m["pre"]:
+        pre: Tuple[int, ...] = (
+            0,
+            _pre_ranks.get(m["pre"].lower(), 2),
+            int(m["pre_n"] or 0),
+        )
+    elif is_dev and not is_post:
+        pre = (-1,)  # 1.0.dev0 < 1.0a0
+    else:
+        pre = (1,)
+
+    return (
+        (int(m["epoch"] or 0),),
+        tuple(release),
+        pre,
+        (int(post or 0),) if is_post else (-1,),
+        (0, int(m["dev_n"] or 0)) if is_dev else (1,),
+    )
+
+
+def is_prerelease(version: str) -> bool:
+    key = version_key(version)
+    return len(key) == 1 or key[2] != (1,) or key[4] != (1,)
+
+
+def latest_version(filenames: Iterable[str]) -> Optional[str]:
+    """Return the latest final release, or the latest pre-release if none."""
+    versions = set()
+    for filename in filenames:
+        try:
+            versions.add(parse_distribution_id(filename).version)
+        except (S3PyPiError, ValueError):
+            continue
+
+    releases = [v for v in versions if not is_prerelease(v)]
+    if not (candidates := releases or list(versions)):
+        return None
+    return max(candidates, key=version_key)
+
+
+@dataclass
+class Project:
+    files: int = 0
+    latest_version: Optional[str] = None
+    etag: Optional[str] = None
+
+    @classmethod
+    def of(cls, index: Index, etag: Optional[str] = None) -> Project:
+        return cls(
+            files=len(index.filenames),
+            latest_version=latest_version(index.filenames),
+            etag=etag,
+        )
+
+
+@dataclass
+class Catalog:
+    """All projects in a repository, stored as a single object.
+
+    This lets the root index and bulk commands avoid listing the bucket.
+    """
+
+    projects: Dict[str, Project] = field(default_factory=dict)
+
+    format_version = 1
+
+    @classmethod
+    def parse(cls, text: str) -> Catalog:
+        data = json.loads(text)
+        if data.get("version") != cls.format_version:
+            raise S3PyPiError(f"Unsupported catalog version: {data.get('version')}")
+        return cls(
+            {name: Project(**project) for name, project in data["projects"].items()}
+        )
+
+    def to_json(self) -> str:
+        projects = {name: asdict(p) for name, p in sorted(self.projects.items())}
+        return json.dumps(
+            {"version": self.format_version, "projects": projects},
+            indent=1,
+        )
+
+    def to_index(self) -> Index:
+        return Index(dict.fromkeys(f"{name}/" for name in self.projects))
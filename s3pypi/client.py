@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, List, Optional, Union
+
+from s3pypi import core, query
+from s3pypi.index import Index
+from s3pypi.journal import Change
+from s3pypi.storage import S3Config
+
+
+class S3PyPi:
+    """A client for one repository, for programs that make many calls.
+
+    The CLI sets up a new AWS session and probes for the locks table on every
+    invocation. A client does this once, and then reuses the session, its
+    connection pools and the locking setup for all calls. Index pages that were
+    read before are revalidated with their ETag instead of downloaded again.
+
+    Example::
+
+        client = S3PyPi.for_bucket("example-bucket", prefix="packages")
+        client.upload(["dist/example-0.1.0.tar.gz"], put_root_index=True)
+    """
+
+    def __init__(self, cfg: core.Config):
+        self.cfg = cfg
+        self.storage = core.build_storage(cfg, cache_indexes=True)
+
+    @classmethod
+    def for_bucket(cls, bucket: str, **kwargs: Any) -> S3PyPi:
+        """Create a client using `S3Config(bucket, **kwargs)`."""
+        return cls(core.Config(S3Config(bucket, **kwargs)))
+
+    def upload(
+        self,
+        dist: List[Union[Path, str]],
+        put_root_index: bool = False,
+        strict: bool = False,
+        force: bool = False,
+    ) -> None:
+        core.upload_packages(
+            self.cfg,
+            [Path(p) for p in dist],
+            put_root_index=put_root_index,
+            strict=strict,
+            force=force,
+            storage=self.storage,
+        )
+
+    def delete(self, name: str, version: str) -> None:
+        core.delete_package(self.cfg, name, version, storage=self.storage)
+
+    def promote(
+        self,
+        dest: S3PyPi,
+        name: str,
+        version: str,
+        put_root_index: bool = False,
+        force: bool = False,
+    ) -> None:
+        core.promote_package(
+            self.cfg,
+            dest.cfg,
+            name,
+            version,
+            put_root_index=put_root_index,
+            force=force,
+            src=self.storage,
+            dest=dest.storage,
+        )
+
+    def list_packages(self) -> List[str]:
+        """List the names of all packages."""
+        return query.list_projects(self.storage)
+
+    def get_index(self, name: str) -> Index:
+        """Return the index of a package, with the hash and metadata of its files."""
+        return self.storage.get_index(core.normalize_package_name(name))
+
+    def list_files(self, name: str, version: Optional[str] = None) -> List[str]:
+        return sorted(
+            filename
+            for filename in self.get_index(name).filenames
+            if version is None
+            or core.parse_distribution_id(filename).version == version
+        )
+
+    def changes_since(self, seq: int = 0) -> List[Change]:
+        """Return the changes recorded in the journal after sequence number `seq`."""
+        return self.storage.journal.changes_since(seq)
+
+    def update_root_index(self) -> None:
+        with self.storage:
+            core.update_root_index(self.storage)
@@ -0,0 +1,23 @@
+import gzip
+import zlib
+from typing import Iterable
+
+from s3pypi.exceptions import S3PyPiError
+
+ENCODINGS = ("gzip",)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        # A fixed mtime keeps the output (and thus the S3 ETag) deterministic.
+        return gzip.compress(data, mtime=0)
+    raise S3PyPiError(f"Unsupported content encoding: {encoding}")
+
+
+def decompress(chunks: Iterable[bytes], encoding: str) -> bytes:
+    if encoding == "gzip":
+        d = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+        return b"".join(d.decompress(chunk) for chunk in chunks) + d.flush()
+    if encoding in ("", "identity"):
+        return b"".join(chunks)
+    raise S3PyPiError(f"Unsupported content encoding: {encoding}")
@@ -1,19 +1,30 @@
 import logging
 import re
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import suppress
 from dataclasses import dataclass
 from itertools import groupby
 from operator import attrgetter
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional, Tuple, cast
 
 import boto3
 
 from s3pypi import __prog__
-from s3pypi.exceptions import S3PyPiError
-from s3pypi.index import Hash
-from s3pypi.locking import DynamoDBLocker
-from s3pypi.storage import S3Config, S3Storage
+from s3pypi.exceptions import PreconditionFailedError, S3PyPiError
+from s3pypi.index import (
+    DistributionId,
+    FileMetadata,
+    Hash,
+    Index,
+    parse_distribution_id,
+)
+from s3pypi.journal import Change
+from s3pypi.locking import DynamoDBLocker, LockInfo, LockStats
+from s3pypi.metadata import check_archive, file_metadata
+from s3pypi.progress import Progress
+from s3pypi.storage import FileStorage, S3Config, S3Storage, Storage
+from s3pypi.transaction import TransactionLog, TransactionState, UploadRecord
 
 log = logging.getLogger(__prog__)
 
@@ -21,17 +32,41 @@ log = logging.getLogger(__prog__)
 @dataclass
 class Config:
     s3: S3Config
+    local_dir: Optional[Path] = None
 
 
 @dataclass
-class DistributionId:
-    name: str
-    version: str
+class Distribution(DistributionId):
+    local_path: Path
 
 
 @dataclass
-class Distribution(DistributionId):
-    local_path: Path
+class StagedFile:
+    """A file stored by `put_distribution`, to be committed by `commit_uploads`."""
+
+    hash: Optional[Hash]
+    metadata: FileMetadata
+    location: str
+
+    def filenames(self, filename: str) -> List[str]:
+        """Return the stored files: the distribution, and its core metadata file."""
+        if self.metadata.core_metadata:
+            return [filename, f"{filename}.metadata"]
+        return [filename]
+
+
+def build_storage(cfg: Config, cache_indexes: bool = False) -> Storage:
+    storage: Storage
+    if cfg.local_dir:
+        if cfg.s3.blob_store:
+            raise S3PyPiError("Blob storage is only supported in S3 buckets")
+        storage = FileStorage(
+            cfg.local_dir / cfg.s3.prefix if cfg.s3.prefix else cfg.local_dir
+        )
+    else:
+        storage = S3Storage(cfg.s3, cache_indexes=cache_indexes)
+    storage.create_journal = cfg.s3.journal
+    return storage
 
 
 def normalize_package_name(name: str) -> str:
@@ -44,58 +79,227 @@ def upload_packages(
     put_root_index: bool = False,
     strict: bool = False,
     force: bool = False,
+    storage: Optional[Storage] = None,
+    progress: Optional[Progress] = None,
+    transaction_log: Optional[TransactionLog] = None,
 ) -> None:
-    storage = S3Storage(cfg.s3)
-    distributions = parse_distributions(dist)
+    txlog = transaction_log
+    try:
+        distributions = parse_distributions(dist)
+        prepared = prepare_distributions(distributions)
+    except S3PyPiError:
+        # Nothing was uploaded; keep only a log that an earlier run can resume from.
+        if txlog and not txlog.resume:
+            txlog.remove()
+        raise
+
+    state = txlog.state if txlog else TransactionState()
 
     get_name = attrgetter("name")
     existing_files = []
 
-    for name, group in groupby(sorted(distributions, key=get_name), get_name):
-        directory = normalize_package_name(name)
+    with storage or build_storage(cfg) as storage:
+        for name, group in groupby(sorted(distributions, key=get_name), get_name):
+            directory = normalize_package_name(name)
+            if directory in state.committed:
+                log.debug("%s was committed before", directory)
+                continue
+
+            # Phase 1: upload files to a staging area without holding the lock.
+            index = storage.get_index(directory)
+            uploads: Dict[str, StagedFile] = {}
+
+            try:
+                for distr in group:
+                    filename = distr.local_path.name
+                    sha256, metadata = prepared[distr.local_path]
+
+                    record = state.uploaded.get((directory, filename))
+                    if not force and filename in index.filenames:
+                        if record and index.filenames[filename] == sha256:
+                            continue  # Committed, but interrupted before logging it.
+                        existing_files.append(filename)
+                        msg = "%s already exists! (use --force to overwrite)"
+                        log.warning(msg, filename)
+                        continue
+
+                    location = uploaded_before(storage, record, filename, sha256)
+                    if location:
+                        log.info("Skipping %s (uploaded before)", distr.local_path)
+                        uploads[filename] = StagedFile(sha256, metadata, location)
+                        continue
 
-        with storage.locked_index(directory) as index:
-            for distr in group:
-                filename = distr.local_path.name
-
-                if not force and filename in index.filenames:
-                    existing_files.append(filename)
-                    msg = "%s already exists! (use --force to overwrite)"
-                    log.warning(msg, filename)
-                else:
                     log.info("Uploading %s", distr.local_path)
-                    storage.put_distribution(directory, distr.local_path)
-                    index.filenames[filename] = Hash.of("sha256", distr.local_path)
-
-    if put_root_index:
-        with storage.locked_index(storage.root) as root_index:
-            root_index.filenames = dict.fromkeys(storage.list_directories())
-
+                    location = put_distribution(
+                        storage, directory, distr.local_path, sha256, progress
+                    )
+                    uploads[filename] = StagedFile(sha256, metadata, location)
+                    if txlog:
+                        etag = storage.distribution_etag(location, filename)
+                        txlog.uploaded(directory, filename, sha256, etag, location)
+            except Exception:
+                # Don't leave the files of a package that won't be committed behind.
+                remove_staged(storage, uploads)
+                raise
+
+            # Phase 2: lock the index only to move files into place and update it.
+            if uploads:
+                existing_files += commit_uploads(storage, directory, uploads, force)
+            if txlog:
+                txlog.committed(directory)
+
+        if put_root_index:
+            update_root_index(storage)
+
+    if txlog:
+        txlog.remove()
     if strict and existing_files:
         raise S3PyPiError(f"Found {len(existing_files)} existing files on S3")
 
 
-def parse_distribution(path: Path) -> Distribution:
-    d = parse_distribution_id(path.name)
-    return Distribution(d.name, d.version, path)
+def uploaded_before(
+    storage: Storage, record: Optional[UploadRecord], filename: str, hash_: Hash
+) -> Optional[str]:
+    """Return where a file from the transaction log is staged, if it's unchanged."""
+    if not record or record.hash != hash_ or not record.location:
+        return None
+    etag = storage.distribution_etag(record.location, filename)
+    return record.location if etag and etag == record.etag else None
+
+
+def prepare_distributions(
+    distributions: List[Distribution],
+) -> Dict[Path, Tuple[Hash, FileMetadata]]:
+    """Check, hash and read the metadata of all files in parallel, before uploading.
+
+    Raises an error listing all files that aren't valid archives.
+    """
+
+    def prepare(path: Path) -> Tuple[Hash, FileMetadata]:
+        check_archive(path)
+        return Hash.of("sha256", path), file_metadata(path)
+
+    paths = [d.local_path for d in distributions]
+    prepared, errors = {}, []
+    with ThreadPoolExecutor() as executor:
+        futures = [executor.submit(prepare, path) for path in paths]
+        for path, future in zip(paths, futures):
+            try:
+                prepared[path] = future.result()
+            except S3PyPiError as e:
+                errors.append(str(e))
+
+    if errors:
+        raise S3PyPiError("\n".join(errors))
+    return prepared
+
+
+def put_distribution(
+    storage: Storage,
+    directory: str,
+    local_path: Path,
+    hash_: Hash,
+    progress: Optional[Progress] = None,
+) -> str:
+    """Store a file, and return the directory it was stored in.
+
+    Files are stored in a new staging directory, and only moved to their final
+    location by `commit_uploads`, so concurrent uploads of the same filename
+    can't overwrite a committed file. Blobs are content-addressed, so they are
+    stored in place, or skipped if an identical blob is already stored.
+    """
+    if storage.blob_store:
+        location = storage.file_directory(directory, hash_)
+        if storage.touch_distribution(location, local_path.name):
+            log.debug("%s is already stored in %s", local_path.name, location)
+            return location
+    else:
+        location = storage.stage_directory()
 
+    if not progress:
+        storage.put_distribution(location, local_path)
+    else:
+        with progress.track(local_path.name, local_path.stat().st_size) as callback:
+            storage.put_distribution(location, local_path, callback)
+    return location
 
-def parse_distribution_id(filename: str) -> DistributionId:
-    extensions = (".whl", ".tar.gz", ".tar.bz2", ".tar.xz", ".zip")
 
-    ext = next((ext for ext in extensions if filename.endswith(ext)), "")
-    if not ext:
-        raise S3PyPiError(f"Unknown file type: {filename}")
+def commit_uploads(
+    storage: Storage,
+    directory: str,
+    uploads: Dict[str, StagedFile],
+    force: bool = False,
+) -> List[str]:
+    """Move staged files into place and add them to an index.
+
+    Staged files are moved before the index is locked, without overwriting
+    existing files, so the lock is only held to update the index. Files that
+    exist already are overwritten while the index is locked, if they are not
+    listed in it (after an interrupted commit) or `force` is set.
+
+    Returns the files that were committed concurrently by someone else. Their
+    staged copies, and those of all files if this fails, are removed again.
+    """
+    conflicts = []
+    staged = {f for f, upload in uploads.items() if storage.is_staged(upload.location)}
+    try:
+        for filename in sorted(staged):
+            upload = uploads[filename]
+            with suppress(PreconditionFailedError):
+                storage.move_distribution(
+                    upload.location, directory, filename, replace=False
+                )
+                for name in upload.filenames(filename)[1:]:
+                    storage.move_distribution(upload.location, directory, name)
+                staged.remove(filename)
 
-    stem = filename[: -len(ext)]
+        with storage.locked_index(directory) as index:
+            for filename, upload in uploads.items():
+                listed = index.filenames.get(filename, upload.hash)
+                if not force and listed != upload.hash:
+                    conflicts.append(filename)
+                    log.warning("%s was uploaded concurrently!", filename)
+                    continue
+                if filename in staged and (force or filename not in index.filenames):
+                    for name in upload.filenames(filename):
+                        storage.move_distribution(upload.location, directory, name)
+                    staged.remove(filename)
+                index.filenames[filename] = upload.hash
+                index.metadata[filename] = upload.metadata
+                storage.link(index, filename)
+    finally:
+        # Blobs may be shared with other indexes; unused ones are garbage collected.
+        remove_staged(storage, {f: uploads[f] for f in staged})
+    return conflicts
+
+
+def remove_staged(storage: Storage, uploads: Dict[str, StagedFile]) -> None:
+    """Remove the staged copies of files that won't be committed."""
+    for filename, upload in uploads.items():
+        if storage.is_staged(upload.location):
+            log.debug("Removing staged file %s", filename)
+            for name in upload.filenames(filename):
+                with suppress(Exception):
+                    storage.delete(upload.location, name)
+
+
+def update_root_index(storage: Storage) -> None:
+    catalog = storage.get_catalog() or storage.build_catalog()
+    with storage.locked_index(storage.root) as root_index:
+        root_index.filenames = catalog.to_index().filenames
+
+
+def repair_catalog(cfg: Config, put_root_index: bool = False) -> None:
+    with build_storage(cfg) as storage:
+        catalog = storage.reconcile_catalog()
+        log.info("The catalog lists %d packages", len(catalog.projects))
+        if put_root_index:
+            update_root_index(storage)
 
-    if ext == ".whl":
-        name, version = stem.split("-", 2)[:2]
-    else:
-        name, version = stem.rsplit("-", 1)
-        name = name.replace("-", "_")
 
-    return DistributionId(name, version)
+def parse_distribution(path: Path) -> Distribution:
+    d = parse_distribution_id(path.name)
+    return Distribution(d.name, d.version, path)
 
 
 def parse_distributions(paths: List[Path]) -> List[Distribution]:
@@ -117,27 +321,140 @@ def parse_distributions(paths: List[Path]) -> List[Distribution]:
     return dists
 
 
-def delete_package(cfg: Config, name: str, version: str) -> None:
-    storage = S3Storage(cfg.s3)
+def delete_package(
+    cfg: Config, name: str, version: str, storage: Optional[Storage] = None
+) -> None:
+    directory = normalize_package_name(name)
+
+    with storage or build_storage(cfg) as storage:
+        with storage.locked_index(directory) as index:
+            filenames = [
+                filename
+                for filename in index.filenames
+                if parse_distribution_id(filename).version == version
+            ]
+            if not filenames:
+                raise S3PyPiError(f"Package not found: {name} {version}")
+
+            for filename in filenames:
+                log.info("Deleting %s", filename)
+                del index.filenames[filename]
+                metadata = index.metadata.pop(filename, None)
+                if index.hrefs.pop(filename, None):
+                    continue  # Blobs are removed by `collect_garbage`.
+                storage.delete(directory, filename)
+                if metadata and metadata.core_metadata:
+                    storage.delete(directory, f"{filename}.metadata")
+
+        if not index.filenames:
+            with storage.locked_index(storage.root) as root_index:
+                root_index.filenames.pop(directory, None)
+
+
+def promote_package(
+    cfg: Config,
+    dest_cfg: Config,
+    name: str,
+    version: str,
+    put_root_index: bool = False,
+    force: bool = False,
+    concurrency: int = 8,
+    src: Optional[Storage] = None,
+    dest: Optional[Storage] = None,
+) -> None:
+    src = src or build_storage(cfg)
+    dest = dest or build_storage(dest_cfg)
     directory = normalize_package_name(name)
 
-    with storage.locked_index(directory) as index:
-        filenames = [
-            filename
-            for filename in index.filenames
-            if parse_distribution_id(filename).version == version
-        ]
-        if not filenames:
-            raise S3PyPiError(f"Package not found: {name} {version}")
-
-        for filename in filenames:
-            log.info("Deleting %s", filename)
-            storage.delete(directory, filename)
-            del index.filenames[filename]
-
-    if not index.filenames:
-        with storage.locked_index(storage.root) as root_index:
-            root_index.filenames.pop(directory, None)
+    src_index = src.get_index(directory)
+    filenames = [
+        filename
+        for filename in src_index.filenames
+        if parse_distribution_id(filename).version == version
+    ]
+    if not filenames:
+        raise S3PyPiError(f"Package not found: {name} {version}")
+
+    existing = dest.get_index(directory).filenames
+    to_copy = []
+    for filename in filenames:
+        if filename not in existing or force:
+            to_copy.append(filename)
+        elif existing[filename] != src_index.filenames[filename]:
+            raise S3PyPiError(
+                f"{filename} already exists with a different hash! "
+                "(use --force to overwrite)"
+            )
+        else:
+            log.info("%s was promoted before", filename)
+
+    def stage(filename: str) -> Tuple[str, StagedFile]:
+        hash_ = src_index.filenames[filename]
+        location = dest.file_directory(directory, hash_)
+        if location == directory:
+            location = dest.stage_directory()
+        log.info("Copying %s", filename)
+        copy_distribution(src, src_index, dest, directory, filename, location)
+        metadata = src_index.metadata.get(filename) or FileMetadata()
+        return filename, StagedFile(hash_, metadata, location)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(stage, filename) for filename in to_copy]
+    try:
+        uploads = dict(future.result() for future in futures)
+    except Exception:
+        remove_staged(dest, dict(f.result() for f in futures if not f.exception()))
+        raise
+
+    if uploads and (conflicts := commit_uploads(dest, directory, uploads, force)):
+        raise S3PyPiError(
+            f"Found {len(conflicts)} files that were promoted concurrently"
+        )
+
+    if put_root_index:
+        update_root_index(dest)
+    dest.invalidate_cache()
+    dest.compact_journal()
+
+
+def copy_distribution(
+    src: Storage,
+    src_index: Index,
+    dest: Storage,
+    directory: str,
+    filename: str,
+    dest_directory: Optional[str] = None,
+) -> None:
+    """Copy a file listed in an index, and its core metadata file, to `dest`.
+
+    Files are copied to `dest_directory`, or else where `dest` stores new files.
+    Files that are stored as blobs are only copied if `dest` doesn't have them.
+    Between prefixes of the same bucket, this makes copying an index-only change.
+    """
+    src_directory = src.locate(directory, src_index, filename)
+    dest_directory = dest_directory or dest.file_directory(
+        directory, src_index.filenames[filename]
+    )
+
+    filenames = [filename]
+    if (metadata := src_index.metadata.get(filename)) and metadata.core_metadata:
+        filenames.append(f"{filename}.metadata")
+
+    for name in filenames:
+        if dest.blob_store and dest.touch_distribution(dest_directory, name):
+            log.debug("%s is already stored in %s", name, dest_directory)
+            continue
+        dest.copy_distribution(src, dest_directory, name, src_directory)
+
+
+def read_changes(cfg: Config, since: int = 0) -> List[Change]:
+    return build_storage(cfg).journal.changes_since(since)
+
+
+def list_locks(cfg: Config, table: str) -> Tuple[List[LockInfo], List[LockStats]]:
+    session = boto3.Session(profile_name=cfg.s3.profile, region_name=cfg.s3.region)
+    locker = cast(DynamoDBLocker, DynamoDBLocker.build(session, table))
+    return locker.list_locks(), locker.list_stats()
 
 
 def force_unlock(cfg: Config, table: str, lock_id: str) -> None:
@@ -1,2 +1,7 @@
 class S3PyPiError(Exception):
     pass
+
+
+class PreconditionFailedError(S3PyPiError):
+    def __init__(self, name: str):
+        super().__init__(f"{name} was changed concurrently")
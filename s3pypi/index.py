@@ -1,13 +1,17 @@
 from __future__ import annotations
 
+import datetime as dt
 import hashlib
 import re
 import urllib.parse
 from dataclasses import dataclass, field
+from html import escape, unescape
 from pathlib import Path
 from textwrap import indent
 from typing import Dict, Optional
 
+from s3pypi.exceptions import S3PyPiError
+
 
 @dataclass
 class Hash:
@@ -16,38 +20,127 @@ class Hash:
 
     @classmethod
     def of(cls, name: str, path: Path) -> Hash:
-        h = hashlib.new(name)
         with open(path, "rb") as file:
-            while True:
-                block = file.read(65536)
-                if not block:
-                    break
+            if hasattr(hashlib, "file_digest"):  # Python 3.11+
+                return cls(name, hashlib.file_digest(file, name).hexdigest())
+            h = hashlib.new(name)
+            while block := file.read(1024 * 1024):
                 h.update(block)
         return cls(name, h.hexdigest())
 
+    @classmethod
+    def of_bytes(cls, name: str, data: bytes) -> Hash:
+        return cls(name, hashlib.new(name, data).hexdigest())
+
+
+@dataclass
+class FileMetadata:
+    size: Optional[int] = None
+    upload_time: Optional[dt.datetime] = None
+    requires_python: Optional[str] = None
+    core_metadata: Optional[Hash] = None
+    """Hash of the `<filename>.metadata` file stored next to the file (PEP 658)."""
+
+    @classmethod
+    def parse(cls, attrs: Dict[str, str]) -> Optional[FileMetadata]:
+        size = attrs.get("data-size")
+        upload_time = attrs.get("data-upload-time")
+        core_metadata = attrs.get("data-core-metadata") or attrs.get(
+            "data-dist-info-metadata"
+        )
+        metadata = cls(
+            size=int(size) if size else None,
+            upload_time=dt.datetime.fromisoformat(upload_time) if upload_time else None,
+            requires_python=attrs.get("data-requires-python"),
+            core_metadata=(
+                Hash(*core_metadata.split("=", 1))
+                if core_metadata and "=" in core_metadata
+                else None
+            ),
+        )
+        return metadata if metadata != cls() else None
+
+    def to_attrs(self) -> Dict[str, str]:
+        attrs = {}
+        if self.requires_python:
+            attrs["data-requires-python"] = self.requires_python
+        if hash_ := self.core_metadata:
+            # PEP 714 renamed the attribute; older pip versions use the PEP 658 name.
+            attrs["data-core-metadata"] = f"{hash_.name}={hash_.value}"
+            attrs["data-dist-info-metadata"] = f"{hash_.name}={hash_.value}"
+        if self.size is not None:
+            attrs["data-size"] = str(self.size)
+        if self.upload_time:
+            attrs["data-upload-time"] = self.upload_time.isoformat()
+        return attrs
+
 
 @dataclass
 class Index:
     filenames: Dict[str, Optional[Hash]] = field(default_factory=dict)
+    metadata: Dict[str, FileMetadata] = field(default_factory=dict)
+    hrefs: Dict[str, str] = field(default_factory=dict)
+    """Links to files stored outside the index's directory, e.g. as blobs."""
 
     @classmethod
     def parse(cls, html: str) -> Index:
-        matches = re.findall(r'<a href=".+?((\w+)=(\w+))?">(.+)</a>', html)
-        filenames = {
-            fname: Hash(hash_name, hash_value) if hash_name else None
-            for _, hash_name, hash_value, fname in matches
-        }
-        return cls(filenames)
+        index = cls()
+        for href, attrs, fname in re.findall(
+            r'<a href="([^"]*)"([^>]*)>(.+)</a>', html
+        ):
+            url, _, fragment = href.partition("#")
+            hash_ = re.search(r"^(\w+)=(\w+)$", fragment)
+            index.filenames[fname] = Hash(*hash_.groups()) if hash_ else None
+            if url.rstrip("/") != urllib.parse.quote(fname.rstrip("/")):
+                index.hrefs[fname] = url
+
+            metadata = FileMetadata.parse(
+                {k: unescape(v) for k, v in re.findall(r'([\w-]+)="([^"]*)"', attrs)}
+            )
+            if metadata:
+                index.metadata[fname] = metadata
+        return index
 
     def to_html(self) -> str:
         links = "<br>\n".join(
-            f'<a href="{urllib.parse.quote(fname)}'
-            + (f"#{hash_.name}={hash_.value}" if hash_ else "")
-            + f'">{fname.rstrip("/")}</a>'
-            for fname, hash_ in sorted(self.filenames.items())
+            self._link(fname, hash_) for fname, hash_ in sorted(self.filenames.items())
         )
         return index_html.format(body=indent(links, " " * 4))
 
+    def _link(self, fname: str, hash_: Optional[Hash]) -> str:
+        href = self.hrefs.get(fname) or urllib.parse.quote(fname)
+        if hash_:
+            href += f"#{hash_.name}={hash_.value}"
+
+        metadata = self.metadata.get(fname, FileMetadata())
+        attrs = "".join(f' {k}="{escape(v)}"' for k, v in metadata.to_attrs().items())
+
+        return f'<a href="{href}"{attrs}>{fname.rstrip("/")}</a>'
+
+
+@dataclass
+class DistributionId:
+    name: str
+    version: str
+
+
+def parse_distribution_id(filename: str) -> DistributionId:
+    extensions = (".whl", ".tar.gz", ".tar.bz2", ".tar.xz", ".zip")
+
+    ext = next((ext for ext in extensions if filename.endswith(ext)), "")
+    if not ext:
+        raise S3PyPiError(f"Unknown file type: {filename}")
+
+    stem = filename[: -len(ext)]
+
+    if ext == ".whl":
+        name, version = stem.split("-", 2)[:2]
+    else:
+        name, version = stem.rsplit("-", 1)
+        name = name.replace("-", "_")
+
+    return DistributionId(name, version)
+
 
 index_html = """
 <!DOCTYPE html>
@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import datetime as dt
+import json
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+from s3pypi import __prog__
+from s3pypi.exceptions import PreconditionFailedError, S3PyPiError
+from s3pypi.index import Hash
+
+if TYPE_CHECKING:
+    from s3pypi.storage import Storage
+
+log = logging.getLogger(__prog__)
+
+
+@dataclass
+class Change:
+    seq: int
+    time: dt.datetime
+    project: str
+    added: Dict[str, Optional[Hash]] = field(default_factory=dict)
+    """Files that were added or replaced, with their new hash."""
+    removed: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> Change:
+        return cls(
+            seq=data["seq"],
+            time=dt.datetime.fromisoformat(data["time"]),
+            project=data["project"],
+            added={
+                f: Hash(*h.split("=", 1)) if h else None
+                for f, h in data["added"].items()
+            },
+            removed=data["removed"],
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "seq": self.seq,
+            "time": self.time.isoformat(),
+            "project": self.project,
+            "added": {
+                f: f"{h.name}={h.value}" if h else None for f, h in self.added.items()
+            },
+            "removed": self.removed,
+        }
+
+
+@dataclass
+class Head:
+    next: int = 1
+    """The next free sequence number. Records may exist beyond it."""
+    segments: List[Tuple[int, int]] = field(default_factory=list)
+
+    @property
+    def compacted(self) -> int:
+        """The last sequence number that was moved into a segment."""
+        return self.segments[-1][1] if self.segments else 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"next": self.next, "segments": self.segments}
+
+
+class Journal:
+    """An append-only log of index changes, stored next to the catalog.
+
+    Each change is written as a separate record. Records are created with a
+    conditional write, so concurrent writers can't claim the same sequence
+    number, and no lock is needed. `compact` moves every `segment_size` records
+    into a single segment object, so reading all changes since some sequence
+    number takes one request per segment plus one per record.
+    """
+
+    head_name = "journal/head.json"
+    max_probes = 1000
+
+    def __init__(self, storage: Storage, segment_size: int = 100):
+        self.storage = storage
+        self.segment_size = segment_size
+
+    def exists(self) -> bool:
+        return self._read_head()[0] is not None
+
+    def append(
+        self,
+        project: str,
+        added: Dict[str, Optional[Hash]],
+        removed: List[str],
+        create: bool = False,
+    ) -> Optional[int]:
+        """Record a change and return its sequence number.
+
+        Nothing is recorded if there is no journal, unless `create` is set.
+        """
+        head = self._read_head()[0]
+        if head is None:
+            if not create:
+                return None
+            head = Head()
+            with suppress(PreconditionFailedError):
+                self._put(self.head_name, head.to_dict(), if_none_match=True)
+
+        now = dt.datetime.now(dt.timezone.utc).replace(microsecond=0)
+        seq = head.next
+        for _ in range(self.max_probes):
+            change = Change(seq, now, project, added, removed)
+            try:
+                self._put(self._record_name(seq), change.to_dict(), if_none_match=True)
+            except PreconditionFailedError:
+                seq += 1  # Claimed by another writer.
+                continue
+
+            head = self._advance_head(seq + 1)
+            if seq > head.compacted:
+                return seq
+            # We read the head before these records were compacted and removed.
+            self.storage.delete_meta([self._record_name(seq)])
+            seq = head.next
+
+        raise S3PyPiError("Failed to find a free sequence number in the journal")
+
+    def changes_since(self, seq: int = 0) -> List[Change]:
+        """Return all changes with a sequence number above `seq`, in order."""
+        for _ in range(3):
+            head = self._read_head()[0] or Head()
+            changes = []
+            for first, last in head.segments:
+                if last > seq:
+                    changes += [
+                        c for c in self._read_segment(first, last) if c.seq > seq
+                    ]
+
+            n = max(seq, head.compacted) + 1
+            while (data := self._get(self._record_name(n))) is not None:
+                changes.append(Change.from_dict(data))
+                n += 1
+            if n >= head.next:
+                return changes
+            # Compacted since we read the head; try again.
+        raise S3PyPiError("The journal changed too often while reading it")
+
+    def compact(self, concurrency: int = 16) -> None:
+        """Move records into segments, while there are enough for a segment.
+
+        This is safe to run concurrently with appends and other compactions,
+        but takes a request per record, so it isn't done while appending.
+        """
+        while True:
+            head = self._read_head()[0]
+            if not head or head.next - 1 - head.compacted < self.segment_size:
+                return
+
+            first, last = head.compacted + 1, head.compacted + self.segment_size
+            names = [self._record_name(n) for n in range(first, last + 1)]
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                records = list(executor.map(self._get, names))
+            if None in records:
+                return  # Compacted concurrently.
+            self._put(self._segment_name(first, last), records)
+
+            def add_segment(head: Head) -> bool:
+                if head.compacted != first - 1:
+                    return False  # Compacted concurrently.
+                head.segments.append((first, last))
+                head.next = max(head.next, last + 1)
+                return True
+
+            if self._update_head(add_segment).compacted < last:
+                return
+            # Delete compacted records only once the head points to their segment.
+            self.storage.delete_meta(names)
+            log.debug("Compacted journal records %d-%d", first, last)
+
+    def _advance_head(self, seq: int) -> Head:
+        def advance(head: Head) -> bool:
+            if head.next >= seq:
+                return False
+            head.next = seq
+            return True
+
+        return self._update_head(advance)
+
+    def _update_head(self, update: Callable[[Head], bool]) -> Head:
+        """Apply `update` to the head with a conditional write, retrying on conflicts.
+
+        `update` returns whether it changed the head.
+        """
+        for attempt in range(self.storage.max_conditional_attempts):
+            head, etag = self._read_head()
+            if head is None or not update(head):
+                return head or Head()
+            try:
+                self._put(self.head_name, head.to_dict(), if_match=etag)
+                return head
+            except PreconditionFailedError:
+                time.sleep(random.uniform(0, 0.05 * 2**attempt))
+        raise S3PyPiError("The journal head changed too often while updating it")
+
+    def _read_head(self) -> Tuple[Optional[Head], Optional[str]]:
+        data, etag = self.storage.get_meta_with_etag(self.head_name)
+        if data is None:
+            return None, None
+        head = json.loads(data)
+        return Head(head["next"], [tuple(s) for s in head["segments"]]), etag
+
+    def _read_segment(self, first: int, last: int) -> List[Change]:
+        return [Change.from_dict(r) for r in self._get(self._segment_name(first, last))]
+
+    def _get(self, name: str) -> Any:
+        data = self.storage.get_meta(name)
+        return json.loads(data) if data is not None else None
+
+    def _put(self, name: str, data: Any, **conditions: Any) -> None:
+        self.storage.put_meta(
+            name, json.dumps(data, separators=(",", ":")).encode(), **conditions
+        )
+
+    @staticmethod
+    def _record_name(seq: int) -> str:
+        return f"journal/records/{seq:012d}.json"
+
+    @staticmethod
+    def _segment_name(first: int, last: int) -> str:
+        return f"journal/segments/{first:012d}-{last:012d}.json"
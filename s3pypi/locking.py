@@ -4,16 +4,22 @@ import getpass
 import hashlib
 import json
 import logging
+import os
 import socket
 import time
 from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import Iterator
+from decimal import Decimal
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional
 
 import boto3
-from mypy_boto3_dynamodb.service_resource import Table
 
 from s3pypi import __prog__, exceptions as exc
+from s3pypi.ratelimit import RateLimiter
+
+if TYPE_CHECKING:
+    from mypy_boto3_dynamodb.service_resource import Table
 
 log = logging.getLogger(__prog__)
 
@@ -22,32 +28,77 @@ class Locker(abc.ABC):
     @contextmanager
     def __call__(self, key: str) -> Iterator[None]:
         lock_id = hashlib.sha1(key.encode()).hexdigest()
-        self._lock(lock_id)
+        start = time.monotonic()
+        try:
+            self._lock(lock_id, key)
+        except exc.S3PyPiError:
+            self._record(lock_id, key, wait=time.monotonic() - start, hold=None)
+            raise
+
+        acquired = time.monotonic()
         try:
             yield
         finally:
             self._unlock(lock_id)
+            hold = time.monotonic() - acquired
+            self._record(lock_id, key, wait=acquired - start, hold=hold)
 
     @abc.abstractmethod
-    def _lock(self, lock_id: str) -> None:
+    def _lock(self, lock_id: str, key: Optional[str] = None) -> None:
         ...
 
     @abc.abstractmethod
     def _unlock(self, lock_id: str) -> None:
         ...
 
+    def _record(
+        self, lock_id: str, key: str, wait: float, hold: Optional[float]
+    ) -> None:
+        """Record how long a lock was waited for and held (`None` on timeout)."""
+        log.debug(
+            "Lock %s (%s): waited %.3fs, %s",
+            key,
+            lock_id,
+            wait,
+            "timed out" if hold is None else f"held {hold:.3f}s",
+        )
+
 
 class DummyLocker(Locker):
-    def _lock(self, lock_id: str) -> None:
+    def _lock(self, lock_id: str, key: Optional[str] = None) -> None:
         pass
 
     _unlock = _lock
 
+    def _record(
+        self, lock_id: str, key: str, wait: float, hold: Optional[float]
+    ) -> None:
+        pass
+
 
 @dataclass
 class LockerConfig:
     retry_delay: int = 1
     max_attempts: int = 10
+    record_stats: bool = False
+
+
+@dataclass
+class LockInfo:
+    lock_id: str
+    key: Optional[str]
+    owner: str
+    acquired_at: dt.datetime
+
+
+@dataclass
+class LockStats:
+    lock_id: str
+    key: str
+    acquisitions: int = 0
+    timeouts: int = 0
+    wait_seconds: float = 0
+    hold_seconds: float = 0
 
 
 class DynamoDBLocker(Locker):
@@ -57,8 +108,11 @@ class DynamoDBLocker(Locker):
         table_name: str,
         discover: bool = False,
         cfg: LockerConfig = LockerConfig(),
+        limiter: Optional[RateLimiter] = None,
     ) -> Locker:
         db = session.resource("dynamodb")
+        if limiter:
+            limiter.attach(db.meta.client)
         table = db.Table(table_name)
 
         if discover:
@@ -71,22 +125,27 @@ class DynamoDBLocker(Locker):
         owner = f"{getpass.getuser()}@{socket.gethostname()}"
         return DynamoDBLocker(table, owner, cfg)
 
-    def __init__(self, table: Table, owner: str, cfg: LockerConfig):
+    def __init__(self, table: "Table", owner: str, cfg: LockerConfig):
         self.table = table
         self.exc = self.table.meta.client.exceptions
         self.owner = owner
         self.cfg = cfg
 
-    def _lock(self, lock_id: str) -> None:
+    stats_prefix = "stats#"
+
+    def _lock(self, lock_id: str, key: Optional[str] = None) -> None:
         for attempt in range(1, self.cfg.max_attempts + 1):
             now = dt.datetime.now(dt.timezone.utc)
+            attrs = {
+                "LockID": lock_id,
+                "AcquiredAt": now.isoformat(),
+                "Owner": self.owner,
+            }
+            if key:
+                attrs["Key"] = key
             try:
                 self.table.put_item(
-                    Item={
-                        "LockID": lock_id,
-                        "AcquiredAt": now.isoformat(),
-                        "Owner": self.owner,
-                    },
+                    Item=attrs,
                     ConditionExpression="attribute_not_exists(LockID)",
                 )
                 return
@@ -102,6 +161,112 @@ class DynamoDBLocker(Locker):
     def _unlock(self, lock_id: str) -> None:
         self.table.delete_item(Key={"LockID": lock_id})
 
+    def _record(
+        self, lock_id: str, key: str, wait: float, hold: Optional[float]
+    ) -> None:
+        super()._record(lock_id, key, wait, hold)
+        if not self.cfg.record_stats:
+            return
+
+        counter = "Timeouts" if hold is None else "Acquisitions"
+        try:
+            self.table.update_item(
+                Key={"LockID": self.stats_prefix + lock_id},
+                UpdateExpression=(
+                    f"SET #key = :key ADD {counter} :one, "
+                    "WaitSeconds :wait, HoldSeconds :hold"
+                ),
+                ExpressionAttributeNames={"#key": "Key"},
+                ExpressionAttributeValues={
+                    ":key": key,
+                    ":one": 1,
+                    ":wait": Decimal(f"{wait:.3f}"),
+                    ":hold": Decimal(f"{hold or 0:.3f}"),
+                },
+            )
+        except self.exc.ClientError as e:
+            log.warning("Failed to record lock statistics: %s", e)
+
+    def list_locks(self) -> List[LockInfo]:
+        return [
+            LockInfo(
+                lock_id=str(item["LockID"]),
+                key=str(item["Key"]) if "Key" in item else None,
+                owner=str(item.get("Owner", "")),
+                acquired_at=dt.datetime.fromisoformat(str(item["AcquiredAt"])),
+            )
+            for item in self._scan()
+            if not str(item["LockID"]).startswith(self.stats_prefix)
+        ]
+
+    def list_stats(self) -> List[LockStats]:
+        return [
+            LockStats(
+                lock_id=str(item["LockID"])[len(self.stats_prefix) :],
+                key=str(item.get("Key", "")),
+                acquisitions=int(item.get("Acquisitions", 0)),
+                timeouts=int(item.get("Timeouts", 0)),
+                wait_seconds=float(item.get("WaitSeconds", 0)),
+                hold_seconds=float(item.get("HoldSeconds", 0)),
+            )
+            for item in self._scan()
+            if str(item["LockID"]).startswith(self.stats_prefix)
+        ]
+
+    def _scan(self) -> Iterator[Dict[str, Any]]:
+        kwargs: Dict[str, Any] = {}
+        while True:
+            response = self.table.scan(**kwargs)
+            yield from response["Items"]
+            if not (last_key := response.get("LastEvaluatedKey")):
+                return
+            kwargs["ExclusiveStartKey"] = last_key
+
+
+class FileLocker(Locker):
+    """Lock keys using `fcntl.flock` on lock files in a shared directory."""
+
+    def __init__(self, directory: Path, cfg: LockerConfig = LockerConfig()):
+        self.directory = directory
+        self.cfg = cfg
+        self._fds: Dict[str, int] = {}
+
+    def _lock(self, lock_id: str, key: Optional[str] = None) -> None:
+        import fcntl
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / lock_id
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+        for attempt in range(1, self.cfg.max_attempts + 1):
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self._fds[lock_id] = fd
+                return
+            except BlockingIOError:
+                if attempt == 1:
+                    log.info("Waiting to acquire lock... (%s)", lock_id)
+                if attempt < self.cfg.max_attempts:
+                    time.sleep(self.cfg.retry_delay)
+
+        os.close(fd)
+        raise FileLockTimeoutError(path)
+
+    def _unlock(self, lock_id: str) -> None:
+        import fcntl
+
+        fd = self._fds.pop(lock_id)
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+class FileLockTimeoutError(exc.S3PyPiError):
+    def __init__(self, path: Path):
+        super().__init__(
+            f"Timed out trying to acquire lock: {path}\n"
+            "Another instance of s3pypi may currently be holding the lock."
+        )
+
 
 class DynamoDBLockTimeoutError(exc.S3PyPiError):
     def __init__(self, table: str, item: dict):
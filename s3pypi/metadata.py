@@ -0,0 +1,136 @@
+import datetime as dt
+import io
+import logging
+import tarfile
+import zipfile
+import zlib
+from email.message import Message
+from email.parser import BytesHeaderParser
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from s3pypi import __prog__
+from s3pypi.exceptions import S3PyPiError
+from s3pypi.index import FileMetadata
+
+log = logging.getLogger(__prog__)
+
+
+def file_metadata(path: Path) -> FileMetadata:
+    core_metadata = read_core_metadata(path)
+    return FileMetadata(
+        size=path.stat().st_size,
+        upload_time=dt.datetime.now(dt.timezone.utc).replace(microsecond=0),
+        requires_python=(
+            parse_core_metadata(core_metadata).get("Requires-Python")
+            if core_metadata
+            else None
+        ),
+    )
+
+
+def read_core_metadata(path: Path) -> Optional[bytes]:
+    """Read the METADATA (wheel) or PKG-INFO (sdist) file of a distribution."""
+    try:
+        if path.name.endswith((".whl", ".zip")):
+            with zipfile.ZipFile(path) as zf:
+                name = _find_metadata_name(path.name, zf.namelist())
+                return zf.read(name) if name else None
+
+        with tarfile.open(path) as tf:
+            for member in tf:
+                if _is_metadata_name(path.name, member.name) and member.isfile():
+                    f = tf.extractfile(member)
+                    return f.read() if f else None
+    except (OSError, EOFError, zlib.error, zipfile.BadZipFile, tarfile.TarError) as e:
+        log.debug("Could not read metadata from %s: %s", path, e)
+    return None
+
+
+def check_archive(path: Path) -> None:
+    """Check that a distribution is a readable zip or tar archive."""
+    try:
+        if path.name.endswith((".whl", ".zip")):
+            with zipfile.ZipFile(path) as zf:
+                if bad := zf.testzip():
+                    raise S3PyPiError(f"Corrupt file {bad} in {path.name}")
+                if not zf.namelist():
+                    raise S3PyPiError(f"Empty archive: {path.name}")
+            return
+
+        with tarfile.open(path) as tf:
+            if not tf.getmembers():
+                raise S3PyPiError(f"Empty archive: {path.name}")
+            # Read up to the end, to verify the checksum of compressed streams.
+            while tf.fileobj and tf.fileobj.read(1024 * 1024):
+                pass
+    except (OSError, EOFError, zlib.error, zipfile.BadZipFile, tarfile.TarError) as e:
+        raise S3PyPiError(f"Invalid archive {path.name}: {e}") from e
+
+
+class RangeReader(io.RawIOBase):
+    """A seekable file that reads ranges on demand, e.g. from S3.
+
+    Wrap it in a `io.BufferedReader` to merge small reads into fewer requests.
+    """
+
+    def __init__(self, read_range: Callable[[int, int], bytes], size: int):
+        self._read_range = read_range
+        self._size = size
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self._size}
+        self._pos = max(0, base[whence] + offset)
+        return self._pos
+
+    def readinto(self, buffer: memoryview) -> int:  # type: ignore[override]
+        length = min(len(buffer), self._size - self._pos)
+        if length <= 0:
+            return 0
+        data = self._read_range(self._pos, length)
+        buffer[: len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+
+def read_wheel_metadata(
+    filename: str,
+    read_range: Callable[[int, int], bytes],
+    size: int,
+    buffer_size: int = 64 * 1024,
+) -> Optional[bytes]:
+    """Read the METADATA file of a remote wheel with a few ranged reads.
+
+    Only the zip central directory and the METADATA entry are read.
+    """
+    raw = RangeReader(read_range, size)
+    with zipfile.ZipFile(io.BufferedReader(raw, buffer_size)) as zf:
+        name = _find_metadata_name(filename, zf.namelist())
+        return zf.read(name) if name else None
+
+
+def parse_core_metadata(data: bytes) -> Message:
+    return BytesHeaderParser().parsebytes(data)
+
+
+def _find_metadata_name(filename: str, names: List[str]) -> Optional[str]:
+    return next((n for n in names if _is_metadata_name(filename, n)), None)
+
+
+def _is_metadata_name(filename: str, name: str) -> bool:
+    parts = name.split("/")
+    if len(parts) != 2:
+        return False
+    if filename.endswith(".whl"):
+        return parts[0].endswith(".dist-info") and parts[1] == "METADATA"
+    return parts[1] == "PKG-INFO"
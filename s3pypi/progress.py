@@ -0,0 +1,154 @@
+import logging
+import shutil
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, Optional, TextIO
+
+from s3pypi import __prog__
+
+log = logging.getLogger(__prog__)
+
+
+@dataclass
+class Transfer:
+    total: int
+    done: int = 0
+    started: float = field(default_factory=time.monotonic)
+    reported: bool = False
+
+    @property
+    def rate(self) -> float:
+        return self.done / max(time.monotonic() - self.started, 1e-3)
+
+    @property
+    def eta(self) -> Optional[float]:
+        rate = self.rate
+        return (self.total - self.done) / rate if rate else None
+
+
+class Progress:
+    """Report bytes done, rate and ETA of transfers that may run in parallel.
+
+    On a terminal, a progress bar is redrawn in place: for a single file, or
+    for all active files together. Otherwise, e.g. in CI, a `key=value` log
+    line is written per file every `interval` seconds, so short transfers
+    don't produce any output.
+    """
+
+    def __init__(
+        self,
+        stream: Optional[TextIO] = None,
+        tty: Optional[bool] = None,
+        interval: Optional[float] = None,
+    ):
+        self.stream = stream or sys.stderr
+        self.tty = self.stream.isatty() if tty is None else tty
+        self.interval = interval if interval is not None else 0.2 if self.tty else 30
+        self._transfers: Dict[str, Transfer] = {}
+        self._lock = threading.Lock()
+        self._last_report = time.monotonic()
+        self._drawn = False
+
+    @contextmanager
+    def track(self, name: str, total: int) -> Iterator[Callable[[int], None]]:
+        """Yield a callback that is called with the number of bytes transferred."""
+        transfer = Transfer(total)
+        with self._lock:
+            self._transfers[name] = transfer
+
+        def update(n: int) -> None:
+            with self._lock:
+                # Retried requests report negative amounts to roll back.
+                transfer.done = min(max(transfer.done + n, 0), transfer.total)
+                now = time.monotonic()
+                if now - self._last_report >= self.interval:
+                    self._last_report = now
+                    self._report()
+
+        try:
+            yield update
+        finally:
+            with self._lock:
+                del self._transfers[name]
+                if self.tty:
+                    self._clear()
+                elif transfer.reported:
+                    elapsed = time.monotonic() - transfer.started
+                    log.info(
+                        "transfer=done file=%s bytes=%d seconds=%.1f rate=%s/s",
+                        name,
+                        transfer.done,
+                        elapsed,
+                        format_size(transfer.rate),
+                    )
+
+    def _report(self) -> None:
+        if self.tty:
+            self._draw()
+            return
+
+        for name, t in self._transfers.items():
+            t.reported = True
+            log.info(
+                "transfer=progress file=%s bytes=%d total=%d percent=%.1f "
+                "rate=%s/s eta=%s",
+                name,
+                t.done,
+                t.total,
+                100 * t.done / max(t.total, 1),
+                format_size(t.rate),
+                format_duration(t.eta),
+            )
+
+    def _draw(self) -> None:
+        if not self._transfers:
+            return
+        if len(self._transfers) == 1:
+            [(label, t)] = self._transfers.items()
+        else:
+            label = f"{len(self._transfers)} files"
+            t = Transfer(
+                total=sum(t.total for t in self._transfers.values()),
+                done=sum(t.done for t in self._transfers.values()),
+                started=min(t.started for t in self._transfers.values()),
+            )
+
+        fraction = t.done / max(t.total, 1)
+        stats = (
+            f" {fraction:4.0%} {format_size(t.done)}/{format_size(t.total)} "
+            f"{format_size(t.rate)}/s ETA {format_duration(t.eta)}"
+        )
+        width = shutil.get_terminal_size().columns - 1
+        bar_width = max(width - len(label) - len(stats) - 3, 10)
+        filled = int(bar_width * fraction)
+        line = f"{label} [{'#' * filled}{'.' * (bar_width - filled)}]{stats}"
+        self.stream.write(f"\r{line[:width]:<{width}}")
+        self.stream.flush()
+        self._drawn = True
+
+    def _clear(self) -> None:
+        if self._drawn:
+            width = shutil.get_terminal_size().columns - 1
+            self.stream.write(f"\r{' ' * width}\r")
+            self.stream.flush()
+            self._drawn = False
+        self._draw()
+
+
+def format_size(n: float) -> str:
+    for unit in ["B", "KiB", "MiB", "GiB"]:
+        if n < 1024 or unit == "GiB":
+            break
+        n /= 1024
+    return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "?"
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02}:{secs:02}" if hours else f"{minutes}:{secs:02}"
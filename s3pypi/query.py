@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from s3pypi.catalog import Project, version_key
+from s3pypi.exceptions import S3PyPiError
+from s3pypi.index import Index, parse_distribution_id
+from s3pypi.storage import Storage
+
+
+def list_projects(storage: Storage) -> List[str]:
+    """List the directories of all projects, preferring the catalog or root index."""
+    if catalog := storage.get_catalog():
+        return sorted(catalog.projects)
+    root_index = storage.get_index(storage.root)
+    if root_index.filenames:
+        return sorted(name.rstrip("/") for name in root_index.filenames)
+    return sorted(d.rstrip("/") for d in storage.list_directories())
+
+
+def summarize_projects(storage: Storage, concurrency: int = 16) -> Dict[str, Project]:
+    """Return the file count and latest version of every project.
+
+    These are read from the catalog if there is one. Otherwise all project
+    indexes are fetched, `concurrency` at a time.
+    """
+    if catalog := storage.get_catalog():
+        return dict(sorted(catalog.projects.items()))
+
+    def summarize(directory: str) -> Project:
+        return Project.of(*storage.get_index_with_etag(directory))
+
+    names = list_projects(storage)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return dict(zip(names, executor.map(summarize, names)))
+
+
+def get_indexes(
+    storage: Storage, directories: List[str], concurrency: int = 16
+) -> Dict[str, Index]:
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return dict(zip(directories, executor.map(storage.get_index, directories)))
+
+
+def describe_project(index: Index) -> Dict[str, List[Dict[str, Any]]]:
+    """Group the files of a project by version, from oldest to newest."""
+    versions: Dict[str, List[Dict[str, Any]]] = {}
+    for filename, hash_ in sorted(index.filenames.items()):
+        try:
+            version = parse_distribution_id(filename).version
+        except (S3PyPiError, ValueError):
+            version = ""
+
+        file: Dict[str, Optional[Any]] = {
+            "filename": filename,
+            "hash": f"{hash_.name}={hash_.value}" if hash_ else None,
+        }
+        if metadata := index.metadata.get(filename):
+            file.update(
+                size=metadata.size,
+                upload_time=(
+                    metadata.upload_time.isoformat() if metadata.upload_time else None
+                ),
+                requires_python=metadata.requires_python,
+            )
+        versions.setdefault(version, []).append(file)
+
+    return {v: versions[v] for v in sorted(versions, key=version_key)}
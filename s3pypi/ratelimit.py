@@ -0,0 +1,133 @@
+import threading
+import time
+from typing import Any, Mapping, Optional, Tuple, Union
+
+from s3pypi.exceptions import S3PyPiError
+
+
+class TokenBucket:
+    """Thread-safe token bucket, e.g. to cap bandwidth in bytes per second.
+
+    Acquiring more tokens than are available puts the bucket in debt, so that
+    large requests are delayed proportionally instead of starving.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1) -> None:
+        with self._lock:
+            now = time.monotonic()
+            elapsed, self.updated = now - self.updated, now
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.tokens -= tokens
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+
+        if delay:
+            time.sleep(delay)
+
+
+class AdaptiveTokenBucket(TokenBucket):
+    """Token bucket whose rate adapts to throttling (AIMD).
+
+    Each throttled request halves the rate, down to `min_rate`. Each successful
+    request raises it by `increase`, up to `max_rate`, so the rate converges
+    just below what the server sustains and retries don't pile up.
+    """
+
+    def __init__(
+        self,
+        max_rate: float,
+        min_rate: float = 1,
+        increase: float = 1,
+        decrease: float = 0.5,
+    ):
+        super().__init__(max_rate)
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.increase = increase
+        self.decrease = decrease
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self) -> None:
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            # Drop the burst allowance, so waiting requests don't all go at once.
+            self.tokens = min(self.tokens, 0)
+
+
+class RateLimiter:
+    """Adaptive rate limits per class of AWS operations, shared by several clients.
+
+    Requests are delayed before they are sent, including retries. Responses
+    with a throttling error lower the rate of their class.
+    """
+
+    # Per-prefix S3 request rates, and the write capacity of a DynamoDB partition.
+    default_rates = {"read": 5500.0, "write": 3500.0, "lock": 1000.0}
+    read_operations = {"GetObject", "HeadObject", "ListObjects", "ListObjectsV2"}
+    throttling_codes = {
+        "SlowDown",
+        "Throttling",
+        "ThrottlingException",
+        "RequestLimitExceeded",
+        "ProvisionedThroughputExceededException",
+        "TooManyRequestsException",
+    }
+
+    def __init__(self, rates: Optional[Mapping[str, Union[str, float]]] = None):
+        self.buckets = {
+            name: AdaptiveTokenBucket(rate) for name, rate in self.default_rates.items()
+        }
+        for name, value in (rates or {}).items():
+            if name not in self.buckets:
+                raise S3PyPiError(
+                    f"Unknown rate limit: {name} (expected one of "
+                    f"{', '.join(self.buckets)})"
+                )
+            try:
+                rate = float(value)
+            except ValueError:
+                rate = 0
+            if rate <= 0:
+                raise S3PyPiError(f"Invalid rate limit: {name}={value}")
+            self.buckets[name] = AdaptiveTokenBucket(rate)
+
+    def operation_class(self, service: str, operation: str) -> str:
+        if service == "dynamodb":
+            return "lock"
+        return "read" if operation in self.read_operations else "write"
+
+    def attach(self, client: Any) -> None:
+        """Limit the requests of a botocore client."""
+        service = client.meta.service_model.service_name
+        events = client.meta.events
+        events.register(f"before-send.{service}", self._before_send)
+        events.register(f"needs-retry.{service}", self._after_attempt)
+
+    def _bucket(self, event_name: str) -> AdaptiveTokenBucket:
+        _, service, operation = event_name.split(".", 2)
+        return self.buckets[self.operation_class(service, operation)]
+
+    def _before_send(self, event_name: str, **kwargs: Any) -> None:
+        self._bucket(event_name).acquire()
+
+    def _after_attempt(
+        self, event_name: str, response: Optional[Tuple[Any, Any]] = None, **kwargs: Any
+    ) -> None:
+        if response is None:
+            return  # Connection error; handled by the retry logic.
+        http_response, parsed = response
+        code = parsed.get("Error", {}).get("Code")
+        bucket = self._bucket(event_name)
+        if code in self.throttling_codes or http_response.status_code == 503:
+            bucket.on_throttle()
+        else:
+            bucket.on_success()
@@ -0,0 +1,177 @@
+import json
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import boto3
+import botocore
+
+from s3pypi import __prog__
+from s3pypi.core import (
+    Config,
+    build_storage,
+    copy_distribution,
+    normalize_package_name,
+    update_root_index,
+)
+from s3pypi.exceptions import S3PyPiError
+from s3pypi.index import Index
+from s3pypi.query import list_projects
+from s3pypi.storage import Storage
+
+log = logging.getLogger(__prog__)
+
+
+@dataclass
+class ReplicateConfig:
+    concurrency: int = 8
+    delete: bool = False
+    put_root_index: bool = False
+
+
+def replicate(
+    cfg: Config,
+    dest_cfg: Config,
+    projects: Optional[List[str]] = None,
+    rep: ReplicateConfig = ReplicateConfig(),
+) -> None:
+    """Copy new and changed files to another bucket, prefix or endpoint.
+
+    Projects whose source index has the same ETag as in the previous run are
+    skipped. The ETags are read from the indexes themselves, not the catalog,
+    whose updates are best-effort, and projects are found by listing the source. The other projects are compared by file hash, and only missing or
+    changed files are copied. Each destination index is written after all of
+    its files were copied, so it never lists files that aren't there yet.
+    """
+    src = build_storage(cfg)
+    state_name = "replication.json"
+
+    with build_storage(dest_cfg) as dest:
+        source_id = _location(cfg)
+        state = _read_state(dest, state_name, source_id)
+
+        if projects:
+            directories = [normalize_package_name(p) for p in projects]
+        else:
+            directories = sorted(d.rstrip("/") for d in src.list_directories())
+            if rep.delete:
+                directories += [d for d in list_projects(dest) if d not in directories]
+
+        failures = 0
+        replicated: Dict[str, Optional[str]] = {}
+
+        with ThreadPoolExecutor(max_workers=rep.concurrency) as executor:
+
+            def fetch(directory: str) -> Optional[Tuple[Index, Optional[str]]]:
+                index, etag = src.get_index_with_etag(directory)
+                if etag and state.get(directory) == etag:
+                    return None
+                return index, etag
+
+            pending: Dict[str, Tuple[Index, Optional[str], Dict[Future, str]]] = {}
+            for directory, fetched in zip(
+                directories, executor.map(fetch, directories)
+            ):
+                if fetched is None:
+                    log.debug("%s is up to date", directory)
+                    continue
+
+                src_index, etag = fetched
+                existing = dest.get_index(directory)
+                pending[directory] = (
+                    src_index,
+                    etag,
+                    {
+                        executor.submit(
+                            copy, src, src_index, dest, directory, filename
+                        ): filename
+                        for filename in files_to_copy(src_index, existing)
+                    },
+                )
+
+            for directory, (src_index, etag, futures) in pending.items():
+                project_failures = 0
+                for future, filename in futures.items():
+                    try:
+                        future.result()
+                    except (
+                        OSError,
+                        S3PyPiError,
+                        boto3.exceptions.S3UploadFailedError,
+                        botocore.exceptions.BotoCoreError,
+                        botocore.exceptions.ClientError,
+                    ) as e:
+                        log.error("Failed to copy %s/%s: %s", directory, filename, e)
+                        project_failures += 1
+
+                failures += project_failures
+                if not project_failures:
+                    commit(dest, directory, src_index, rep.delete)
+                    replicated[directory] = etag
+
+        if replicated:
+            with dest.lock(dest.meta_directory):
+                state = _read_state(dest, state_name, source_id)
+                state.update({d: e for d, e in replicated.items() if e})
+                data = {"source": source_id, "projects": state}
+                dest.put_meta(state_name, json.dumps(data).encode())
+        if rep.put_root_index:
+            update_root_index(dest)
+
+    log.info("Replicated %d of %d projects", len(replicated), len(directories))
+    if failures:
+        raise S3PyPiError(f"Failed to copy {failures} files")
+
+
+def files_to_copy(src_index: Index, dest_index: Index) -> List[str]:
+    """List the files that are missing or different."""
+    return [
+        filename
+        for filename, hash_ in src_index.filenames.items()
+        if filename not in dest_index.filenames
+        or dest_index.filenames[filename] != hash_
+    ]
+
+
+def copy(
+    src: Storage, src_index: Index, dest: Storage, directory: str, filename: str
+) -> None:
+    log.info("Copying %s/%s", directory, filename)
+    copy_distribution(src, src_index, dest, directory, filename)
+
+
+def commit(dest: Storage, directory: str, src_index: Index, delete: bool) -> None:
+    removed = []
+    with dest.locked_index(directory) as index:
+        if delete:
+            for filename in [
+                f for f in index.filenames if f not in src_index.filenames
+            ]:
+                del index.filenames[filename]
+                index.metadata.pop(filename, None)
+                if not index.hrefs.pop(filename, None):
+                    removed.append(filename)  # Blobs are garbage collected.
+
+        index.filenames.update(src_index.filenames)
+        index.metadata.update(src_index.metadata)
+        for filename in src_index.filenames:
+            dest.link(index, filename)
+
+    for filename in removed:
+        log.info("Removing %s/%s", directory, filename)
+        dest.delete(directory, filename)
+        dest.delete(directory, f"{filename}.metadata")
+
+
+def _location(cfg: Config) -> str:
+    if cfg.local_dir:
+        return str(cfg.local_dir / (cfg.s3.prefix or ""))
+    return "/".join(filter(None, [cfg.s3.endpoint_url, cfg.s3.bucket, cfg.s3.prefix]))
+
+
+def _read_state(dest: Storage, name: str, source_id: str) -> Dict[str, str]:
+    data = dest.get_meta(name)
+    state = json.loads(data) if data else {}
+    # Replicating from another source requires a full comparison.
+    return state["projects"] if state.get("source") == source_id else {}
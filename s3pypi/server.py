@@ -0,0 +1,343 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import logging
+import re
+import tempfile
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from s3pypi import __prog__
+from s3pypi.core import (
+    Config,
+    StagedFile,
+    build_storage,
+    commit_uploads,
+    normalize_package_name,
+    parse_distribution_id,
+    put_distribution,
+    remove_staged,
+    update_root_index,
+)
+from s3pypi.exceptions import S3PyPiError
+from s3pypi.index import Hash
+from s3pypi.metadata import file_metadata
+from s3pypi.storage import Storage
+
+log = logging.getLogger(__prog__)
+
+# https://packaging.python.org/en/latest/specifications/name-normalization/
+valid_name = re.compile(r"^([A-Z0-9]|[A-Z0-9][A-Z0-9._-]*[A-Z0-9])$", re.IGNORECASE)
+
+
+@dataclass
+class ServerConfig:
+    host: str = "127.0.0.1"
+    port: int = 8080
+    batch_window: float = 2.0
+    put_root_index: bool = False
+    force: bool = False
+    username: str = "__token__"
+    password: Optional[str] = None
+
+
+class IndexBatcher:
+    """Coalesce index updates for the same package into one locked transaction.
+
+    The first update for a package starts a timer; all updates submitted for
+    that package before it fires are committed together.
+    """
+
+    def __init__(
+        self, storage: Storage, window: float, put_root_index: bool, force: bool
+    ):
+        self.storage = storage
+        self.window = window
+        self.put_root_index = put_root_index
+        self.force = force
+        self._pending: Dict[str, List[Tuple[str, StagedFile, Future]]] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, directory: str, filename: str, upload: StagedFile) -> Future:
+        future: Future = Future()
+        with self._lock:
+            if directory not in self._pending:
+                self._pending[directory] = []
+                threading.Timer(self.window, self._commit, [directory]).start()
+            self._pending[directory].append((filename, upload, future))
+        return future
+
+    def _commit(self, directory: str) -> None:
+        with self._lock:
+            batch = self._pending.pop(directory)
+
+        log.info("Committing %d files to %s", len(batch), directory)
+        uploads: Dict[str, StagedFile] = {}
+        futures: Dict[str, List[Future]] = {}
+        for filename, upload, future in batch:
+            previous = uploads.get(filename)
+            if previous and previous.hash != upload.hash:
+                # The same file was uploaded twice in this batch, with different
+                # contents: the last one wins if forced, otherwise the first one.
+                if not self.force:
+                    self._discard(filename, upload)
+                    future.set_exception(_conflict())
+                    continue
+                self._discard(filename, previous)
+            uploads[filename] = upload
+            futures.setdefault(filename, []).append(future)
+
+        try:
+            is_new = not self.storage.get_index(directory).filenames
+            conflicts = commit_uploads(
+                self.storage, directory, uploads, force=self.force
+            )
+            if is_new and self.put_root_index:
+                update_root_index(self.storage)
+            self.storage.invalidate_cache()
+        except Exception as e:
+            for future in (f for fs in futures.values() for f in fs):
+                future.set_exception(e)
+        else:
+            for filename, fs in futures.items():
+                for future in fs:
+                    if filename in conflicts:
+                        future.set_exception(_conflict())
+                    else:
+                        future.set_result(None)
+            self.storage.compact_journal()
+
+    def _discard(self, filename: str, upload: StagedFile) -> None:
+        remove_staged(self.storage, {filename: upload})
+
+
+class UploadServer(ThreadingHTTPServer):
+    def __init__(self, storage: Storage, cfg: ServerConfig):
+        super().__init__((cfg.host, cfg.port), UploadHandler)
+        self.storage = storage
+        self.cfg = cfg
+        self.batcher = IndexBatcher(
+            storage, cfg.batch_window, cfg.put_root_index, cfg.force
+        )
+
+
+class UploadHandler(BaseHTTPRequestHandler):
+    """Implements the upload part of the legacy PyPI API, as used by twine."""
+
+    server: UploadServer
+    server_version = __prog__
+
+    def do_POST(self) -> None:
+        if not self._authorized():
+            # The request body is not read, so the connection can't be reused.
+            self.close_connection = True
+            self.send_response(HTTPStatus.UNAUTHORIZED)
+            self.send_header("WWW-Authenticate", f'Basic realm="{__prog__}"')
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        content_type = self.headers.get("Content-Type", "")
+        boundary = re.search(r'boundary="?([^";]+)"?', content_type)
+        if not content_type.startswith("multipart/form-data") or not boundary:
+            return self.send_error(HTTPStatus.BAD_REQUEST, "Expected multipart data")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            try:
+                reader = MultipartReader(
+                    self.rfile,
+                    int(self.headers.get("Content-Length", 0)),
+                    boundary.group(1).encode(),
+                )
+                fields, upload = reader.read(Path(tmp_dir))
+                self._upload(fields, upload)
+            except UploadError as e:
+                return self.send_error(e.status, str(e))
+            except Exception as e:
+                log.exception("Upload failed")
+                return self.send_error(HTTPStatus.INTERNAL_SERVER_ERROR, str(e))
+
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _authorized(self) -> bool:
+        cfg = self.server.cfg
+        if cfg.password is None:
+            return True
+
+        scheme, _, credentials = self.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() != "basic":
+            return False
+        try:
+            username, _, password = (
+                base64.b64decode(credentials, validate=True).decode().partition(":")
+            )
+        except (binascii.Error, UnicodeDecodeError):
+            return False
+
+        # Compare both, in constant time, to not leak which one was wrong.
+        return all(
+            [
+                hmac.compare_digest(username.encode(), cfg.username.encode()),
+                hmac.compare_digest(password.encode(), cfg.password.encode()),
+            ]
+        )
+
+    def _upload(self, fields: Dict[str, str], upload: Optional["Upload"]) -> None:
+        if fields.get(":action") != "file_upload":
+            raise UploadError(HTTPStatus.BAD_REQUEST, "Unsupported :action")
+        if not upload:
+            raise UploadError(HTTPStatus.BAD_REQUEST, "Missing file content")
+
+        expected = fields.get("sha256_digest")
+        if expected and expected != upload.sha256.value:
+            raise UploadError(HTTPStatus.BAD_REQUEST, "Digest mismatch")
+
+        try:
+            name = parse_distribution_id(upload.path.name).name
+        except (S3PyPiError, ValueError) as e:
+            raise UploadError(HTTPStatus.BAD_REQUEST, str(e))
+        if not valid_name.match(name):
+            raise UploadError(HTTPStatus.BAD_REQUEST, f"Invalid package name: {name}")
+
+        directory = normalize_package_name(name)
+        if "name" in fields and normalize_package_name(fields["name"]) != directory:
+            raise UploadError(
+                HTTPStatus.BAD_REQUEST, "Package name does not match the filename"
+            )
+
+        # Fail early; commit_uploads checks again, under the index lock.
+        storage = self.server.storage
+        if not self.server.cfg.force:
+            if upload.path.name in storage.get_index(directory).filenames:
+                raise _conflict()
+
+        log.info("Uploading %s", upload.path.name)
+        location = put_distribution(storage, directory, upload.path, upload.sha256)
+
+        metadata = file_metadata(upload.path)
+        metadata.requires_python = (
+            fields.get("requires_python") or metadata.requires_python
+        )
+        future = self.server.batcher.submit(
+            directory, upload.path.name, StagedFile(upload.sha256, metadata, location)
+        )
+        future.result()
+
+    def log_message(self, format: str, *args: object) -> None:
+        log.debug("%s - %s", self.address_string(), format % args)
+
+
+@dataclass
+class Upload:
+    path: Path
+    sha256: Hash
+
+
+class UploadError(Exception):
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _conflict() -> UploadError:
+    return UploadError(HTTPStatus.CONFLICT, "File already exists")
+
+
+class MultipartReader:
+    """Stream a multipart/form-data request body, spooling file parts to disk."""
+
+    chunk_size = 1024 * 1024
+
+    def __init__(self, stream: BinaryIO, length: int, boundary: bytes):
+        self.stream = stream
+        self.remaining = length
+        self.delimiter = b"\r\n--" + boundary
+        self.buffer = b"\r\n"
+
+    def read(self, directory: Path) -> Tuple[Dict[str, str], Optional[Upload]]:
+        fields: Dict[str, str] = {}
+        upload = None
+
+        self._skip_until_delimiter()
+        while not self._read_line().startswith(b"--"):
+            headers = self._read_headers()
+            disposition = headers.get("content-disposition", "")
+            name = re.search(r'\bname="([^"]*)"', disposition)
+            filename = re.search(r'\bfilename="([^"]*)"', disposition)
+
+            if filename:
+                path = directory / Path(filename.group(1)).name
+                sha256 = hashlib.sha256()
+                with open(path, "wb") as f:
+                    for block in self._read_part():
+                        sha256.update(block)
+                        f.write(block)
+                upload = Upload(path, Hash("sha256", sha256.hexdigest()))
+            else:
+                value = b"".join(self._read_part()).decode()
+                if name:
+                    fields[name.group(1)] = value
+
+        return fields, upload
+
+    def _fill(self) -> bool:
+        if self.remaining <= 0:
+            return False
+        data = self.stream.read(min(self.chunk_size, self.remaining))
+        if not data:
+            raise UploadError(HTTPStatus.BAD_REQUEST, "Truncated request body")
+        self.remaining -= len(data)
+        self.buffer += data
+        return True
+
+    def _read_line(self) -> bytes:
+        while (i := self.buffer.find(b"\r\n")) < 0:
+            if not self._fill():
+                raise UploadError(HTTPStatus.BAD_REQUEST, "Malformed multipart data")
+        line, self.buffer = self.buffer[:i], self.buffer[i + 2 :]
+        return line
+
+    def _read_headers(self) -> Dict[str, str]:
+        headers = {}
+        while line := self._read_line():
+            key, _, value = line.decode().partition(":")
+            headers[key.strip().lower()] = value.strip()
+        return headers
+
+    def _read_part(self) -> Iterator[bytes]:
+        """Yield the body of the current part, up to the next delimiter."""
+        while True:
+            i = self.buffer.find(self.delimiter)
+            if i >= 0:
+                yield self.buffer[:i]
+                self.buffer = self.buffer[i + len(self.delimiter) :]
+                return
+            keep = len(self.delimiter) - 1
+            if len(self.buffer) > keep:
+                yield self.buffer[:-keep]
+                self.buffer = self.buffer[-keep:]
+            if not self._fill():
+                raise UploadError(HTTPStatus.BAD_REQUEST, "Malformed multipart data")
+
+    def _skip_until_delimiter(self) -> None:
+        for _ in self._read_part():
+            pass
+
+
+def serve(cfg: Config, server_cfg: ServerConfig = ServerConfig()) -> None:
+    server = UploadServer(build_storage(cfg), server_cfg)
+    log.info("Listening on http://%s:%d/", *server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
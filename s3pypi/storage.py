@@ -1,15 +1,53 @@
-from contextlib import contextmanager
+import abc
+import copy
+import hashlib
+import logging
+import os
+import random
+import re
+import tempfile
+import time
+import urllib.parse
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, suppress
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, Iterator, List, Optional
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Protocol,
+    Set,
+    Tuple,
+    TypeVar,
+)
 
 import boto3
 import botocore
 from botocore.config import Config as BotoConfig
-from mypy_boto3_s3.service_resource import Object
+from botocore.response import StreamingBody
 
-from s3pypi.index import Index
-from s3pypi.locking import DynamoDBLocker
+from s3pypi import __prog__
+from s3pypi.catalog import Catalog, Project
+from s3pypi.compression import compress, decompress
+from s3pypi.exceptions import PreconditionFailedError, S3PyPiError
+from s3pypi.index import Hash, Index
+from s3pypi.journal import Journal
+from s3pypi.locking import DynamoDBLocker, FileLocker, Locker, LockerConfig
+from s3pypi.ratelimit import RateLimiter
+
+if TYPE_CHECKING:
+    from mypy_boto3_s3.service_resource import Object
+
+log = logging.getLogger(__prog__)
+
+T = TypeVar("T", bound="Storage")
 
 
 @dataclass
@@ -23,13 +61,373 @@ class S3Config:
     put_kwargs: Dict[str, str] = field(default_factory=dict)
     index_html: bool = False
     locks_table: Optional[str] = None
+    index_compression: Optional[str] = None
+    lock_stats: bool = False
+    index_max_age: int = 0
+    cloudfront_distribution_id: Optional[str] = None
+    cloudfront_endpoint_url: Optional[str] = None
+    journal: bool = False
+    blob_store: bool = False
+    rate_limits: Dict[str, str] = field(default_factory=dict)
+
+
+class Readable(Protocol):
+    def read(self, __size: int = ...) -> bytes:
+        ...
+
+    def close(self) -> None:
+        ...
 
 
-class S3Storage:
+class Storage(abc.ABC):
     root = "/"
+    index_name: str
+    lock: Locker
+
+    # Reserved for repository metadata; never listed as a project.
+    meta_directory = ".s3pypi"
+    catalog_name = "catalog.json"
+
+    # Start a journal if there is none yet (see `Journal`).
+    create_journal = False
+
+    # Content-addressed files, stored once per bucket and linked from indexes.
+    blob_directory = ".blobs"
+    blob_store = False
+
+    # Uploads are stored here first, and moved into place while the index is locked.
+    staging_directory = f"{meta_directory}/staging"
+
+    def __enter__(self: T) -> T:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.invalidate_cache()
+        self.compact_journal()
+
+    def invalidate_cache(self) -> None:
+        """Purge the index pages changed since the last call from CDN caches."""
+
+    def get_index(self, directory: str) -> Index:
+        return self.get_index_with_etag(directory)[0]
+
+    @abc.abstractmethod
+    def get_index_with_etag(self, directory: str) -> Tuple[Index, Optional[str]]:
+        ...
+
+    @contextmanager
+    def locked_index(self, directory: str) -> Iterator[Index]:
+        with self.lock(directory):
+            index = self.get_index(directory)
+            before = dict(index.filenames)
+            yield index
+
+            if index.filenames:
+                self.put_index(directory, index)
+            else:
+                self.delete(directory, self.index_name)
+
+            if directory != self.root:
+                # Journaled while the project is still locked, so that its changes
+                # are recorded in the order they were committed.
+                self._record_change(directory, before, index.filenames)
+
+        if directory != self.root:
+            # `reconcile_catalog` repairs the catalog, so other publishers
+            # needn't wait for this, and a failure isn't a failed commit.
+            try:
+                self.update_catalog([directory])
+            except Exception as e:
+                log.warning("Failed to update the catalog for %s: %s", directory, e)
+
+    @property
+    def journal(self) -> Journal:
+        return Journal(self)
+
+    _journal_appended = False
+
+    def compact_journal(self) -> None:
+        """Compact the journal if changes were recorded since the last call."""
+        if not self._journal_appended:
+            return
+        self._journal_appended = False
+        try:
+            self.journal.compact()
+        except Exception as e:
+            log.warning("Failed to compact the journal: %s", e)
+
+    def _record_change(
+        self,
+        directory: str,
+        before: Dict[str, Optional[Hash]],
+        after: Dict[str, Optional[Hash]],
+    ) -> None:
+        """Append the change of a project index to the journal, if there is one."""
+        added = {f: h for f, h in after.items() if f not in before or before[f] != h}
+        removed = sorted(f for f in before if f not in after)
+        if not added and not removed:
+            return
+
+        try:
+            seq = self.journal.append(directory, added, removed, self.create_journal)
+        except Exception as e:
+            raise S3PyPiError(
+                f"Updated the index of {directory}, but failed to record the change "
+                f"in the journal: {e}"
+            ) from e
+        if seq:
+            self._journal_appended = True
+
+    # How long to assume there is no catalog after not finding one.
+    catalog_recheck_interval = 60.0
+    _no_catalog_until = 0.0
+
+    def update_catalog(self, directories: List[str]) -> Optional[Catalog]:
+        """Update the entries of projects in the catalog, if there is a catalog.
+
+        The indexes are read after the catalog, and the catalog is written only if
+        it didn't change in the meantime (or else this is retried), so the last
+        update to succeed reflects the latest indexes. No lock is needed.
+
+        A missing catalog is only created by `build_catalog`, from a full listing.
+        """
+        for attempt in range(self.max_conditional_attempts):
+            if time.monotonic() < self._no_catalog_until:
+                return None
+            data, etag = self.get_meta_with_etag(self.catalog_name)
+            if data is None:
+                self._no_catalog_until = (
+                    time.monotonic() + self.catalog_recheck_interval
+                )
+                return None
+
+            catalog = Catalog.parse(data.decode())
+            changed = False
+            for directory, project in zip(directories, self._projects(directories)):
+                if catalog.projects.get(directory) != project:
+                    changed = True
+                    if project:
+                        catalog.projects[directory] = project
+                    else:
+                        catalog.projects.pop(directory, None)
+            if not changed:
+                return catalog
+
+            try:
+                self.put_catalog(catalog, if_match=etag)
+                return catalog
+            except PreconditionFailedError:
+                log.debug("The catalog was changed concurrently; retrying")
+                time.sleep(random.uniform(0, 0.05 * 2**attempt))
+
+        raise S3PyPiError("The catalog changed too often while updating it")
+
+    def _projects(self, directories: List[str]) -> List[Optional[Project]]:
+        """Read the indexes of projects in parallel, and summarize them."""
+
+        def summarize(directory: str) -> Optional[Project]:
+            index, etag = self.get_index_with_etag(directory)
+            return Project.of(index, etag) if index.filenames else None
+
+        if len(directories) == 1:
+            return [summarize(directories[0])]
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            return list(executor.map(summarize, directories))
+
+    def build_catalog(self) -> Catalog:
+        """Create the catalog from a listing of all project indexes."""
+        catalog = Catalog()
+        for d in self.list_directories():
+            directory = d.rstrip("/")
+            index, etag = self.get_index_with_etag(directory)
+            if index.filenames:
+                catalog.projects[directory] = Project.of(index, etag)
+        try:
+            self.put_catalog(catalog, if_none_match=True)
+        except PreconditionFailedError:
+            catalog = self.get_catalog() or catalog  # Built concurrently.
+        self._no_catalog_until = 0.0
+        return catalog
+
+    def reconcile_catalog(self) -> Catalog:
+        """Update every project in the catalog, and those that a listing adds.
+
+        This repairs updates that failed after their index was committed. It reads
+        every project index, so it's only run on request (`s3pypi repair-catalog`).
+        """
+        catalog = self.get_catalog()
+        if catalog is None:
+            return self.build_catalog()
+
+        listed = {d.rstrip("/") for d in self.list_directories()}
+        directories = sorted(listed.union(catalog.projects))
+        return self.update_catalog(directories) or self.build_catalog()
+
+    def file_directory(self, directory: str, hash_: Optional[Hash]) -> str:
+        """Return the directory to store a new file of a project in."""
+        if self.blob_store and hash_:
+            return f"{self.blob_directory}/{hash_.name}/{hash_.value}"
+        return directory
+
+    def stage_directory(self) -> str:
+        """Return a new directory to store an upload in until it is committed."""
+        return f"{self.staging_directory}/{uuid.uuid4().hex}"
+
+    def is_staged(self, directory: str) -> bool:
+        return directory.startswith(f"{self.staging_directory}/")
+
+    def locate(self, directory: str, index: Index, filename: str) -> str:
+        """Return the directory that holds a file listed in a project's index."""
+        href = index.hrefs.get(filename, "")
+        m = re.match(rf"(?:\.\./)*({re.escape(self.blob_directory)}/\w+/\w+)/", href)
+        return m.group(1) if m else directory
+
+    def link(self, index: Index, filename: str) -> None:
+        """Point an index entry to the file stored by `file_directory`."""
+        hash_ = index.filenames.get(filename)
+        if self.blob_store and hash_:
+            # Relative to the index page, so it works behind any domain or proxy.
+            up = "../" * (self.prefix_depth + 1)
+            location = self.file_directory(filename, hash_)
+            index.hrefs[filename] = f"{up}{location}/{urllib.parse.quote(filename)}"
+        else:
+            index.hrefs.pop(filename, None)
+
+    @property
+    def prefix_depth(self) -> int:
+        return 0
+
+    @abc.abstractmethod
+    def list_directories(self) -> List[str]:
+        ...
+
+    @abc.abstractmethod
+    def put_index(self, directory: str, index: Index) -> Optional[str]:
+        """Write an index and return its ETag."""
+
+    def get_catalog(self) -> Optional[Catalog]:
+        data = self.get_meta(self.catalog_name)
+        return Catalog.parse(data.decode()) if data is not None else None
+
+    def put_catalog(self, catalog: Catalog, **conditions: Any) -> None:
+        self.put_meta(self.catalog_name, catalog.to_json().encode(), **conditions)
+
+    # Attempts of a read-modify-write with conditional writes.
+    max_conditional_attempts = 10
+
+    def get_meta(self, name: str) -> Optional[bytes]:
+        """Read a file in the metadata directory, or `None` if it doesn't exist."""
+        return self.get_meta_with_etag(name)[0]
+
+    @abc.abstractmethod
+    def get_meta_with_etag(self, name: str) -> Tuple[Optional[bytes], Optional[str]]:
+        ...
+
+    @abc.abstractmethod
+    def put_meta(
+        self,
+        name: str,
+        data: bytes,
+        if_match: Optional[str] = None,
+        if_none_match: bool = False,
+    ) -> None:
+        """Write a file in the metadata directory.
+
+        With `if_match`, only replace the version with that ETag. With
+        `if_none_match`, only create the file. Otherwise, `PreconditionFailedError`
+        is raised.
+        """
+
+    @abc.abstractmethod
+    def delete_meta(self, names: List[str]) -> None:
+        ...
+
+    @abc.abstractmethod
+    def put_distribution(
+        self,
+        directory: str,
+        local_path: Path,
+        callback: Optional[Callable[[int], None]] = None,
+    ) -> None:
+        """Store a file, calling `callback` with the number of bytes sent so far."""
+
+    def has_distribution(self, directory: str, filename: str) -> bool:
+        return self.distribution_etag(directory, filename) is not None
+
+    @abc.abstractmethod
+    def touch_distribution(self, directory: str, filename: str) -> bool:
+        """Update the modification time of a stored file, if it exists.
+
+        A blob that is reused is touched before it is linked, so that `gc` doesn't
+        delete it as unused and older than its grace period in the meantime.
+        """
+
+    @abc.abstractmethod
+    def distribution_etag(self, directory: str, filename: str) -> Optional[str]:
+        """Return a version identifier of a stored file, or `None` if it's missing."""
+
+    @abc.abstractmethod
+    def get_distribution(
+        self, directory: str, filename: str, offset: int = 0
+    ) -> Readable:
+        ...
+
+    def copy_distribution(
+        self,
+        src: "Storage",
+        directory: str,
+        filename: str,
+        src_directory: Optional[str] = None,
+    ) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / filename
+            body = src.get_distribution(src_directory or directory, filename)
+            try:
+                with open(path, "wb") as f:
+                    while block := body.read(1024 * 1024):
+                        f.write(block)
+            finally:
+                body.close()
+            self.put_distribution(directory, path)
+
+    @abc.abstractmethod
+    def move_distribution(
+        self, src_directory: str, directory: str, filename: str, replace: bool = True
+    ) -> None:
+        """Move a stored file to another directory.
+
+        Unless `replace` is set, this raises `PreconditionFailedError` instead of
+        overwriting an existing file, atomically.
+        """
+
+    def read_range(
+        self, directory: str, filename: str, start: int, length: int
+    ) -> bytes:
+        body = self.get_distribution(directory, filename, start)
+        try:
+            return body.read(length)
+        finally:
+            body.close()
+
+    @abc.abstractmethod
+    def distribution_size(self, directory: str, filename: str) -> int:
+        ...
+
+    @abc.abstractmethod
+    def put_metadata(self, directory: str, filename: str, data: bytes) -> None:
+        """Store the core metadata of a distribution as `<filename>.metadata`."""
+
+    @abc.abstractmethod
+    def delete(self, directory: str, filename: str) -> None:
+        ...
+
+
+class S3Storage(Storage):
     _index = "index.html"
+    max_invalidation_paths = 3000
+    max_cached_indexes = 256
 
-    def __init__(self, cfg: S3Config):
+    def __init__(self, cfg: S3Config, cache_indexes: bool = False):
         session = boto3.Session(profile_name=cfg.profile, region_name=cfg.region)
 
         config = None
@@ -37,40 +435,76 @@ class S3Storage:
             config = BotoConfig(signature_version=botocore.session.UNSIGNED)  # type: ignore
 
         self.s3 = session.resource("s3", endpoint_url=cfg.endpoint_url, config=config)
+        # Shared by all threads using this storage, and by its locker.
+        self.limiter = RateLimiter(cfg.rate_limits)
+        self.limiter.attach(self.s3.meta.client)
+        events = self.s3.meta.client.meta.events
+        for operation in ("PutObject", "CompleteMultipartUpload"):
+            events.register(f"provide-client-params.s3.{operation}", _pop_conditions)
+            events.register(f"before-call.s3.{operation}", _add_conditions)
         self.index_name = self._index if cfg.index_html else ""
         self.cfg = cfg
+        self.blob_store = cfg.blob_store
 
-        self.lock = DynamoDBLocker.build(
+        self.cloudfront = (
+            session.client("cloudfront", endpoint_url=cfg.cloudfront_endpoint_url)
+            if cfg.cloudfront_distribution_id
+            else None
+        )
+        self._changed_keys: Set[str] = set()
+        # Indexes by key, revalidated with their ETag on every read.
+        self._index_cache: Optional[Dict[str, Tuple[str, Index]]] = (
+            {} if cache_indexes else None
+        )
+
+        self.lock: Locker = DynamoDBLocker.build(
             session,
             table_name=cfg.locks_table or f"{cfg.bucket}-locks",
             discover=not cfg.locks_table,
+            cfg=LockerConfig(record_stats=cfg.lock_stats),
+            limiter=self.limiter,
         )
 
-    def _object(self, directory: str, filename: str) -> Object:
+    def _object(self, directory: str, filename: str) -> "Object":
         parts = [directory, filename]
         if parts == [self.root, self.index_name]:
             parts = [p, self.index_name] if (p := self.cfg.prefix) else [self._index]
-        elif self.cfg.prefix:
+        elif self.cfg.prefix and not directory.startswith(f"{self.blob_directory}/"):
+            # Blobs are shared by all prefixes in the bucket.
             parts.insert(0, self.cfg.prefix)
         return self.s3.Object(self.cfg.bucket, key="/".join(parts))
 
-    def get_index(self, directory: str) -> Index:
-        try:
-            html = self._object(directory, self.index_name).get()["Body"].read()
-        except botocore.exceptions.ClientError:
-            return Index()
-        return Index.parse(html.decode())
+    @property
+    def prefix_depth(self) -> int:
+        return len(p.strip("/").split("/")) if (p := self.cfg.prefix) else 0
 
-    @contextmanager
-    def locked_index(self, directory: str) -> Iterator[Index]:
-        with self.lock(directory):
-            index = self.get_index(directory)
-            yield index
+    def get_index_with_etag(self, directory: str) -> Tuple[Index, Optional[str]]:
+        obj = self._object(directory, self.index_name)
+        cached = self._index_cache.get(obj.key) if self._index_cache else None
+        try:
+            response = obj.get(IfNoneMatch=cached[0]) if cached else obj.get()
+        except botocore.exceptions.ClientError as e:
+            if cached and e.response["Error"]["Code"] == "304":
+                return copy.deepcopy(cached[1]), cached[0]
+            self._cache_index(obj.key, None, None)
+            return Index(), None
+        html = decompress(
+            response["Body"].iter_chunks(), response.get("ContentEncoding", "")
+        )
+        index = Index.parse(html.decode())
+        self._cache_index(obj.key, response["ETag"], index)
+        return index, response["ETag"]
 
-            if index.filenames:
-                self.put_index(directory, index)
-            else:
-                self.delete(directory, self.index_name)
+    def _cache_index(
+        self, key: str, etag: Optional[str], index: Optional[Index]
+    ) -> None:
+        if self._index_cache is None:
+            return
+        self._index_cache.pop(key, None)
+        if etag and index:
+            if len(self._index_cache) >= self.max_cached_indexes:
+                self._index_cache.pop(next(iter(self._index_cache)), None)
+            self._index_cache[key] = (etag, copy.deepcopy(index))
 
     def list_directories(self) -> List[str]:
         prefix = f"{p}/" if (p := self.cfg.prefix) else ""
@@ -79,24 +513,442 @@ class S3Storage:
             for item in self.s3.meta.client.get_paginator("list_objects_v2")
             .paginate(Bucket=self.cfg.bucket, Delimiter="/", Prefix=prefix)
             .search("CommonPrefixes")
-            if item and (d := item.get("Prefix"))
+            if item
+            and (d := item.get("Prefix"))
+            and not d[len(prefix) :].startswith(".")
         ]
 
-    def put_index(self, directory: str, index: Index) -> None:
-        self._object(directory, self.index_name).put(
-            Body=index.to_html(),
+    def put_index(self, directory: str, index: Index) -> Optional[str]:
+        body = index.to_html().encode()
+        kwargs: Dict[str, Any] = {}
+        if encoding := self.cfg.index_compression:
+            body = compress(body, encoding)
+            kwargs["ContentEncoding"] = encoding
+
+        if max_age := self.cfg.index_max_age:
+            # Let the CDN cache the page; it is invalidated when it changes.
+            cache_control = f"public, max-age=0, must-revalidate, s-maxage={max_age}"
+        else:
+            cache_control = "public, must-revalidate, proxy-revalidate, max-age=0"
+
+        obj = self._object(directory, self.index_name)
+        response = obj.put(
+            Body=body,
             ContentType="text/html",
-            CacheControl="public, must-revalidate, proxy-revalidate, max-age=0",
+            **kwargs,
+            CacheControl=cache_control,
             **self.cfg.put_kwargs,  # type: ignore
         )
+        self._changed_keys.add(obj.key)
+        self._cache_index(obj.key, response["ETag"], index)
+        return response["ETag"]
+
+    def get_meta_with_etag(self, name: str) -> Tuple[Optional[bytes], Optional[str]]:
+        try:
+            response = self._object(self.meta_directory, name).get()
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] == "NoSuchKey":
+                return None, None
+            raise
+        return response["Body"].read(), response["ETag"]
+
+    def put_meta(
+        self,
+        name: str,
+        data: bytes,
+        if_match: Optional[str] = None,
+        if_none_match: bool = False,
+    ) -> None:
+        conditions: Dict[str, Any] = {}
+        if if_match:
+            conditions["IfMatch"] = if_match
+        if if_none_match:
+            conditions["IfNoneMatch"] = "*"
 
-    def put_distribution(self, directory: str, local_path: Path) -> None:
-        with open(local_path, mode="rb") as f:
-            self._object(directory, local_path.name).put(
-                Body=f,
-                ContentType="application/x-gzip",
+        try:
+            self._object(self.meta_directory, name).put(
+                Body=data,
+                ContentType="application/json",
+                CacheControl="no-cache",
+                **conditions,
                 **self.cfg.put_kwargs,  # type: ignore
             )
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] in _precondition_errors:
+                raise PreconditionFailedError(name) from e
+            raise
+
+    def delete_meta(self, names: List[str]) -> None:
+        keys = [self._object(self.meta_directory, name).key for name in names]
+        for i in range(0, len(keys), 1000):
+            self.s3.meta.client.delete_objects(
+                Bucket=self.cfg.bucket,
+                Delete={"Objects": [{"Key": key} for key in keys[i : i + 1000]]},
+            )
+
+    def put_distribution(
+        self,
+        directory: str,
+        local_path: Path,
+        callback: Optional[Callable[[int], None]] = None,
+    ) -> None:
+        # Managed upload, which switches to a multipart upload for large files.
+        self._object(directory, local_path.name).upload_file(
+            str(local_path),
+            ExtraArgs={"ContentType": "application/x-gzip", **self.cfg.put_kwargs},
+            Callback=callback,
+        )
+
+    def distribution_etag(self, directory: str, filename: str) -> Optional[str]:
+        obj = self._object(directory, filename)
+        try:
+            obj.load()
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return None
+            raise
+        return obj.e_tag
+
+    def touch_distribution(self, directory: str, filename: str) -> bool:
+        obj = self._object(directory, filename)
+        try:
+            self._copy_object(obj, obj)
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return False
+            raise
+        return True
+
+    def move_distribution(
+        self, src_directory: str, directory: str, filename: str, replace: bool = True
+    ) -> None:
+        source = self._object(src_directory, filename)
+        try:
+            self._copy_object(
+                source, self._object(directory, filename), if_none_match=not replace
+            )
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] in _precondition_errors:
+                raise PreconditionFailedError(filename) from e
+            raise
+        source.delete()
+
+    def get_distribution(
+        self, directory: str, filename: str, offset: int = 0
+    ) -> StreamingBody:
+        obj = self._object(directory, filename)
+        return (obj.get(Range=f"bytes={offset}-") if offset else obj.get())["Body"]
+
+    def read_range(
+        self, directory: str, filename: str, start: int, length: int
+    ) -> bytes:
+        obj = self._object(directory, filename)
+        return obj.get(Range=f"bytes={start}-{start + length - 1}")["Body"].read()
+
+    def distribution_size(self, directory: str, filename: str) -> int:
+        return self._object(directory, filename).content_length
+
+    def put_metadata(self, directory: str, filename: str, data: bytes) -> None:
+        self._object(directory, f"{filename}.metadata").put(
+            Body=data,
+            ContentType="text/plain",
+            **self.cfg.put_kwargs,  # type: ignore
+        )
+
+    def copy_distribution(
+        self,
+        src: Storage,
+        directory: str,
+        filename: str,
+        src_directory: Optional[str] = None,
+    ) -> None:
+        # A server-side copy reads the source with our credentials, so only use
+        # it if both storages use the same endpoint and credentials.
+        if not isinstance(src, S3Storage) or any(
+            getattr(src.cfg, attr) != getattr(self.cfg, attr)
+            for attr in ("endpoint_url", "profile", "no_sign_request")
+        ):
+            return super().copy_distribution(src, directory, filename, src_directory)
+
+        # Managed copy, which switches to a multipart copy for large objects.
+        source = src._object(src_directory or directory, filename)
+        try:
+            self._object(directory, filename).copy(
+                {"Bucket": source.bucket_name, "Key": source.key},
+                ExtraArgs=self.cfg.put_kwargs,
+            )
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] not in ("403", "AccessDenied"):
+                raise
+            # E.g. the bucket policy doesn't grant us access to the source.
+            log.debug("Copying %s through this host: %s", source.key, e)
+            super().copy_distribution(src, directory, filename, src_directory)
+
+    # The largest object that CopyObject can copy, and the part size for larger ones.
+    max_copy_size = 5 * 1024**3
+    copy_part_size = 512 * 1024**2
+
+    def _copy_object(
+        self, source: "Object", dest: "Object", if_none_match: bool = False
+    ) -> None:
+        """Copy an object within the bucket, onto itself to refresh its LastModified.
+
+        Objects over 5 GB, and copies that must not overwrite an existing object,
+        use a multipart copy, whose completion can be made conditional.
+        """
+        source.load()
+        extra = {"ContentType": source.content_type, **self.cfg.put_kwargs}
+        if source.content_length <= self.max_copy_size and not if_none_match:
+            # Copying an object onto itself requires a change, like new metadata.
+            dest.copy_from(
+                CopySource=f"{source.bucket_name}/{urllib.parse.quote(source.key)}",
+                MetadataDirective="REPLACE",
+                **extra,  # type: ignore
+            )
+            return
+
+        client = self.s3.meta.client
+        upload_id = client.create_multipart_upload(
+            Bucket=dest.bucket_name, Key=dest.key, **extra  # type: ignore
+        )["UploadId"]
+
+        def copy_part(n: int) -> Dict[str, Any]:
+            start = (n - 1) * self.copy_part_size
+            end = min(start + self.copy_part_size, source.content_length) - 1
+            result = client.upload_part_copy(
+                Bucket=dest.bucket_name,
+                Key=dest.key,
+                UploadId=upload_id,
+                PartNumber=n,
+                CopySource={"Bucket": source.bucket_name, "Key": source.key},
+                CopySourceRange=f"bytes={start}-{end}",
+            )
+            return {"PartNumber": n, "ETag": result["CopyPartResult"]["ETag"]}
+
+        try:
+            n_parts = max(1, -(-source.content_length // self.copy_part_size))
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                parts = list(executor.map(copy_part, range(1, n_parts + 1)))
+            client.complete_multipart_upload(
+                Bucket=dest.bucket_name,
+                Key=dest.key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts},  # type: ignore
+                **({"IfNoneMatch": "*"} if if_none_match else {}),  # type: ignore
+            )
+        except BaseException:
+            with suppress(Exception):
+                client.abort_multipart_upload(
+                    Bucket=dest.bucket_name, Key=dest.key, UploadId=upload_id
+                )
+            raise
 
     def delete(self, directory: str, filename: str) -> None:
-        self._object(directory, filename).delete()
+        obj = self._object(directory, filename)
+        obj.delete()
+        if filename == self.index_name:
+            self._changed_keys.add(obj.key)
+            self._cache_index(obj.key, None, None)
+
+    def invalidate_cache(self) -> None:
+        keys, self._changed_keys = self._changed_keys, set()
+        if not self.cloudfront or not keys:
+            return
+
+        paths = set()
+        for key in keys:
+            paths.add(f"/{key}")
+            if key == self._index or key.endswith(f"/{self._index}"):
+                paths.add(f"/{key[: -len(self._index)]}")
+
+        items = sorted(paths)
+        for i in range(0, len(items), self.max_invalidation_paths):
+            batch = items[i : i + self.max_invalidation_paths]
+            log.debug("Invalidating %d CDN paths: %s", len(batch), ", ".join(batch))
+            self.cloudfront.create_invalidation(
+                DistributionId=str(self.cfg.cloudfront_distribution_id),
+                InvalidationBatch={
+                    "Paths": {"Quantity": len(batch), "Items": batch},
+                    "CallerReference": uuid.uuid4().hex,
+                },
+            )
+
+
+# Conditional writes aren't modelled by all supported botocore versions, so their
+# parameters are moved to headers.
+_conditions = {"IfMatch": "If-Match", "IfNoneMatch": "If-None-Match"}
+_precondition_errors = {"PreconditionFailed", "ConditionalRequestConflict", "412"}
+
+
+def _pop_conditions(params: Dict[str, Any], context: Dict[str, Any], **_: Any) -> None:
+    for name in _conditions:
+        if name in params:
+            context[name] = params.pop(name)
+
+
+def _add_conditions(params: Dict[str, Any], context: Dict[str, Any], **_: Any) -> None:
+    for name, header in _conditions.items():
+        if name in context:
+            params["headers"][header] = context[name]
+
+
+class FileStorage(Storage):
+    """Store packages in a local (or network-mounted) directory.
+
+    Files are written to a temporary file first and then renamed, so readers
+    never see partial writes. Indexes are locked with `fcntl` locks.
+    """
+
+    index_name = "index.html"
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = FileLocker(path / ".locks")
+
+    def _path(self, directory: str, filename: str) -> Path:
+        base = self.path if directory == self.root else self.path / directory
+        return base / filename
+
+    def get_index_with_etag(self, directory: str) -> Tuple[Index, Optional[str]]:
+        try:
+            html = self._path(directory, self.index_name).read_bytes()
+        except FileNotFoundError:
+            return Index(), None
+        return Index.parse(html.decode()), self._etag(html)
+
+    def list_directories(self) -> List[str]:
+        return [
+            f"{d.name}/"
+            for d in sorted(self.path.iterdir())
+            if d.is_dir() and not d.name.startswith(".")
+        ]
+
+    def put_index(self, directory: str, index: Index) -> Optional[str]:
+        html = index.to_html().encode()
+        with self._atomic_write(self._path(directory, self.index_name)) as f:
+            f.write(html)
+        return self._etag(html)
+
+    def get_meta_with_etag(self, name: str) -> Tuple[Optional[bytes], Optional[str]]:
+        try:
+            data = self._path(self.meta_directory, name).read_bytes()
+        except FileNotFoundError:
+            return None, None
+        return data, self._etag(data)
+
+    def put_meta(
+        self,
+        name: str,
+        data: bytes,
+        if_match: Optional[str] = None,
+        if_none_match: bool = False,
+    ) -> None:
+        path = self._path(self.meta_directory, name)
+        if not if_match and not if_none_match:
+            with self._atomic_write(path) as f:
+                f.write(data)
+            return
+
+        with self._exclusive():
+            etag = self.get_meta_with_etag(name)[1]
+            if (if_none_match and etag) or (if_match and etag != if_match):
+                raise PreconditionFailedError(name)
+            with self._atomic_write(path) as f:
+                f.write(data)
+
+    def delete_meta(self, names: List[str]) -> None:
+        for name in names:
+            self._path(self.meta_directory, name).unlink(missing_ok=True)
+
+    def put_distribution(
+        self,
+        directory: str,
+        local_path: Path,
+        callback: Optional[Callable[[int], None]] = None,
+    ) -> None:
+        dest = self._path(directory, local_path.name)
+        with open(local_path, "rb") as src, self._atomic_write(dest) as f:
+            while block := src.read(1024 * 1024):
+                f.write(block)
+                if callback:
+                    callback(len(block))
+
+    def distribution_etag(self, directory: str, filename: str) -> Optional[str]:
+        try:
+            st = self._path(directory, filename).stat()
+        except FileNotFoundError:
+            return None
+        return f'"{st.st_size}-{st.st_mtime_ns}"'
+
+    def touch_distribution(self, directory: str, filename: str) -> bool:
+        try:
+            os.utime(self._path(directory, filename))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def get_distribution(
+        self, directory: str, filename: str, offset: int = 0
+    ) -> Readable:
+        f = open(self._path(directory, filename), "rb")
+        f.seek(offset)
+        return f
+
+    def move_distribution(
+        self, src_directory: str, directory: str, filename: str, replace: bool = True
+    ) -> None:
+        src, dest = self._path(src_directory, filename), self._path(directory, filename)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        if replace:
+            os.replace(src, dest)
+        else:
+            try:
+                os.link(src, dest)  # Fails if `dest` exists, unlike a rename.
+            except FileExistsError as e:
+                raise PreconditionFailedError(filename) from e
+            os.unlink(src)
+        self._remove_staging(src_directory)
+
+    def distribution_size(self, directory: str, filename: str) -> int:
+        return self._path(directory, filename).stat().st_size
+
+    def put_metadata(self, directory: str, filename: str, data: bytes) -> None:
+        with self._atomic_write(self._path(directory, f"{filename}.metadata")) as f:
+            f.write(data)
+
+    def delete(self, directory: str, filename: str) -> None:
+        self._path(directory, filename).unlink(missing_ok=True)
+        self._remove_staging(directory)
+
+    def _remove_staging(self, directory: str) -> None:
+        if self.is_staged(directory):
+            with suppress(OSError):  # Not empty yet.
+                self._path(directory, "").rmdir()
+
+    @staticmethod
+    def _etag(data: bytes) -> str:
+        return f'"{hashlib.md5(data).hexdigest()}"'
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        """Serialize conditional writes with `fcntl.flock`."""
+        import fcntl
+
+        path = self._path(self.meta_directory, ".lock")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    @contextmanager
+    def _atomic_write(self, path: Path) -> Iterator[IO[bytes]]:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                yield f
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
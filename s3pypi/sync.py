@@ -0,0 +1,178 @@
+import logging
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import botocore
+
+from s3pypi import __prog__
+from s3pypi.core import Config, build_storage, normalize_package_name
+from s3pypi.exceptions import S3PyPiError
+from s3pypi.index import Hash, Index
+from s3pypi.storage import Storage
+
+log = logging.getLogger(__prog__)
+
+
+@dataclass
+class SyncConfig:
+    concurrency: int = 8
+    delete: bool = False
+    chunk_size: int = 1024 * 1024
+
+
+def sync_down(
+    cfg: Config,
+    dest: Path,
+    projects: Optional[List[str]] = None,
+    sync: SyncConfig = SyncConfig(),
+) -> None:
+    """Download the repository into a static directory with the same layout.
+
+    Files are compared against the index that was written locally by the
+    previous run, so only new or changed files are transferred. Interrupted
+    downloads are resumed from their `.part` files.
+    """
+    storage = build_storage(cfg)
+    root_index = storage.get_index(storage.root)
+
+    if projects:
+        directories = [normalize_package_name(p) for p in projects]
+    else:
+        if not root_index.filenames and (catalog := storage.get_catalog()):
+            root_index = catalog.to_index()
+        directories = [d.rstrip("/") for d in root_index.filenames]
+        if not directories:
+            raise S3PyPiError(
+                "No root index found. Upload with --put-root-index, "
+                "or pass the names of the projects to sync."
+            )
+
+    with ThreadPoolExecutor(max_workers=sync.concurrency) as executor:
+        indexes = dict(zip(directories, executor.map(storage.get_index, directories)))
+
+        pending: Dict[str, Dict[Future, str]] = {}
+        for directory, index in indexes.items():
+            local_dir = dest / directory
+            local_dir.mkdir(parents=True, exist_ok=True)
+            local_index = read_local_index(local_dir)
+
+            pending[directory] = {
+                executor.submit(
+                    download,
+                    storage,
+                    storage.locate(directory, index, source),
+                    filename,
+                    hash_,
+                    local_dir,
+                    sync,
+                ): filename
+                for filename, hash_, source in remote_files(index)
+                if is_outdated(local_dir / filename, hash_, local_index, filename)
+            }
+
+        failures = 0
+        for directory, futures in pending.items():
+            local_dir = dest / directory
+            project_failures = 0
+            for future, filename in futures.items():
+                try:
+                    future.result()
+                except (
+                    OSError,
+                    S3PyPiError,
+                    botocore.exceptions.BotoCoreError,
+                    botocore.exceptions.ClientError,
+                ) as e:
+                    log.error("Failed to download %s/%s: %s", directory, filename, e)
+                    project_failures += 1
+
+            failures += project_failures
+            if project_failures:
+                continue
+
+            if sync.delete:
+                for filename in read_local_index(local_dir).filenames:
+                    if filename not in indexes[directory].filenames:
+                        log.info("Removing %s/%s", directory, filename)
+                        (local_dir / filename).unlink(missing_ok=True)
+                        (local_dir / f"{filename}.metadata").unlink(missing_ok=True)
+
+            # Files are stored next to the local index, also if they were blobs.
+            write_local_index(local_dir, replace(indexes[directory], hrefs={}))
+
+    if failures:
+        raise S3PyPiError(f"Failed to download {failures} files")
+
+    if not projects:
+        write_local_index(dest, root_index)
+
+
+def remote_files(index: Index) -> Iterator[Tuple[str, Optional[Hash], str]]:
+    """List the files of an index, including their core metadata files.
+
+    Each file is listed with the index entry it belongs to.
+    """
+    for filename, hash_ in index.filenames.items():
+        yield filename, hash_, filename
+        if (metadata := index.metadata.get(filename)) and metadata.core_metadata:
+            yield f"{filename}.metadata", metadata.core_metadata, filename
+
+
+def is_outdated(
+    path: Path, hash_: Optional[Hash], local_index: Index, filename: str
+) -> bool:
+    if not path.is_file():
+        return True
+    if filename not in local_index.filenames:
+        return hash_ is not None and Hash.of(hash_.name, path) != hash_
+    return hash_ is not None and local_index.filenames[filename] != hash_
+
+
+def download(
+    storage: Storage,
+    directory: str,
+    filename: str,
+    hash_: Optional[Hash],
+    local_dir: Path,
+    sync: SyncConfig,
+) -> None:
+    path = local_dir / filename
+    part = path.with_name(path.name + ".part")
+    offset = part.stat().st_size if part.exists() else 0
+
+    try:
+        body = storage.get_distribution(directory, filename, offset)
+    except botocore.exceptions.ClientError as e:
+        if not offset or e.response["Error"]["Code"] != "InvalidRange":
+            raise
+        offset, body = 0, storage.get_distribution(directory, filename)
+
+    log.info("Downloading %s/%s%s", directory, filename, " (resumed)" if offset else "")
+    with open(part, "ab" if offset else "wb") as f:
+        try:
+            while block := body.read(sync.chunk_size):
+                f.write(block)
+        finally:
+            body.close()
+
+    if hash_ and Hash.of(hash_.name, part) != hash_:
+        part.unlink()
+        raise S3PyPiError(f"Hash mismatch for {directory}/{filename}")
+
+    os.replace(part, path)
+
+
+def read_local_index(local_dir: Path) -> Index:
+    try:
+        return Index.parse((local_dir / "index.html").read_text())
+    except FileNotFoundError:
+        return Index()
+
+
+def write_local_index(local_dir: Path, index: Index) -> None:
+    tmp = local_dir / "index.html.tmp"
+    tmp.write_text(index.to_html())
+    os.replace(tmp, local_dir / "index.html")
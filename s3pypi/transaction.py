@@ -0,0 +1,140 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, TextIO, Tuple
+
+from s3pypi import __prog__
+from s3pypi.index import Hash
+
+log = logging.getLogger(__prog__)
+
+
+@dataclass
+class UploadRecord:
+    hash: Hash
+    etag: Optional[str]
+    location: Optional[str] = None
+
+
+@dataclass
+class TransactionState:
+    uploaded: Dict[Tuple[str, str], UploadRecord] = field(default_factory=dict)
+    committed: Set[str] = field(default_factory=set)
+
+
+class TransactionLog:
+    """A local log of the files uploaded and indexes committed by one publish.
+
+    Every record is flushed to disk before the next step starts, so a publish
+    that was interrupted can be resumed: files that were uploaded with the same
+    hash, and still have the same ETag, are not uploaded again, and indexes that
+    were committed are skipped. The log is removed once the publish completes.
+
+    The log is only created when the first record is written. If it can't be
+    written, the publish continues without it, but can't be resumed.
+    """
+
+    def __init__(self, path: Path, resume: bool = False):
+        self.path = path
+        self.resume = resume
+        self.state = self._read() if resume else TransactionState()
+        self._file: Optional[TextIO] = None
+        self._failed = False
+
+    @staticmethod
+    def default_path(target: str, paths: List[Path]) -> Path:
+        """Return a path that is the same for every run with the same arguments."""
+        key = "\n".join([target, *sorted(str(p.resolve()) for p in paths)])
+        cache = os.environ.get("XDG_CACHE_HOME")
+        if not cache:
+            try:
+                cache = str(Path.home() / ".cache")
+            except RuntimeError:  # No home directory to be found.
+                cache = tempfile.gettempdir()
+        name = hashlib.sha256(key.encode()).hexdigest()[:16]
+        return Path(cache) / __prog__ / "transactions" / f"{name}.jsonl"
+
+    def uploaded(
+        self,
+        directory: str,
+        filename: str,
+        hash_: Hash,
+        etag: Optional[str],
+        location: Optional[str] = None,
+    ) -> None:
+        self._append(
+            {
+                "event": "uploaded",
+                "directory": directory,
+                "filename": filename,
+                "hash": f"{hash_.name}={hash_.value}",
+                "etag": etag,
+                "location": location,
+            }
+        )
+
+    def committed(self, directory: str) -> None:
+        self._append({"event": "committed", "directory": directory})
+
+    def remove(self) -> None:
+        if self._file:
+            self._file.close()
+        try:
+            self.path.unlink(missing_ok=True)
+        except OSError as e:
+            if not self._failed:  # Otherwise, this was reported already.
+                log.warning("Failed to remove the transaction log: %s", e)
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        if self._failed:
+            return
+        try:
+            if not self._file:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = open(self.path, "a" if self.resume else "w")
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except OSError as e:
+            log.warning(
+                "Failed to write the transaction log, so this upload can't be "
+                "resumed: %s",
+                e,
+            )
+            self._failed = True
+
+    def _read(self) -> TransactionState:
+        state = TransactionState()
+        try:
+            lines = self.path.read_text().splitlines()
+        except FileNotFoundError:
+            log.debug("No transaction log to resume at %s", self.path)
+            return state
+        except OSError as e:
+            log.warning("Failed to read the transaction log: %s", e)
+            return state
+
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break  # The last record may be incomplete after a crash.
+            if record["event"] == "uploaded":
+                state.uploaded[record["directory"], record["filename"]] = UploadRecord(
+                    Hash(*record["hash"].split("=", 1)),
+                    record["etag"],
+                    record.get("location"),
+                )
+            elif record["event"] == "committed":
+                state.committed.add(record["directory"])
+
+        log.info(
+            "Resuming: %d files were uploaded and %d indexes committed",
+            len(state.uploaded),
+            len(state.committed),
+        )
+        return state
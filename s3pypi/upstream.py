@@ -0,0 +1,245 @@
+import hashlib
+import http.client
+import logging
+import tempfile
+import urllib.parse
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import suppress
+from dataclasses import dataclass
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import boto3
+import botocore
+
+from s3pypi import __prog__, __version__
+from s3pypi.core import (
+    Config,
+    StagedFile,
+    build_storage,
+    commit_uploads,
+    normalize_package_name,
+    parse_distribution_id,
+    put_distribution,
+    update_root_index,
+)
+from s3pypi.exceptions import S3PyPiError
+from s3pypi.index import Hash
+from s3pypi.metadata import check_archive, file_metadata
+from s3pypi.progress import Progress
+from s3pypi.ratelimit import TokenBucket
+
+log = logging.getLogger(__prog__)
+
+DEFAULT_INDEX_URL = "https://pypi.org/simple/"
+
+
+@dataclass
+class Link:
+    filename: str
+    url: str
+    hash: Optional[Hash] = None
+    requires_python: Optional[str] = None
+
+
+@dataclass
+class MirrorConfig:
+    index_url: str = DEFAULT_INDEX_URL
+    concurrency: int = 4
+    max_bandwidth: Optional[int] = None
+    timeout: float = 60
+    chunk_size: int = 1024 * 1024
+
+
+class LinkParser(HTMLParser):
+    def __init__(self, base_url: str):
+        super().__init__()
+        self.base_url = base_url
+        self.links: List[Link] = []
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        a = dict(attrs)
+        if tag != "a" or not (href := a.get("href")):
+            return
+
+        url, _, fragment = urllib.parse.urljoin(self.base_url, href).partition("#")
+        hash_name, _, hash_value = fragment.partition("=")
+        filename = urllib.parse.unquote(urllib.parse.urlsplit(url).path).split("/")[-1]
+
+        self.links.append(
+            Link(
+                filename=filename,
+                url=url,
+                hash=Hash(hash_name, hash_value) if hash_value else None,
+                requires_python=a.get("data-requires-python"),
+            )
+        )
+
+
+def parse_requirement(requirement: str) -> Tuple[str, Optional[str]]:
+    name, _, version = requirement.partition("==")
+    return name.strip(), version.strip() or None
+
+
+def mirror_packages(
+    cfg: Config,
+    requirements: List[str],
+    mirror: MirrorConfig = MirrorConfig(),
+    put_root_index: bool = False,
+    progress: Optional[Progress] = None,
+) -> None:
+    storage = build_storage(cfg)
+    throttle = TokenBucket(mirror.max_bandwidth) if mirror.max_bandwidth else None
+
+    def transfer(directory: str, link: Link) -> Tuple[str, StagedFile]:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / link.filename
+            sha256 = fetch_file(link, path, mirror, throttle)
+            check_archive(path)
+            metadata = file_metadata(path)
+            metadata.requires_python = link.requires_python or metadata.requires_python
+
+            log.info("Uploading %s", link.filename)
+            location = put_distribution(storage, directory, path, sha256, progress)
+        return link.filename, StagedFile(sha256, metadata, location)
+
+    # Resolve all requirements first, so that an unknown package doesn't abort
+    # the mirror after other files were already uploaded.
+    missing: Dict[str, List[Link]] = {}
+    for requirement in requirements:
+        name, version = parse_requirement(requirement)
+        directory = normalize_package_name(name)
+
+        # Skip files that aren't sdists or wheels, like eggs and installers.
+        links = [
+            link
+            for link in fetch_links(mirror, directory)
+            if (v := _version(link.filename)) and version in (None, v)
+        ]
+        if not links:
+            raise S3PyPiError(f"No files found upstream for: {requirement}")
+
+        existing = storage.get_index(directory).filenames
+        new_links = [link for link in links if link.filename not in existing]
+        if not new_links:
+            log.info("%s is up to date", requirement)
+        missing.setdefault(directory, []).extend(new_links)
+
+    pending: Dict[str, Dict[Future, Link]] = {}
+    failures = 0
+
+    with ThreadPoolExecutor(max_workers=mirror.concurrency) as executor:
+        for directory, links in missing.items():
+            pending[directory] = {
+                executor.submit(transfer, directory, link): link for link in links
+            }
+
+        for directory, futures in pending.items():
+            uploaded = []
+            for future, link in futures.items():
+                try:
+                    uploaded.append(future.result())
+                except (
+                    OSError,
+                    S3PyPiError,
+                    boto3.exceptions.S3UploadFailedError,
+                    botocore.exceptions.BotoCoreError,
+                    botocore.exceptions.ClientError,
+                ) as e:
+                    log.error("Failed to mirror %s: %s", link.url, e)
+                    failures += 1
+
+            if not uploaded:
+                continue
+            try:
+                commit_uploads(storage, directory, dict(uploaded))
+            except (
+                S3PyPiError,
+                botocore.exceptions.BotoCoreError,
+                botocore.exceptions.ClientError,
+            ) as e:
+                # Keep committing the other packages.
+                log.error("Failed to update the index of %s: %s", directory, e)
+                failures += len(uploaded)
+
+    if put_root_index:
+        update_root_index(storage)
+    storage.invalidate_cache()
+    storage.compact_journal()
+
+    if failures:
+        raise S3PyPiError(f"Failed to mirror {failures} files")
+
+
+def fetch_links(mirror: MirrorConfig, directory: str) -> List[Link]:
+    url = urllib.parse.urljoin(mirror.index_url.rstrip("/") + "/", f"{directory}/")
+    log.debug("Fetching %s", url)
+    try:
+        with _open(url, mirror) as response:
+            html = response.read().decode()
+    except OSError as e:
+        raise S3PyPiError(f"Failed to fetch {url}: {e}") from e
+
+    parser = LinkParser(url)
+    parser.feed(html)
+    return parser.links
+
+
+def fetch_file(
+    link: Link,
+    dest: Path,
+    mirror: MirrorConfig,
+    throttle: Optional[TokenBucket] = None,
+) -> Hash:
+    """Download a file while computing its SHA-256 and verifying the upstream hash."""
+    sha256 = hashlib.sha256()
+    expected = None
+    if link.hash:
+        try:
+            expected = hashlib.new(link.hash.name)
+        except ValueError:
+            raise S3PyPiError(f"Unsupported hash for {link.filename}: {link.hash.name}")
+
+    log.info("Downloading %s", link.url)
+    received = 0
+    with _open(link.url, mirror) as response, open(dest, "wb") as f:
+        length = response.headers.get("Content-Length")
+        try:
+            while block := response.read(mirror.chunk_size):
+                if throttle:
+                    throttle.acquire(len(block))
+                received += len(block)
+                sha256.update(block)
+                if expected:
+                    expected.update(block)
+                f.write(block)
+        except http.client.HTTPException as e:  # E.g. IncompleteRead.
+            raise S3PyPiError(f"Failed to download {link.filename}: {e!r}") from e
+
+    if length is not None and received != int(length):
+        raise S3PyPiError(
+            f"Incomplete download of {link.filename}: "
+            f"received {received} of {length} bytes"
+        )
+
+    if link.hash and expected and expected.hexdigest() != link.hash.value:
+        raise S3PyPiError(
+            f"Hash mismatch for {link.filename}: expected "
+            f"{link.hash.name}={link.hash.value}, got {expected.hexdigest()}"
+        )
+    return Hash("sha256", sha256.hexdigest())
+
+
+def _open(url: str, mirror: MirrorConfig) -> Any:
+    request = urllib.request.Request(
+        url, headers={"User-Agent": f"{__prog__}/{__version__}"}
+    )
+    return urllib.request.urlopen(request, timeout=mirror.timeout)
+
+
+def _version(filename: str) -> Optional[str]:
+    with suppress(S3PyPiError, ValueError):
+        return parse_distribution_id(filename).version
+    return None
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+"""Run many concurrent publishers against one repository and check the result.
+
+Each process repeatedly uploads new versions of randomly chosen packages, and
+sometimes deletes one of its earlier versions. Fewer packages means more
+processes compete for the same index locks. At the end, every index is
+compared with the operations that succeeded, to detect lost or stale entries.
+
+By default a local moto server is started, which requires `moto[server]`:
+
+    $ python scripts/load-test.py -n 16 --packages 4 --file-size 256K
+
+Use `--endpoint-url` to run against another server that provides both S3 and
+DynamoDB, or `--local-dir` to test `fcntl` locking instead.
+"""
+import argparse
+import io
+import os
+import random
+import statistics
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from multiprocessing import get_context
+from pathlib import Path
+from typing import List, Optional, Set, Tuple
+
+from s3pypi import core
+from s3pypi.__main__ import byte_size
+from s3pypi.exceptions import S3PyPiError
+from s3pypi.storage import S3Config
+
+BUCKET = "s3pypi-load-test"
+EXTENSIONS = [".tar.gz", "-py3-none-any.whl", ".zip"]
+
+
+@dataclass
+class Options:
+    processes: int
+    operations: int
+    packages: int
+    files: int
+    file_size: int
+    delete_ratio: float
+    endpoint_url: Optional[str]
+    local_dir: Optional[Path]
+
+
+@dataclass
+class Result:
+    uploads: int = 0
+    deletes: int = 0
+    failures: int = 0
+    bytes: int = 0
+    present: Set[Tuple[str, str]] = field(default_factory=set)
+    lock_waits: List[float] = field(default_factory=list)
+    lock_holds: List[float] = field(default_factory=list)
+    lock_timeouts: int = 0
+
+
+def build_config(opts: Options) -> core.Config:
+    return core.Config(
+        s3=S3Config(
+            bucket=BUCKET,
+            endpoint_url=opts.endpoint_url,
+            locks_table=f"{BUCKET}-locks" if not opts.local_dir else None,
+        ),
+        local_dir=opts.local_dir,
+    )
+
+
+def package_name(i: int) -> str:
+    return f"load_test_{i}"
+
+
+def write_archive(path: Path, data: bytes) -> None:
+    """Write an archive that passes the upload checks, with `data` as content."""
+    if path.name.endswith(".tar.gz"):
+        with tarfile.open(path, "w:gz", compresslevel=1) as tf:
+            info = tarfile.TarInfo("data")
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+    else:
+        with zipfile.ZipFile(path, "w") as zf:
+            zf.writestr("data", data)
+
+
+def publisher(worker: int, opts: Options) -> Result:
+    rng = random.Random(worker)
+    cfg = build_config(opts)
+    storage = core.build_storage(cfg)
+    result = Result()
+
+    def record(lock_id: str, key: str, wait: float, hold: Optional[float]) -> None:
+        result.lock_waits.append(wait)
+        if hold is None:
+            result.lock_timeouts += 1
+        else:
+            result.lock_holds.append(hold)
+
+    storage.lock._record = record  # type: ignore
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for i in range(opts.operations):
+            if result.present and rng.random() < opts.delete_ratio:
+                name, version = rng.choice(sorted(result.present))
+                try:
+                    core.delete_package(cfg, name, version, storage=storage)
+                except S3PyPiError:
+                    result.failures += 1
+                else:
+                    result.present.discard((name, version))
+                    result.deletes += 1
+                continue
+
+            name = package_name(rng.randrange(opts.packages))
+            version = f"{worker}.{i}"
+            paths = []
+            for ext in EXTENSIONS[: opts.files]:
+                path = Path(tmp_dir) / f"{name}-{version}{ext}"
+                write_archive(path, os.urandom(opts.file_size))
+                paths.append(path)
+            try:
+                core.upload_packages(cfg, paths, strict=True, storage=storage)
+            except S3PyPiError:
+                result.failures += 1
+            else:
+                result.present.add((name, version))
+                result.uploads += 1
+                result.bytes += opts.file_size * len(paths)
+            for path in paths:
+                path.unlink()
+
+    return result
+
+
+def check_consistency(opts: Options, present: Set[Tuple[str, str]]) -> int:
+    storage = core.build_storage(build_config(opts))
+    problems = 0
+
+    for i in range(opts.packages):
+        name = package_name(i)
+        directory = core.normalize_package_name(name)
+        found = {
+            core.parse_distribution_id(f).version
+            for f in storage.get_index(directory).filenames
+        }
+        expected = {version for n, version in present if n == name}
+
+        if lost := expected - found:
+            print(f"  {directory}: {len(lost)} lost versions: {sorted(lost)}")
+        if stale := found - expected:
+            print(f"  {directory}: {len(stale)} stale versions: {sorted(stale)}")
+        problems += len(lost) + len(stale)
+
+    if catalog := storage.get_catalog():
+        for directory, project in catalog.projects.items():
+            if project.files != len(storage.get_index(directory).filenames):
+                print(f"  catalog: wrong file count for {directory}")
+                problems += 1
+
+    return problems
+
+
+def percentiles(values: List[float]) -> str:
+    if len(values) < 2:
+        return "n/a"
+    q = statistics.quantiles(values, n=100, method="inclusive")
+    return (
+        f"p50 {q[49]:.3f}s  p90 {q[89]:.3f}s  p99 {q[98]:.3f}s  "
+        f"max {max(values):.3f}s"
+    )
+
+
+def report(results: List[Result], elapsed: float) -> None:
+    total = Result()
+    for r in results:
+        total.uploads += r.uploads
+        total.deletes += r.deletes
+        total.failures += r.failures
+        total.bytes += r.bytes
+        total.present |= r.present
+        total.lock_waits += r.lock_waits
+        total.lock_holds += r.lock_holds
+        total.lock_timeouts += r.lock_timeouts
+
+    ops = total.uploads + total.deletes
+    print(f"Duration:      {elapsed:.1f}s")
+    print(
+        f"Operations:    {ops} ({total.uploads} uploads, {total.deletes} deletes, "
+        f"{total.failures} failed)"
+    )
+    print(
+        f"Throughput:    {ops / elapsed:.1f} ops/s, "
+        f"{total.bytes / elapsed / 1024**2:.2f} MiB/s"
+    )
+    print(f"Lock waits:    {percentiles(total.lock_waits)}")
+    print(f"Lock holds:    {percentiles(total.lock_holds)}")
+    print(f"Lock timeouts: {total.lock_timeouts}")
+
+
+def setup_aws(opts: Options) -> None:
+    import boto3
+
+    s3 = boto3.resource("s3", endpoint_url=opts.endpoint_url)
+    bucket = s3.Bucket(BUCKET)
+    bucket.create()
+
+    db = boto3.resource("dynamodb", endpoint_url=opts.endpoint_url)
+    db.create_table(
+        TableName=f"{BUCKET}-locks",
+        AttributeDefinitions=[{"AttributeName": "LockID", "AttributeType": "S"}],
+        KeySchema=[{"AttributeName": "LockID", "KeyType": "HASH"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    p.add_argument("-n", "--processes", type=int, default=8)
+    p.add_argument(
+        "-o",
+        "--operations",
+        type=int,
+        default=20,
+        help="Uploads and deletes per process (default: %(default)s).",
+    )
+    p.add_argument(
+        "--packages",
+        type=int,
+        default=4,
+        help="Number of package names shared by all processes (default: %(default)s).",
+    )
+    p.add_argument(
+        "--files",
+        type=int,
+        choices=range(1, len(EXTENSIONS) + 1),
+        default=2,
+        help="Files per upload (default: %(default)s).",
+    )
+    p.add_argument(
+        "--file-size",
+        type=byte_size,
+        default=16 * 1024,
+        help="Size of each file, e.g. '1M' (default: %(default)s bytes).",
+    )
+    p.add_argument(
+        "--delete-ratio",
+        type=float,
+        default=0.2,
+        help="Fraction of operations that delete a version (default: %(default)s).",
+    )
+    g = p.add_mutually_exclusive_group()
+    g.add_argument("--endpoint-url", help="Use a running S3 and DynamoDB server.")
+    g.add_argument("--local-dir", type=Path, help="Use a local directory.")
+    p.add_argument("--moto-port", type=int, default=5000)
+    args = p.parse_args()
+
+    opts = Options(
+        processes=args.processes,
+        operations=args.operations,
+        packages=args.packages,
+        files=args.files,
+        file_size=args.file_size,
+        delete_ratio=args.delete_ratio,
+        endpoint_url=args.endpoint_url,
+        local_dir=args.local_dir,
+    )
+
+    server = None
+    if not opts.local_dir:
+        for key in ["AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"]:
+            os.environ.setdefault(key, "testing")
+        os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+        if not opts.endpoint_url:
+            from moto.server import ThreadedMotoServer
+
+            server = ThreadedMotoServer(port=args.moto_port, verbose=False)
+            server.start()
+            opts.endpoint_url = f"http://127.0.0.1:{args.moto_port}"
+        # Also used by the DynamoDB locker, which has no endpoint option.
+        os.environ["AWS_ENDPOINT_URL"] = opts.endpoint_url
+        setup_aws(opts)
+
+    try:
+        start = time.monotonic()
+        with ProcessPoolExecutor(opts.processes, mp_context=get_context("spawn")) as ex:
+            results = list(
+                ex.map(publisher, range(opts.processes), [opts] * opts.processes)
+            )
+        elapsed = time.monotonic() - start
+
+        report(results, elapsed)
+        present = set().union(*(r.present for r in results))
+        problems = check_consistency(opts, present)
+        print(f"Consistency:   {'OK' if not problems else f'{problems} problems'}")
+    finally:
+        if server:
+            server.stop()
+
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
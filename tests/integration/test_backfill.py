@@ -0,0 +1,41 @@
+import hashlib
+import logging
+
+from s3pypi.__main__ import main as s3pypi
+from s3pypi.index import Hash, Index
+
+WHEEL = "hello_world-0.1.0-py3-none-any.whl"
+
+
+def test_backfill_metadata(chdir, data_dir, s3_bucket, tmp_path, caplog):
+    with chdir(data_dir):
+        s3pypi("upload", "dists/*", "--bucket", s3_bucket.name, "--put-root-index")
+
+    caplog.set_level(logging.INFO)
+    s3pypi("backfill-metadata", "--bucket", s3_bucket.name)
+
+    expected = (data_dir / "dists" / WHEEL).read_bytes()
+    metadata = s3_bucket.Object(f"hello-world/{WHEEL}.metadata").get()["Body"].read()
+    assert metadata.startswith(b"Metadata-Version: 2.1\nName: hello-world\n")
+    assert len(metadata) < len(expected)
+
+    index = Index.parse(s3_bucket.Object("hello-world/").get()["Body"].read().decode())
+    sha256 = hashlib.sha256(metadata).hexdigest()
+    assert index.metadata[WHEEL].core_metadata == Hash("sha256", sha256)
+    assert not index.metadata["hello_world-0.1.0.tar.gz"].core_metadata
+
+    extracted = [r for r in caplog.records if r.message.startswith("Extracted")]
+    assert len(extracted) == 1
+
+    # Synced copies include the metadata files referenced by the index.
+    s3pypi("sync-down", str(tmp_path), "--bucket", s3_bucket.name)
+    assert (tmp_path / "hello-world" / f"{WHEEL}.metadata").read_bytes() == metadata
+
+    # Already backfilled files are skipped.
+    caplog.clear()
+    s3pypi("backfill-metadata", "hello-world", "--bucket", s3_bucket.name)
+    assert not [r for r in caplog.records if r.message.startswith("Extracted")]
+
+    s3pypi("delete", "hello-world", "0.1.0", "--bucket", s3_bucket.name)
+    keys = {obj.key for obj in s3_bucket.objects.filter(Prefix="hello-world/")}
+    assert not keys
@@ -0,0 +1,143 @@
+import datetime as dt
+import logging
+import time
+
+import pytest
+
+from s3pypi import blobs, core
+from s3pypi.__main__ import main as s3pypi
+from s3pypi.index import Index
+from s3pypi.storage import S3Config
+
+WHEEL = "hello_world-0.1.0-py3-none-any.whl"
+
+
+def get_index(bucket, key):
+    return Index.parse(bucket.Object(key).get()["Body"].read().decode())
+
+
+def blob_keys(bucket):
+    return sorted(o.key for o in bucket.objects.filter(Prefix=".blobs/"))
+
+
+def test_blob_store_shares_files_between_prefixes(chdir, data_dir, s3_bucket, caplog):
+    with chdir(data_dir):
+        for prefix in ["team-a", "team-b"]:
+            s3pypi(
+                "upload",
+                "dists/*",
+                "--bucket",
+                s3_bucket.name,
+                "--prefix",
+                prefix,
+                "--blob-store",
+            )
+
+    keys = blob_keys(s3_bucket)
+    assert len(keys) == 4
+    assert not list(s3_bucket.objects.filter(Prefix=f"team-a/hello-world/{WHEEL}"))
+
+    index = get_index(s3_bucket, "team-b/hello-world/")
+    href = index.hrefs[WHEEL]
+    assert href.startswith("../../.blobs/sha256/")
+    assert f".blobs/{href.split('.blobs/')[1]}" in keys
+
+    # Blobs stay until no index links to them anymore.
+    caplog.set_level(logging.INFO)
+    args = ["--bucket", s3_bucket.name, "--grace-period", "0"]
+    s3pypi(
+        "delete",
+        "hello-world",
+        "0.1.0",
+        "--bucket",
+        s3_bucket.name,
+        "--prefix",
+        "team-a",
+    )
+    s3pypi("gc", *args)
+    assert blob_keys(s3_bucket) == keys
+
+    s3pypi(
+        "delete",
+        "hello-world",
+        "0.1.0",
+        "--bucket",
+        s3_bucket.name,
+        "--prefix",
+        "team-b",
+    )
+    s3pypi("gc", *args, "--dry-run")
+    assert blob_keys(s3_bucket) == keys
+
+    s3pypi("gc", "--bucket", s3_bucket.name)
+    assert blob_keys(s3_bucket) == keys  # Within the grace period.
+
+    s3pypi("gc", *args)
+    assert len(blob_keys(s3_bucket)) == 2
+    assert "Found 2 unused of 4 blob files in 4 index pages" in caplog.messages
+
+
+def test_blob_store_gc_keeps_reused_blobs(data_dir, s3_bucket, monkeypatch):
+    dist = data_dir / "dists" / WHEEL
+    cfg = core.Config(S3Config(s3_bucket.name, prefix="team-a", blob_store=True))
+    core.upload_packages(cfg, [dist, data_dir / "dists" / "foo-0.1.0.tar.gz"])
+    s3pypi("delete", "hello-world", "0.1.0", "-b", s3_bucket.name, "--prefix", "team-a")
+    time.sleep(2)
+
+    # The blob is reused while gc is reading the index pages.
+    decompress = blobs.decompress
+
+    def reuse_blob(*args, **kwargs):
+        team_b = core.Config(S3Config(s3_bucket.name, prefix="team-b", blob_store=True))
+        core.upload_packages(team_b, [dist])
+        monkeypatch.setattr(blobs, "decompress", decompress)
+        return decompress(*args, **kwargs)
+
+    monkeypatch.setattr(blobs, "decompress", reuse_blob)
+    garbage = blobs.collect_garbage(cfg, grace_period=dt.timedelta(seconds=1))
+
+    assert garbage == []
+    href = get_index(s3_bucket, "team-b/hello-world/").hrefs[WHEEL]
+    assert f".blobs/{href.split('.blobs/')[1]}" in blob_keys(s3_bucket)
+
+
+def test_blob_store_promote_is_index_only(chdir, data_dir, s3_bucket):
+    with chdir(data_dir):
+        s3pypi("upload", "dists/*", "--bucket", s3_bucket.name, "--blob-store")
+    s3pypi("backfill-metadata", "--bucket", s3_bucket.name)
+    keys = blob_keys(s3_bucket)
+    assert any(key.endswith(f"{WHEEL}.metadata") for key in keys)
+
+    s3pypi(
+        "promote",
+        "hello-world",
+        "0.1.0",
+        "--bucket",
+        s3_bucket.name,
+        "--to-prefix",
+        "stable",
+        "--blob-store",
+    )
+
+    assert blob_keys(s3_bucket) == keys
+    assert not list(s3_bucket.objects.filter(Prefix=f"stable/hello-world/{WHEEL}"))
+    index = get_index(s3_bucket, "stable/hello-world/")
+    assert index.hrefs[WHEEL].startswith("../../.blobs/sha256/")
+    assert index.metadata[WHEEL].core_metadata
+
+
+def test_blob_store_sync_down(chdir, data_dir, s3_bucket, tmp_path):
+    with chdir(data_dir):
+        s3pypi("upload", f"dists/{WHEEL}", "-b", s3_bucket.name, "--blob-store")
+
+    s3pypi("sync-down", str(tmp_path), "hello-world", "--bucket", s3_bucket.name)
+
+    expected = (data_dir / "dists" / WHEEL).read_bytes()
+    assert (tmp_path / "hello-world" / WHEEL).read_bytes() == expected
+    index = Index.parse((tmp_path / "hello-world" / "index.html").read_text())
+    assert not index.hrefs
+
+
+def test_blob_store_requires_s3(tmp_path):
+    with pytest.raises(SystemExit, match="only supported in S3"):
+        s3pypi("gc", "--local-dir", str(tmp_path))
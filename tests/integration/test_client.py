@@ -0,0 +1,45 @@
+from s3pypi import core
+from s3pypi.client import S3PyPi
+
+
+def test_client(data_dir, s3_bucket, monkeypatch):
+    client = S3PyPi.for_bucket(s3_bucket.name)
+
+    build_storage = core.build_storage
+    calls = []
+    monkeypatch.setattr(
+        core,
+        "build_storage",
+        lambda *args, **kw: calls.append(args) or build_storage(*args, **kw),
+    )
+
+    dists = data_dir / "dists"
+    client.upload(list(dists.glob("*")), put_root_index=True)
+    client.delete("xyz", "0.1.0")
+
+    assert not calls
+    assert client.list_packages() == ["foo", "hello-world"]
+    assert client.list_files("hello_world") == [
+        "hello_world-0.1.0-py3-none-any.whl",
+        "hello_world-0.1.0.tar.gz",
+    ]
+    assert client.list_files("foo", version="0.2.0") == []
+
+
+def test_client_index_cache(data_dir, s3_bucket):
+    client = S3PyPi.for_bucket(s3_bucket.name)
+    client.upload([data_dir / "dists" / "foo-0.1.0.tar.gz"])
+
+    requests = []
+    client.storage.s3.meta.client.meta.events.register(
+        "provide-client-params.s3.GetObject",
+        lambda params, **kw: requests.append(params.get("IfNoneMatch")),
+    )
+
+    index = client.get_index("foo")
+    index.filenames.clear()  # Callers get a copy of the cached index.
+    assert list(client.get_index("foo").filenames) == ["foo-0.1.0.tar.gz"]
+    assert all(requests)
+
+    s3_bucket.Object("foo/").delete()
+    assert client.get_index("foo").filenames == {}
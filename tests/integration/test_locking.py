@@ -31,3 +31,24 @@ def test_dynamodb_lock_timeout(dynamodb_table):
         with pytest.raises(DynamoDBLockTimeoutError):
             with lock(key):
                 pass
+
+
+def test_dynamodb_lock_stats(dynamodb_table):
+    cfg = LockerConfig(retry_delay=0, max_attempts=1, record_stats=True)
+    lock = DynamoDBLocker(dynamodb_table, owner="pytest", cfg=cfg)
+
+    with lock("example"):
+        (held,) = lock.list_locks()
+        assert (held.key, held.owner) == ("example", "pytest")
+
+        with pytest.raises(DynamoDBLockTimeoutError):
+            with lock("example"):
+                pass
+
+    with lock("example"):
+        pass
+
+    assert lock.list_locks() == []
+    (stats,) = lock.list_stats()
+    assert (stats.key, stats.acquisitions, stats.timeouts) == ("example", 2, 1)
+    assert stats.lock_id == held.lock_id
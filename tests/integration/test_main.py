@@ -1,10 +1,15 @@
+import json
 import logging
+import zipfile
 
 import pytest
 
-from s3pypi import __prog__
-from s3pypi.__main__ import main as s3pypi, string_dict
+from s3pypi import __prog__, core
+from s3pypi.__main__ import byte_size, main as s3pypi, string_dict
+from s3pypi.catalog import Catalog, Project
+from s3pypi.exceptions import S3PyPiError
 from s3pypi.index import Hash, Index
+from s3pypi.transaction import TransactionLog
 
 
 @pytest.mark.parametrize(
@@ -20,6 +25,14 @@ def test_string_dict(text, expected):
     assert string_dict(text) == expected
 
 
+@pytest.mark.parametrize(
+    "text, expected",
+    [("1234", 1234), ("10K", 10240), ("1.5M", 1572864), ("2GB", 2147483648)],
+)
+def test_byte_size(text, expected):
+    assert byte_size(text) == expected
+
+
 @pytest.mark.parametrize("prefix", ["", "packages", "packages/abc"])
 def test_main_upload_package(chdir, data_dir, s3_bucket, dynamodb_table, prefix):
     args = ["dists/*", "--bucket", s3_bucket.name, "--put-root-index"]
@@ -45,6 +58,22 @@ def test_main_upload_package(chdir, data_dir, s3_bucket, dynamodb_table, prefix)
     assert_pkg_exists("xyz", "xyz-0.1.0.zip")
 
 
+def test_main_upload_package_local_dir(chdir, data_dir, tmp_path):
+    repo = tmp_path / "repo"
+
+    with chdir(data_dir):
+        s3pypi("upload", "dists/*", "--local-dir", str(repo), "--put-root-index")
+    s3pypi("delete", "xyz", "0.1.0", "--local-dir", str(repo))
+
+    assert (repo / "foo" / "foo-0.1.0.tar.gz").exists()
+    assert ">foo-0.1.0.tar.gz</a>" in (repo / "foo" / "index.html").read_text()
+    assert not (repo / "xyz" / "xyz-0.1.0.zip").exists()
+
+    root_index = (repo / "index.html").read_text()
+    assert ">hello-world</a>" in root_index
+    assert ">xyz</a>" not in root_index
+
+
 def test_main_upload_package_exists(chdir, data_dir, s3_bucket, caplog):
     dist = "dists/foo-0.1.0.tar.gz"
 
@@ -64,6 +93,22 @@ def test_main_upload_package_exists(chdir, data_dir, s3_bucket, caplog):
     assert caplog.record_tuples == [success, warning, warning, success]
 
 
+def test_main_upload_corrupt_archive(data_dir, s3_bucket, tmp_path):
+    wheel = data_dir / "dists" / "hello_world-0.1.0-py3-none-any.whl"
+    corrupt = tmp_path / "foo-0.1.0-py3-none-any.whl"
+    corrupt.write_bytes(wheel.read_bytes()[:-100])
+    txlog = tmp_path / "upload.jsonl"
+    txlog.write_text('{"event": "committed", "directory": "foo"}\n')
+    args = ["--bucket", s3_bucket.name, "--transaction-log", str(txlog)]
+
+    with pytest.raises(SystemExit, match="Invalid archive foo-0.1.0-py3-none-any.whl"):
+        s3pypi("upload", str(wheel), str(corrupt), *args)
+
+    # Nothing is uploaded if any file is invalid, and no log is left behind.
+    assert not list(s3_bucket.objects.all())
+    assert not txlog.exists()
+
+
 @pytest.mark.parametrize(
     ["dists", "error_msg"],
     [
@@ -108,6 +153,28 @@ def test_main_upload_package_with_force_updates_hash(chdir, data_dir, s3_bucket)
     }
 
 
+def test_main_upload_package_metadata(chdir, tmp_path, s3_bucket):
+    dist = tmp_path / "foo-0.2.0-py3-none-any.whl"
+    with zipfile.ZipFile(dist, "w") as zf:
+        zf.writestr("foo/__init__.py", "")
+        zf.writestr(
+            "foo-0.2.0.dist-info/METADATA",
+            "Metadata-Version: 2.1\nName: foo\nVersion: 0.2.0\n"
+            "Requires-Python: >=3.8\n",
+        )
+
+    with chdir(tmp_path):
+        s3pypi("upload", dist.name, "--bucket", s3_bucket.name)
+
+    html = s3_bucket.Object("foo/").get()["Body"].read().decode()
+    metadata = Index.parse(html).metadata[dist.name]
+
+    assert 'data-requires-python="&gt;=3.8"' in html
+    assert metadata.requires_python == ">=3.8"
+    assert metadata.size == dist.stat().st_size
+    assert metadata.upload_time
+
+
 def test_main_delete_package(chdir, data_dir, s3_bucket):
     with chdir(data_dir):
         s3pypi("upload", "dists/*", "--bucket", s3_bucket.name, "--put-root-index")
@@ -137,5 +204,258 @@ def test_main_delete_package(chdir, data_dir, s3_bucket):
     assert_pkg_exists("xyz", "xyz-0.1.0.zip")
 
 
+def test_main_promote_package(chdir, data_dir, s3_bucket):
+    with chdir(data_dir):
+        s3pypi("upload", "dists/*", "--bucket", s3_bucket.name, "--prefix", "staging")
+
+    s3pypi(
+        "promote",
+        "hello-world",
+        "0.1.0",
+        "--bucket",
+        s3_bucket.name,
+        "--prefix",
+        "staging",
+        "--to-prefix",
+        "prod",
+    )
+
+    def get_index(key: str) -> Index:
+        return Index.parse(s3_bucket.Object(key).get()["Body"].read().decode())
+
+    staging, prod = get_index("staging/hello-world/"), get_index("prod/hello-world/")
+    assert prod == staging
+    for filename in prod.filenames:
+        assert (
+            s3_bucket.Object(f"prod/hello-world/{filename}").get()["Body"].read()
+            == (data_dir / "dists" / filename).read_bytes()
+        )
+
+    with pytest.raises(s3_bucket.meta.client.exceptions.NoSuchKey):
+        s3_bucket.Object("prod/foo/").get()
+
+
+def test_main_promote_package_conflict(chdir, data_dir, s3_bucket):
+    wheel = "hello_world-0.1.0-py3-none-any.whl"
+    with chdir(data_dir):
+        s3pypi("upload", "dists/*", "--bucket", s3_bucket.name, "--prefix", "staging")
+    s3_bucket.put_object(Key=f"prod/hello-world/{wheel}", Body=b"other")
+    index = Index({wheel: Hash.of_bytes("sha256", b"other")})
+    s3_bucket.Object("prod/hello-world/").put(Body=index.to_html())
+    args = ["hello-world", "0.1.0", "-b", s3_bucket.name, "--prefix", "staging"]
+
+    with pytest.raises(SystemExit, match=f"{wheel} already exists"):
+        s3pypi("promote", *args, "--to-prefix", "prod")
+    assert (
+        s3_bucket.Object(f"prod/hello-world/{wheel}").get()["Body"].read() == b"other"
+    )
+
+    s3pypi("promote", *args, "--to-prefix", "prod", "--force")
+    body = s3_bucket.Object(f"prod/hello-world/{wheel}").get()["Body"].read()
+    assert body == (data_dir / "dists" / wheel).read_bytes()
+    assert not list(s3_bucket.objects.filter(Prefix="prod/.s3pypi/staging/"))
+
+
+def test_main_locks(dynamodb_table, capsys):
+    dynamodb_table.put_item(
+        Item={
+            "LockID": "12345",
+            "Key": "hello-world",
+            "AcquiredAt": "2024-01-01T00:00:00+00:00",
+            "Owner": "pytest@localhost",
+        }
+    )
+
+    s3pypi("locks", dynamodb_table.name)
+
+    out = capsys.readouterr().out
+    assert "12345" in out
+    assert "hello-world" in out
+    assert "pytest@localhost" in out
+
+
 def test_main_force_unlock(dynamodb_table):
     s3pypi("force-unlock", dynamodb_table.name, "12345")
+
+
+def test_main_catalog(chdir, data_dir, s3_bucket):
+    def read_catalog():
+        body = s3_bucket.Object(".s3pypi/catalog.json").get()["Body"].read()
+        return Catalog.parse(body.decode())
+
+    with chdir(data_dir):
+        s3pypi("upload", "dists/foo-0.1.0.tar.gz", "--bucket", s3_bucket.name)
+        s3pypi(
+            "upload", "dists/xyz-0.1.0.zip", "-b", s3_bucket.name, "--put-root-index"
+        )
+        s3pypi("upload", "dists/hello_world-0.1.0.tar.gz", "--bucket", s3_bucket.name)
+
+    catalog = read_catalog()
+    etag = s3_bucket.Object("foo/").e_tag
+    assert catalog.projects["foo"] == Project(1, "0.1.0", etag)
+    assert set(catalog.projects) == {"foo", "hello-world", "xyz"}
+
+    s3pypi("delete", "xyz", "0.1.0", "--bucket", s3_bucket.name)
+    assert set(read_catalog().projects) == {"foo", "hello-world"}
+
+    # A missing catalog is rebuilt from a listing, skipping reserved prefixes.
+    s3_bucket.Object(".s3pypi/catalog.json").delete()
+    with chdir(data_dir):
+        s3pypi("upload", "dists/*.whl", "--bucket", s3_bucket.name, "--put-root-index")
+
+    assert set(read_catalog().projects) == {"foo", "hello-world"}
+    root_index = s3_bucket.Object("index.html").get()["Body"].read().decode()
+    assert set(Index.parse(root_index).filenames) == {"foo", "hello-world"}
+
+    # Root index updates only read the catalog, without listing the bucket.
+    catalog = read_catalog()
+    del catalog.projects["foo"]
+    catalog.projects["hello-world"] = Project(0, "", '"stale"')
+    s3_bucket.Object(".s3pypi/catalog.json").put(Body=catalog.to_json())
+    with chdir(data_dir):
+        s3pypi(
+            "upload", "dists/xyz-0.1.0.zip", "-b", s3_bucket.name, "--put-root-index"
+        )
+
+    assert set(read_catalog().projects) == {"hello-world", "xyz"}
+
+    # Entries that are missing or stale, e.g. after a failed update, are repaired.
+    s3pypi("repair-catalog", "--bucket", s3_bucket.name, "--put-root-index")
+
+    catalog = read_catalog()
+    assert set(catalog.projects) == {"foo", "hello-world", "xyz"}
+    assert (
+        catalog.projects["hello-world"].etag == s3_bucket.Object("hello-world/").e_tag
+    )
+    root_index = s3_bucket.Object("index.html").get()["Body"].read().decode()
+    assert set(Index.parse(root_index).filenames) == {"foo", "hello-world", "xyz"}
+
+
+def test_main_changes(chdir, data_dir, s3_bucket, capsys):
+    with chdir(data_dir):
+        s3pypi("upload", "dists/foo-0.1.0.tar.gz", "--bucket", s3_bucket.name)
+        s3pypi("upload", "dists/xyz-0.1.0.zip", "-b", s3_bucket.name, "--journal")
+    s3pypi("delete", "xyz", "0.1.0", "--bucket", s3_bucket.name)
+    capsys.readouterr()
+
+    s3pypi("changes", "--bucket", s3_bucket.name)
+    changes = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+    assert [(c["seq"], c["project"]) for c in changes] == [(1, "xyz"), (2, "xyz")]
+    assert list(changes[0]["added"]) == ["xyz-0.1.0.zip"]
+    assert changes[1]["removed"] == ["xyz-0.1.0.zip"]
+
+    s3pypi("changes", "--bucket", s3_bucket.name, "--since", "2")
+    assert capsys.readouterr().out == ""
+
+
+def test_main_list_and_show(chdir, data_dir, s3_bucket, capsys):
+    with chdir(data_dir):
+        s3pypi("upload", "dists/*", "--bucket", s3_bucket.name)
+    capsys.readouterr()
+
+    s3pypi("list", "--bucket", s3_bucket.name)
+    assert capsys.readouterr().out.split() == ["foo", "hello-world", "xyz"]
+
+    s3pypi("list", "--bucket", s3_bucket.name, "--latest", "--json")
+    projects = json.loads(capsys.readouterr().out)
+    assert projects["hello-world"] == {"latest_version": "0.1.0", "files": 2}
+
+    s3pypi("show", "hello_world", "--bucket", s3_bucket.name, "--json")
+    versions = json.loads(capsys.readouterr().out)["hello-world"]
+    assert list(versions) == ["0.1.0"]
+    assert [f["filename"] for f in versions["0.1.0"]] == [
+        "hello_world-0.1.0-py3-none-any.whl",
+        "hello_world-0.1.0.tar.gz",
+    ]
+    assert all(f["hash"].startswith("sha256=") for f in versions["0.1.0"])
+
+    with pytest.raises(SystemExit, match="Package not found: missing"):
+        s3pypi("show", "missing", "--bucket", s3_bucket.name)
+
+
+def test_main_upload_resume(chdir, data_dir, s3_bucket, tmp_path, monkeypatch, caplog):
+    txlog = tmp_path / "upload.jsonl"
+    args = ["dists/*", "--bucket", s3_bucket.name, "--transaction-log", str(txlog)]
+    commit_uploads = core.commit_uploads
+
+    def interrupted(storage, directory, *args, **kwargs):
+        if directory == "hello-world":
+            raise KeyboardInterrupt
+        return commit_uploads(storage, directory, *args, **kwargs)
+
+    monkeypatch.setattr(core, "commit_uploads", interrupted)
+    with chdir(data_dir), pytest.raises(KeyboardInterrupt):
+        s3pypi("upload", *args)
+    monkeypatch.undo()
+    assert txlog.exists()
+
+    keys = {o.key for o in s3_bucket.objects.all()}
+    staged = {k for k in keys if k.startswith(".s3pypi/staging/")}
+    assert keys - staged == {"foo/", "foo/foo-0.1.0.tar.gz"}
+    assert {k.rsplit("/", 1)[-1] for k in staged} == {
+        "hello_world-0.1.0.tar.gz",
+        "hello_world-0.1.0-py3-none-any.whl",
+    }
+
+    caplog.clear()
+    caplog.set_level(logging.INFO)
+    with chdir(data_dir):
+        s3pypi("upload", *args, "--resume")
+
+    assert "Resuming: 3 files were uploaded and 1 indexes committed" in caplog.messages
+    assert {m for m in caplog.messages if m.startswith(("Uploading", "Skipping"))} == {
+        "Skipping dists/hello_world-0.1.0.tar.gz (uploaded before)",
+        "Skipping dists/hello_world-0.1.0-py3-none-any.whl (uploaded before)",
+        "Uploading dists/xyz-0.1.0.zip",
+    }
+    assert not [r for r in caplog.records if r.levelno >= logging.WARNING]
+    index = Index.parse(s3_bucket.Object("hello-world/").get()["Body"].read().decode())
+    assert len(index.filenames) == 2
+    assert not list(s3_bucket.objects.filter(Prefix=".s3pypi/staging/"))
+    assert not txlog.exists()
+
+
+def test_main_upload_failure_removes_staged_files(
+    chdir, data_dir, s3_bucket, monkeypatch
+):
+    put_distribution = core.put_distribution
+    calls = []
+
+    def fail_on_second_file(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 2:
+            raise S3PyPiError("Upload failed")
+        return put_distribution(*args, **kwargs)
+
+    monkeypatch.setattr(core, "put_distribution", fail_on_second_file)
+    with chdir(data_dir), pytest.raises(SystemExit, match="Upload failed"):
+        s3pypi("upload", "dists/hello_world-0.1.0*", "--bucket", s3_bucket.name)
+
+    assert not list(s3_bucket.objects.all())
+
+
+def test_main_upload_resume_skips_uploaded_files(
+    chdir, data_dir, s3_bucket, tmp_path, caplog
+):
+    txlog = tmp_path / "upload.jsonl"
+    dist = "dists/foo-0.1.0.tar.gz"
+    args = [dist, "--bucket", s3_bucket.name, "--transaction-log", str(txlog)]
+
+    # Simulate a crash after staging the file, before updating the index.
+    sha256 = Hash.of("sha256", data_dir / dist)
+    location = ".s3pypi/staging/0123"
+    obj = s3_bucket.Object(f"{location}/foo-0.1.0.tar.gz")
+    obj.upload_file(str(data_dir / dist))
+    TransactionLog(txlog).uploaded(
+        "foo", obj.key.split("/")[-1], sha256, obj.e_tag, location
+    )
+
+    caplog.set_level(logging.INFO)
+    with chdir(data_dir):
+        s3pypi("upload", *args, "--resume")
+
+    assert caplog.messages[-1] == f"Skipping {dist} (uploaded before)"
+    index = Index.parse(s3_bucket.Object("foo/").get()["Body"].read().decode())
+    assert index.filenames == {"foo-0.1.0.tar.gz": sha256}
+    assert {o.key for o in s3_bucket.objects.all()} == {"foo/", "foo/foo-0.1.0.tar.gz"}
@@ -0,0 +1,119 @@
+import logging
+import zipfile
+
+import boto3
+import pytest
+
+from s3pypi import core, replicate
+from s3pypi.__main__ import main as s3pypi
+from s3pypi.exceptions import S3PyPiError
+from s3pypi.index import Index
+from s3pypi.storage import S3Config, S3Storage
+
+WHEEL = "hello_world-0.1.0-py3-none-any.whl"
+
+
+@pytest.fixture
+def dest_bucket(s3_bucket):
+    bucket = boto3.resource("s3").Bucket("s3pypi-replica")
+    bucket.create()
+    return bucket
+
+
+def copied(caplog):
+    return [r.message for r in caplog.records if r.message.startswith("Copying")]
+
+
+def test_replicate(chdir, data_dir, s3_bucket, dest_bucket, tmp_path, caplog):
+    with chdir(data_dir):
+        s3pypi("upload", "dists/*", "--bucket", s3_bucket.name, "--put-root-index")
+    s3pypi("backfill-metadata", "--bucket", s3_bucket.name)
+
+    caplog.set_level(logging.INFO)
+    args = ["--bucket", s3_bucket.name, "--to-bucket", dest_bucket.name]
+    s3pypi("replicate", *args, "--put-root-index")
+
+    src_keys = {o.key for o in s3_bucket.objects.all() if not o.key.startswith(".")}
+    dest_keys = {o.key for o in dest_bucket.objects.all() if not o.key.startswith(".")}
+    assert dest_keys == src_keys
+    assert f"hello-world/{WHEEL}.metadata" in dest_keys
+
+    # Unchanged projects are skipped without comparing their files.
+    caplog.clear()
+    s3pypi("replicate", *args)
+    assert not copied(caplog)
+
+    # Replaced files are copied again, others are left alone.
+    with zipfile.ZipFile(tmp_path / WHEEL, "w") as zf:
+        zf.writestr("rebuilt.txt", "")
+    s3pypi("upload", str(tmp_path / WHEEL), "--bucket", s3_bucket.name, "--force")
+
+    caplog.clear()
+    s3pypi("replicate", *args)
+    assert copied(caplog) == [f"Copying hello-world/{WHEEL}"]
+
+
+def test_replicate_ignores_stale_catalog(
+    chdir, data_dir, s3_bucket, dest_bucket, tmp_path, monkeypatch
+):
+    with chdir(data_dir):
+        s3pypi(
+            "upload", "dists/foo-0.1.0.tar.gz", "-b", s3_bucket.name, "--put-root-index"
+        )
+    args = ["--bucket", s3_bucket.name, "--to-bucket", dest_bucket.name]
+    s3pypi("replicate", *args)
+
+    def fail(self, directories):
+        raise S3PyPiError("Throttled")
+
+    # A new project, and a change to a project with a stale ETag in the catalog.
+    monkeypatch.setattr(S3Storage, "update_catalog", fail)
+    with chdir(data_dir):
+        s3pypi("upload", f"dists/{WHEEL}", "--bucket", s3_bucket.name)
+    with zipfile.ZipFile(tmp_path / "foo-0.2.0.zip", "w") as zf:
+        zf.writestr("foo.txt", "")
+    s3pypi("upload", str(tmp_path / "foo-0.2.0.zip"), "--bucket", s3_bucket.name)
+    monkeypatch.undo()
+
+    s3pypi("replicate", *args)
+    assert dest_bucket.Object(f"hello-world/{WHEEL}").get()
+    assert dest_bucket.Object("foo/foo-0.2.0.zip").get()
+
+
+def test_replicate_delete(chdir, data_dir, s3_bucket, dest_bucket):
+    with chdir(data_dir):
+        s3pypi("upload", "dists/*", "--bucket", s3_bucket.name)
+
+    args = ["--bucket", s3_bucket.name, "--to-bucket", dest_bucket.name]
+    s3pypi("replicate", *args)
+    s3pypi("delete", "hello-world", "0.1.0", "--bucket", s3_bucket.name)
+
+    s3pypi("replicate", *args)
+    assert dest_bucket.Object("hello-world/").get()  # Not deleted without --delete.
+
+    s3pypi("replicate", *args, "--delete")
+    keys = {o.key for o in dest_bucket.objects.filter(Prefix="hello-world/")}
+    assert not keys - {"hello-world/"}
+
+
+def test_replicate_to_local_dir(chdir, data_dir, s3_bucket, tmp_path):
+    with chdir(data_dir):
+        s3pypi("upload", f"dists/{WHEEL}", "--bucket", s3_bucket.name)
+
+    s3pypi("replicate", "--bucket", s3_bucket.name, "--to-local-dir", str(tmp_path))
+    expected = (data_dir / "dists" / WHEEL).read_bytes()
+    assert (tmp_path / "hello-world" / WHEEL).read_bytes() == expected
+    index = Index.parse((tmp_path / "hello-world" / "index.html").read_text())
+    assert list(index.filenames) == [WHEEL]
+
+
+def test_replicate_missing_file(s3_bucket, dest_bucket):
+    index = Index(filenames={WHEEL: None})
+    s3_bucket.Object("hello-world/").put(Body=index.to_html())
+
+    cfg = core.Config(S3Config(s3_bucket.name))
+    dest_cfg = core.Config(S3Config(dest_bucket.name))
+    with pytest.raises(S3PyPiError, match="Failed to copy 1 files"):
+        replicate.replicate(cfg, dest_cfg)
+
+    assert not list(dest_bucket.objects.filter(Prefix="hello-world/"))
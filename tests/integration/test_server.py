@@ -0,0 +1,131 @@
+import base64
+import hashlib
+import logging
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from s3pypi.index import Index
+from s3pypi.server import ServerConfig, UploadServer
+from s3pypi.storage import S3Config, S3Storage
+
+
+@pytest.fixture
+def upload_server(s3_bucket):
+    storage = S3Storage(S3Config(bucket=s3_bucket.name))
+    cfg = ServerConfig(port=0, batch_window=0.5, password="secret")
+    server = UploadServer(storage, cfg)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/legacy/"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def upload(
+    url: str,
+    filename: str,
+    content: bytes,
+    auth: str = "__token__:secret",
+    **fields: str,
+) -> int:
+    boundary = "s3pypi-test-boundary"
+    fields = {
+        ":action": "file_upload",
+        "name": filename.split("-")[0],
+        "sha256_digest": hashlib.sha256(content).hexdigest(),
+        **fields,
+    }
+    body = b"".join(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{k}"\r\n\r\n{v}\r\n'.encode()
+        for k, v in fields.items()
+    )
+    body += (
+        f"--{boundary}\r\nContent-Disposition: form-data; "
+        f'name="content"; filename="{filename}"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n"
+    ).encode()
+    body += content + f"\r\n--{boundary}--\r\n".encode()
+
+    request = urllib.request.Request(
+        url,
+        data=body,
+        headers={
+            "Authorization": f"Basic {base64.b64encode(auth.encode()).decode()}",
+            "Content-Type": f"multipart/form-data; boundary={boundary}",
+        },
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def test_upload_server_batches_index_updates(upload_server, s3_bucket, caplog):
+    caplog.set_level(logging.INFO)
+    files = {
+        f"foo-0.{i}.0.tar.gz": f"foo 0.{i}.0\r\n--not-a-boundary".encode() * 1000
+        for i in range(5)
+    }
+
+    with ThreadPoolExecutor(len(files)) as executor:
+        statuses = list(
+            executor.map(lambda item: upload(upload_server, *item), files.items())
+        )
+
+    assert statuses == [200] * len(files)
+
+    html = s3_bucket.Object("foo/").get()["Body"].read().decode()
+    index = Index.parse(html)
+    for filename, content in files.items():
+        assert s3_bucket.Object(f"foo/{filename}").get()["Body"].read() == content
+        assert index.filenames[filename].value == hashlib.sha256(content).hexdigest()
+
+    commits = [r.message for r in caplog.records if r.message.startswith("Commit")]
+    assert commits == ["Committing 5 files to foo"]
+
+
+def test_upload_server_rejects_invalid_uploads(upload_server):
+    assert upload(upload_server, "foo-0.1.0.tar.gz", b"foo") == 200
+    assert upload(upload_server, "foo-0.1.0.tar.gz", b"foo") == 409
+    assert upload(upload_server, "foo-0.2.0.tar.gz", b"x", sha256_digest="0") == 400
+    assert upload(upload_server, "foo-0.2.0.exe", b"foo") == 400
+
+
+def test_upload_server_checks_credentials(upload_server, s3_bucket):
+    assert upload(upload_server, "foo-0.1.0.tar.gz", b"foo", auth="bar:secret") == 401
+    assert upload(upload_server, "foo-0.1.0.tar.gz", b"foo", auth="__token__:x") == 401
+    assert list(s3_bucket.objects.all()) == []
+
+
+def test_upload_server_derives_directory_from_filename(upload_server, s3_bucket):
+    assert upload(upload_server, "foo_bar-0.1.0.tar.gz", b"x", name="Foo.Bar") == 200
+    assert upload(upload_server, "foo-0.1.0.tar.gz", b"x", name="../bar") == 400
+    assert upload(upload_server, "foo-0.1.0.tar.gz", b"x", name="bar") == 400
+    assert upload(upload_server, "_foo-0.1.0.tar.gz", b"x", name="_foo") == 400
+
+    keys = {obj.key for obj in s3_bucket.objects.all()}
+    assert keys == {"foo-bar/", "foo-bar/foo_bar-0.1.0.tar.gz"}
+
+
+def test_upload_server_detects_conflicting_uploads(upload_server, s3_bucket):
+    files = [("foo-0.1.0.tar.gz", b"a"), ("foo-0.1.0.tar.gz", b"b")]
+
+    with ThreadPoolExecutor(len(files)) as executor:
+        statuses = list(executor.map(lambda item: upload(upload_server, *item), files))
+
+    assert sorted(statuses) == [200, 409]
+
+    content = s3_bucket.Object("foo/foo-0.1.0.tar.gz").get()["Body"].read()
+    index = Index.parse(s3_bucket.Object("foo/").get()["Body"].read().decode())
+    assert statuses[files.index(("foo-0.1.0.tar.gz", content))] == 200
+    assert (
+        index.filenames["foo-0.1.0.tar.gz"].value == hashlib.sha256(content).hexdigest()
+    )
+    assert not [obj for obj in s3_bucket.objects.all() if "staging" in obj.key]
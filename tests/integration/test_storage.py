@@ -1,4 +1,7 @@
+import boto3
+import botocore
 import pytest
+from botocore.stub import ANY, Stubber
 
 from s3pypi.index import Index
 from s3pypi.storage import S3Config, S3Storage
@@ -17,6 +20,120 @@ def test_index_storage_roundtrip(s3_bucket):
     assert got == index
 
 
+def test_put_distribution_progress(s3_bucket, tmp_path):
+    dist = tmp_path / "foo-0.1.0.tar.gz"
+    dist.write_bytes(b"x" * 10000)
+    s = S3Storage(S3Config(bucket=s3_bucket.name, put_kwargs={"ACL": "private"}))
+
+    sent = []
+    s.put_distribution("foo", dist, sent.append)
+
+    assert sum(sent) == 10000
+    obj = s3_bucket.Object("foo/foo-0.1.0.tar.gz")
+    assert obj.content_type == "application/x-gzip"
+    assert obj.content_length == 10000
+
+
+def test_copy_distribution_falls_back_on_access_denied(s3_bucket):
+    boto3.resource("s3").Bucket("s3pypi-other").create()
+    s3_bucket.Object("foo/foo-0.1.0.tar.gz").put(Body=b"foo")
+    src = S3Storage(S3Config(bucket=s3_bucket.name))
+    dest = S3Storage(S3Config(bucket="s3pypi-other"))
+
+    def access_denied(**_):
+        error = {"Error": {"Code": "AccessDenied", "Message": "Access Denied"}}
+        raise botocore.exceptions.ClientError(error, "CopyObject")
+
+    dest.s3.meta.client.meta.events.register("before-call.s3.CopyObject", access_denied)
+    dest.copy_distribution(src, "foo", "foo-0.1.0.tar.gz")
+
+    assert dest.get_distribution("foo", "foo-0.1.0.tar.gz").read() == b"foo"
+
+
+def test_move_distribution_without_replacing(s3_bucket):
+    s = S3Storage(S3Config(bucket=s3_bucket.name))
+    s.copy_part_size = 5 * 1024**2
+    content = b"x" * (s.copy_part_size + 1)
+    staged = s3_bucket.Object(".s3pypi/staging/0123/foo-0.1.0.tar.gz")
+    staged.put(Body=content, ContentType="application/x-gzip")
+    headers = []
+    s.s3.meta.client.meta.events.register(
+        "before-send.s3.CompleteMultipartUpload",
+        lambda request, **_: headers.append(dict(request.headers)),
+    )
+
+    s.move_distribution(".s3pypi/staging/0123", "foo", "foo-0.1.0.tar.gz", False)
+
+    assert headers[0]["If-None-Match"] == b"*"
+    obj = s3_bucket.Object("foo/foo-0.1.0.tar.gz")
+    assert obj.get()["Body"].read() == content
+    assert obj.content_type == "application/x-gzip"
+    assert obj.e_tag.endswith('-2"')  # Copied in two parts.
+    assert not list(s3_bucket.objects.filter(Prefix=".s3pypi/staging/"))
+
+
+def test_touch_large_distribution(s3_bucket):
+    s = S3Storage(S3Config(bucket=s3_bucket.name))
+    s.max_copy_size = 0  # Too large for CopyObject.
+    s3_bucket.Object("foo/foo-0.1.0.tar.gz").put(Body=b"foo")
+    before = s3_bucket.Object("foo/foo-0.1.0.tar.gz").e_tag
+
+    assert s.touch_distribution("foo", "foo-0.1.0.tar.gz")
+    assert not s.touch_distribution("foo", "foo-0.2.0.tar.gz")
+
+    obj = s3_bucket.Object("foo/foo-0.1.0.tar.gz")
+    assert obj.e_tag != before  # Rewritten with a multipart copy.
+    assert obj.get()["Body"].read() == b"foo"
+
+
+def test_conditional_put_meta(s3_bucket):
+    s = S3Storage(S3Config(bucket=s3_bucket.name))
+    headers = []
+    s.s3.meta.client.meta.events.register(
+        "before-send.s3.PutObject",
+        lambda request, **_: headers.append(dict(request.headers)),
+    )
+
+    s.put_meta("test.json", b"1", if_none_match=True)
+    s.put_meta("test.json", b"2", if_match='"abc"')
+    s.put_meta("test.json", b"3")
+
+    assert headers[0]["If-None-Match"] == b"*"
+    assert headers[1]["If-Match"] == b'"abc"'
+    assert "If-Match" not in headers[2] and "If-None-Match" not in headers[2]
+
+
+def test_rate_limits(s3_bucket, dynamodb_table, monkeypatch):
+    s = S3Storage(S3Config(bucket=s3_bucket.name, rate_limits={"write": "10"}))
+    assert s.limiter.buckets["write"].max_rate == 10
+
+    acquired = []
+    for name, bucket in s.limiter.buckets.items():
+        monkeypatch.setattr(bucket, "acquire", lambda name=name: acquired.append(name))
+
+    with s.lock("foo"):
+        s.put_index("foo", Index({"bar": None}))
+    s.get_index("foo")
+
+    assert set(acquired) == {"read", "write", "lock"}
+
+
+def test_index_storage_roundtrip_compressed(s3_bucket):
+    directory = "foo"
+    index = Index({"bar": None})
+
+    cfg = S3Config(bucket=s3_bucket.name, index_compression="gzip")
+    s = S3Storage(cfg)
+
+    s.put_index(directory, index)
+    obj = s3_bucket.Object(f"{directory}/").get()
+
+    assert obj["ContentEncoding"] == "gzip"
+    assert b"bar" not in obj["Body"].read()
+    assert s.get_index(directory) == index
+    assert S3Storage(S3Config(bucket=s3_bucket.name)).get_index(directory) == index
+
+
 index = object()
 
 
@@ -61,3 +178,34 @@ def test_list_directories(s3_bucket):
     s = S3Storage(cfg)
 
     assert s.list_directories() == ["AA/", "BBBB/"]
+
+
+def test_index_cache_invalidation(s3_bucket):
+    cfg = S3Config(
+        bucket=s3_bucket.name,
+        prefix="P",
+        index_max_age=3600,
+        cloudfront_distribution_id="E123",
+    )
+    s = S3Storage(cfg)
+    with Stubber(s.cloudfront) as cloudfront:
+        cloudfront.add_response(
+            "create_invalidation",
+            {},
+            {
+                "DistributionId": "E123",
+                "InvalidationBatch": {
+                    "Paths": {"Quantity": 3, "Items": ["/P/", "/P/bar/", "/P/foo/"]},
+                    "CallerReference": ANY,
+                },
+            },
+        )
+        with s:
+            s.put_index("foo", Index({"foo-0.1.0.tar.gz": None}))
+            s.put_index("bar", Index({"bar-0.1.0.tar.gz": None}))
+            s.put_index(s.root, Index({"bar/": None, "foo/": None}))
+
+        cloudfront.assert_no_pending_responses()
+
+    obj = s3_bucket.Object("P/foo/").get()
+    assert obj["CacheControl"] == "public, max-age=0, must-revalidate, s-maxage=3600"
@@ -0,0 +1,79 @@
+import logging
+
+import botocore
+import pytest
+
+from s3pypi import sync
+from s3pypi.__main__ import main as s3pypi
+from s3pypi.index import Index
+
+WHEEL = "hello-world/hello_world-0.1.0-py3-none-any.whl"
+
+
+@pytest.fixture
+def synced(chdir, data_dir, s3_bucket, tmp_path):
+    with chdir(data_dir):
+        s3pypi("upload", "dists/*", "--bucket", s3_bucket.name, "--put-root-index")
+
+    dest = tmp_path / "mirror"
+    s3pypi("sync-down", str(dest), "--bucket", s3_bucket.name)
+    return dest
+
+
+def test_sync_down(synced, data_dir):
+    root_index = Index.parse((synced / "index.html").read_text())
+    assert sorted(root_index.filenames) == ["foo", "hello-world", "xyz"]
+
+    for path in ["foo/foo-0.1.0.tar.gz", WHEEL, "xyz/xyz-0.1.0.zip"]:
+        local = synced / path
+        assert local.read_bytes() == (data_dir / "dists" / local.name).read_bytes()
+        index = Index.parse((local.parent / "index.html").read_text())
+        assert local.name in index.filenames
+
+
+def test_sync_down_transfers_delta(synced, s3_bucket, caplog):
+    caplog.set_level(logging.INFO)
+    s3pypi("sync-down", str(synced), "--bucket", s3_bucket.name)
+
+    assert not [r for r in caplog.records if r.message.startswith("Downloading")]
+
+
+def test_sync_down_resumes_partial_files(synced, s3_bucket, caplog):
+    wheel = synced / WHEEL
+    content = wheel.read_bytes()
+    wheel.with_name(wheel.name + ".part").write_bytes(content[:100])
+    wheel.unlink()
+
+    caplog.set_level(logging.INFO)
+    s3pypi("sync-down", str(synced), "--bucket", s3_bucket.name)
+
+    assert f"Downloading {WHEEL} (resumed)" in caplog.messages
+    assert wheel.read_bytes() == content
+    assert not wheel.with_name(wheel.name + ".part").exists()
+
+
+def test_sync_down_delete(synced, s3_bucket):
+    s3pypi("delete", "xyz", "0.1.0", "--bucket", s3_bucket.name)
+    s3pypi("sync-down", str(synced), "xyz", "--delete", "--bucket", s3_bucket.name)
+
+    assert not (synced / "xyz" / "xyz-0.1.0.zip").exists()
+
+
+def test_sync_down_connection_error(chdir, data_dir, s3_bucket, tmp_path, monkeypatch):
+    with chdir(data_dir):
+        s3pypi("upload", "dists/*", "--bucket", s3_bucket.name, "--put-root-index")
+    download = sync.download
+
+    def reset(storage, directory, filename, *args):
+        if filename.endswith(".whl"):
+            raise botocore.exceptions.ConnectionClosedError(endpoint_url="s3")
+        return download(storage, directory, filename, *args)
+
+    monkeypatch.setattr(sync, "download", reset)
+    dest = tmp_path / "mirror"
+    with pytest.raises(SystemExit, match="ERROR: Failed to download 1 files"):
+        s3pypi("sync-down", str(dest), "--bucket", s3_bucket.name)
+
+    # The other projects are complete.
+    assert (dest / "foo" / "index.html").exists()
+    assert not (dest / "hello-world" / "index.html").exists()
@@ -0,0 +1,145 @@
+import io
+import re
+import shutil
+
+import boto3
+import pytest
+
+from s3pypi import upstream
+from s3pypi.__main__ import main as s3pypi
+from s3pypi.exceptions import S3PyPiError
+from s3pypi.index import Hash, Index
+
+
+@pytest.fixture
+def upstream_index(http_server, data_dir):
+    root, url = http_server
+    files = root / "files"
+    files.mkdir()
+
+    index = Index()
+    for dist in ["hello_world-0.1.0-py3-none-any.whl", "hello_world-0.1.0.tar.gz"]:
+        shutil.copy(data_dir / "dists" / dist, files / dist)
+        index.filenames[f"../../files/{dist}"] = Hash.of("sha256", files / dist)
+
+    (root / "simple" / "hello-world").mkdir(parents=True)
+    (root / "simple" / "hello-world" / "index.html").write_text(index.to_html())
+
+    return root, f"{url}/simple/"
+
+
+def test_main_mirror(upstream_index, s3_bucket):
+    root, index_url = upstream_index
+    args = ["--index-url", index_url, "--bucket", s3_bucket.name]
+
+    s3pypi("mirror", "hello-world==0.1.0", *args)
+
+    html = s3_bucket.Object("hello-world/").get()["Body"].read().decode()
+    index = Index.parse(html)
+
+    for dist in ["hello_world-0.1.0-py3-none-any.whl", "hello_world-0.1.0.tar.gz"]:
+        assert index.filenames[dist] == Hash.of("sha256", root / "files" / dist)
+        assert (
+            s3_bucket.Object(f"hello-world/{dist}").get()["Body"].read()
+            == (root / "files" / dist).read_bytes()
+        )
+
+
+def test_main_mirror_hash_mismatch(upstream_index, s3_bucket):
+    root, index_url = upstream_index
+    (root / "files" / "hello_world-0.1.0.tar.gz").write_bytes(b"tampered")
+
+    with pytest.raises(SystemExit, match="ERROR: Failed to mirror 1 files"):
+        s3pypi("mirror", "hello-world", "--index-url", index_url, "-b", s3_bucket.name)
+
+    html = s3_bucket.Object("hello-world/").get()["Body"].read().decode()
+    assert list(Index.parse(html).filenames) == ["hello_world-0.1.0-py3-none-any.whl"]
+
+
+def test_main_mirror_not_found(upstream_index, s3_bucket):
+    _, index_url = upstream_index
+
+    with pytest.raises(SystemExit, match="ERROR: Failed to fetch"):
+        s3pypi("mirror", "foo", "--index-url", index_url, "-b", s3_bucket.name)
+
+
+def test_main_mirror_resolves_all_packages_first(upstream_index, s3_bucket):
+    _, index_url = upstream_index
+    args = ["--index-url", index_url, "-b", s3_bucket.name]
+
+    with pytest.raises(
+        SystemExit, match="No files found upstream for: hello-world==9.9"
+    ):
+        s3pypi("mirror", "hello-world", "hello-world==9.9", *args)
+
+    assert not list(s3_bucket.objects.all())
+
+
+def test_main_mirror_unsupported_hash(upstream_index, s3_bucket):
+    root, index_url = upstream_index
+    page = root / "simple" / "hello-world" / "index.html"
+    page.write_text(page.read_text().replace("sha256=", "sha3000=", 1))
+
+    with pytest.raises(SystemExit, match="ERROR: Failed to mirror 1 files"):
+        s3pypi("mirror", "hello-world", "--index-url", index_url, "-b", s3_bucket.name)
+
+    html = s3_bucket.Object("hello-world/").get()["Body"].read().decode()
+    assert len(Index.parse(html).filenames) == 1
+
+
+def test_main_mirror_skips_other_file_types(upstream_index, s3_bucket):
+    root, index_url = upstream_index
+    (root / "files" / "hello_world-0.0.9-py2.7.egg").write_bytes(b"egg")
+    page = root / "simple" / "hello-world" / "index.html"
+    link = '<a href="../../files/hello_world-0.0.9-py2.7.egg">egg</a>'
+    page.write_text(page.read_text().replace("</body>", f"{link}</body>"))
+
+    s3pypi("mirror", "hello-world", "--index-url", index_url, "-b", s3_bucket.name)
+
+    html = s3_bucket.Object("hello-world/").get()["Body"].read().decode()
+    assert sorted(Index.parse(html).filenames) == [
+        "hello_world-0.1.0-py3-none-any.whl",
+        "hello_world-0.1.0.tar.gz",
+    ]
+
+
+def test_main_mirror_rejects_invalid_archives(upstream_index, s3_bucket):
+    root, index_url = upstream_index
+    dist = root / "files" / "hello_world-0.1.0.tar.gz"
+    dist.write_bytes(dist.read_bytes()[:3])
+    page = root / "simple" / "hello-world" / "index.html"
+    page.write_text(re.sub(r"#sha256=\w+", "", page.read_text()))
+
+    with pytest.raises(SystemExit, match="ERROR: Failed to mirror 1 files"):
+        s3pypi("mirror", "hello-world", "--index-url", index_url, "-b", s3_bucket.name)
+
+    html = s3_bucket.Object("hello-world/").get()["Body"].read().decode()
+    assert list(Index.parse(html).filenames) == ["hello_world-0.1.0-py3-none-any.whl"]
+
+
+def test_fetch_file_rejects_incomplete_downloads(tmp_path, monkeypatch):
+    class Response(io.BytesIO):
+        headers = {"Content-Length": "1000"}
+
+    monkeypatch.setattr(upstream, "_open", lambda url, mirror: Response(b"foo"))
+    link = upstream.Link("foo-1.0.tar.gz", "https://example.com/foo-1.0.tar.gz")
+
+    with pytest.raises(S3PyPiError, match="received 3 of 1000 bytes"):
+        upstream.fetch_file(link, tmp_path / link.filename, upstream.MirrorConfig())
+
+
+def test_main_mirror_upload_failure(upstream_index, s3_bucket, monkeypatch):
+    _, index_url = upstream_index
+    put_distribution = upstream.put_distribution
+
+    def fail_on_wheel(storage, directory, path, *args, **kwargs):
+        if path.suffix == ".whl":
+            raise boto3.exceptions.S3UploadFailedError("Connection reset")
+        return put_distribution(storage, directory, path, *args, **kwargs)
+
+    monkeypatch.setattr(upstream, "put_distribution", fail_on_wheel)
+    with pytest.raises(SystemExit, match="ERROR: Failed to mirror 1 files"):
+        s3pypi("mirror", "hello-world", "--index-url", index_url, "-b", s3_bucket.name)
+
+    html = s3_bucket.Object("hello-world/").get()["Body"].read().decode()
+    assert list(Index.parse(html).filenames) == ["hello_world-0.1.0.tar.gz"]
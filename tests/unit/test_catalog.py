@@ -0,0 +1,33 @@
+import pytest
+
+from s3pypi.catalog import Catalog, Project, latest_version, version_key
+from s3pypi.index import Index
+
+
+def test_version_key():
+    versions = ["junk", "0.9", "1.0.dev0", "1.0a1", "1.0b2", "1.0rc1", "1.0.post1"]
+    assert sorted(reversed(versions), key=version_key) == versions
+    assert version_key("1.0") == version_key("1.0.0")
+    assert version_key("1!0.1") > version_key("2.0")
+
+
+@pytest.mark.parametrize(
+    "filenames, expected",
+    [
+        (["foo-0.9.tar.gz", "foo-1.10-py3-none-any.whl", "foo-1.9.zip"], "1.10"),
+        (["foo-1.0.tar.gz", "foo-1.1rc1.tar.gz"], "1.0"),
+        (["foo-1.1rc1.tar.gz", "foo-1.1b1.tar.gz"], "1.1rc1"),
+        (["README.txt"], None),
+    ],
+)
+def test_latest_version(filenames, expected):
+    assert latest_version(filenames) == expected
+
+
+def test_catalog_roundtrip():
+    index = Index(dict.fromkeys(["foo-0.1.0.tar.gz", "foo-0.2.0.tar.gz"]))
+    catalog = Catalog({"foo": Project.of(index, etag='"abc"'), "bar": Project(1)})
+
+    assert catalog.projects["foo"] == Project(2, "0.2.0", '"abc"')
+    assert Catalog.parse(catalog.to_json()) == catalog
+    assert catalog.to_index() == Index({"foo/": None, "bar/": None})
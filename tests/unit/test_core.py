@@ -1,6 +1,9 @@
 import pytest
 
 from s3pypi import core
+from s3pypi.index import FileMetadata, Hash
+from s3pypi.locking import FileLocker, FileLockTimeoutError, LockerConfig
+from s3pypi.storage import FileStorage
 
 
 @pytest.mark.parametrize(
@@ -25,3 +28,104 @@ def test_normalize_package_name(name, normalized):
 )
 def test_parse_distribution_id(filename, dist):
     assert core.parse_distribution_id(filename) == dist
+
+
+def test_prepare_distributions(data_dir, tmp_path):
+    wheel = data_dir / "dists" / "hello_world-0.1.0-py3-none-any.whl"
+    broken = [tmp_path / "foo-0.1.0.tar.gz", tmp_path / "foo-0.1.0.zip"]
+    for path in broken:
+        path.write_bytes(b"foo")
+
+    prepared = core.prepare_distributions([core.parse_distribution(wheel)])
+    sha256, metadata = prepared[wheel]
+    assert sha256 == Hash.of("sha256", wheel)
+    assert metadata.size == wheel.stat().st_size
+
+    dists = [core.parse_distribution(p) for p in [wheel, *broken]]
+    with pytest.raises(core.S3PyPiError) as e:
+        core.prepare_distributions(dists)
+    errors = [line for line in str(e.value).splitlines() if line.startswith("Invalid")]
+    assert [line.split(":")[0] for line in errors] == [
+        "Invalid archive foo-0.1.0.tar.gz",
+        "Invalid archive foo-0.1.0.zip",
+    ]
+
+
+def stage(storage, tmp_path, filename, content):
+    path = tmp_path / content.decode() / filename
+    path.parent.mkdir()
+    path.write_bytes(content)
+    sha256 = Hash.of("sha256", path)
+    location = core.put_distribution(storage, "foo", path, sha256)
+    return core.StagedFile(sha256, FileMetadata(), location)
+
+
+def test_commit_uploads_removes_staged_files(tmp_path):
+    storage = FileStorage(tmp_path / "repo")
+    storage.lock = FileLocker(tmp_path / ".locks", LockerConfig(0, max_attempts=1))
+    other = FileLocker(tmp_path / ".locks")
+    filename = "foo-0.1.0.tar.gz"
+
+    uploads = {filename: stage(storage, tmp_path, filename, b"a")}
+    assert not (tmp_path / "repo" / "foo" / filename).exists()
+
+    with other("foo"):
+        with pytest.raises(FileLockTimeoutError):
+            core.commit_uploads(storage, "foo", uploads)
+
+    assert not list((tmp_path / "repo" / ".s3pypi" / "staging").iterdir())
+
+    uploads = {filename: stage(storage, tmp_path, filename, b"b")}
+    assert core.commit_uploads(storage, "foo", uploads) == []
+    assert storage.get_index("foo").filenames == {filename: uploads[filename].hash}
+    assert (tmp_path / "repo" / "foo" / filename).read_bytes() == b"b"
+    assert not list((tmp_path / "repo" / ".s3pypi" / "staging").iterdir())
+
+
+def test_commit_uploads_detects_concurrent_uploads(tmp_path):
+    storage = FileStorage(tmp_path / "repo")
+    filename = "foo-0.1.0.tar.gz"
+    a = stage(storage, tmp_path, filename, b"a")
+    b = stage(storage, tmp_path, filename, b"b")
+
+    assert core.commit_uploads(storage, "foo", {filename: a}) == []
+    conflicts = core.commit_uploads(storage, "foo", {filename: b})
+
+    assert conflicts == [filename]
+    assert storage.get_index("foo").filenames[filename] == a.hash
+    assert (tmp_path / "repo" / "foo" / filename).read_bytes() == b"a"
+    assert not list((tmp_path / "repo" / ".s3pypi" / "staging").iterdir())
+
+
+def test_commit_uploads_moves_files_before_locking(tmp_path, monkeypatch):
+    storage = FileStorage(tmp_path / "repo")
+    filename = "foo-0.1.0.tar.gz"
+    locked = []
+    moves = []
+
+    lock = storage.lock
+
+    def tracked_lock(directory):
+        locked.append(directory)
+        return lock(directory)
+
+    move = storage.move_distribution
+
+    def tracked_move(src_directory, directory, filename, replace=True):
+        moves.append((bool(locked), replace))
+        move(src_directory, directory, filename, replace)
+
+    monkeypatch.setattr(storage, "lock", tracked_lock)
+    monkeypatch.setattr(storage, "move_distribution", tracked_move)
+
+    a = stage(storage, tmp_path, filename, b"a")
+    assert core.commit_uploads(storage, "foo", {filename: a}) == []
+    assert moves == [(False, False)]
+
+    # Existing files are only overwritten while the index is locked.
+    locked.clear()
+    b = stage(storage, tmp_path, filename, b"b")
+    assert core.commit_uploads(storage, "foo", {filename: b}, force=True) == []
+    assert moves[1:] == [(False, False), (True, True)]
+    assert (tmp_path / "repo" / "foo" / filename).read_bytes() == b"b"
+    assert storage.get_index("foo").filenames[filename] == b.hash
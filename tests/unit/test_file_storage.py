@@ -0,0 +1,118 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from s3pypi.exceptions import PreconditionFailedError
+from s3pypi.index import Hash, Index
+from s3pypi.locking import FileLocker, FileLockTimeoutError, LockerConfig
+from s3pypi.storage import FileStorage
+
+
+def test_file_storage_index_roundtrip(tmp_path):
+    s = FileStorage(tmp_path)
+    index = Index({"bar": Hash("sha256", "1234" * 16)})
+
+    s.put_index("foo", index)
+
+    assert s.get_index("foo") == index
+    assert s.get_index("missing") == Index()
+    assert (tmp_path / "foo" / "index.html").read_text() == index.to_html()
+
+
+def test_file_storage_distribution(tmp_path):
+    s = FileStorage(tmp_path / "repo")
+    dist = tmp_path / "foo-0.1.0.tar.gz"
+    dist.write_bytes(b"0123456789")
+
+    sent = []
+    s.put_distribution("foo", dist, sent.append)
+    assert sum(sent) == 10
+
+    f = s.get_distribution("foo", dist.name, offset=4)
+    assert f.read() == b"456789"
+    f.close()
+
+    s.delete("foo", dist.name)
+    assert not (tmp_path / "repo" / "foo" / dist.name).exists()
+
+
+def test_file_storage_locked_index(tmp_path):
+    s = FileStorage(tmp_path)
+
+    with s.locked_index("foo") as index:
+        index.filenames["foo-0.1.0.tar.gz"] = None
+    with s.locked_index(s.root) as root_index:
+        root_index.filenames = dict.fromkeys(s.list_directories())
+
+    assert s.list_directories() == ["foo/"]
+    assert s.get_index(s.root).filenames == {"foo": None}
+
+    with s.locked_index("foo") as index:
+        index.filenames.clear()
+
+    assert not (tmp_path / "foo" / "index.html").exists()
+
+
+def test_file_storage_conditional_put_meta(tmp_path):
+    s = FileStorage(tmp_path)
+
+    s.put_meta("test.json", b"1", if_none_match=True)
+    with pytest.raises(PreconditionFailedError):
+        s.put_meta("test.json", b"2", if_none_match=True)
+
+    data, etag = s.get_meta_with_etag("test.json")
+    s.put_meta("test.json", b"2", if_match=etag)
+    with pytest.raises(PreconditionFailedError):
+        s.put_meta("test.json", b"3", if_match=etag)
+    assert s.get_meta("test.json") == b"2"
+
+
+def test_file_storage_concurrent_catalog_updates(tmp_path):
+    s = FileStorage(tmp_path)
+    s.build_catalog()
+
+    def publish(n):
+        with s.locked_index(f"foo{n}") as index:
+            index.filenames[f"foo{n}-0.1.0.tar.gz"] = None
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(publish, range(16)))
+
+    assert set(s.get_catalog().projects) == {f"foo{n}" for n in range(16)}
+
+
+def test_file_storage_catalog_failure_is_not_fatal(tmp_path, monkeypatch, caplog):
+    s = FileStorage(tmp_path)
+    s.build_catalog()
+
+    def fail(directories):
+        raise OSError("Disk full")
+
+    monkeypatch.setattr(s, "update_catalog", fail)
+    with s.locked_index("foo") as index:
+        index.filenames["foo-0.1.0.tar.gz"] = None
+
+    assert s.get_index("foo").filenames == {"foo-0.1.0.tar.gz": None}
+    assert caplog.record_tuples == [
+        ("s3pypi", logging.WARNING, "Failed to update the catalog for foo: Disk full")
+    ]
+
+    # The catalog is repaired from a listing.
+    monkeypatch.undo()
+    assert set(s.reconcile_catalog().projects) == {"foo"}
+    assert set(s.get_catalog().projects) == {"foo"}
+
+
+def test_file_lock_timeout(tmp_path):
+    cfg = LockerConfig(retry_delay=0, max_attempts=3)
+    lock = FileLocker(tmp_path, cfg)
+    other = FileLocker(tmp_path, cfg)
+
+    with lock("example"):
+        with pytest.raises(FileLockTimeoutError):
+            with other("example"):
+                pass
+
+    with other("example"):
+        pass
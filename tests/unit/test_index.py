@@ -1,6 +1,8 @@
+import datetime as dt
+
 import pytest
 
-from s3pypi.index import Hash, Index
+from s3pypi.index import FileMetadata, Hash, Index
 
 
 @pytest.fixture(
@@ -49,3 +51,46 @@ def test_render_index(index_html):
     expected_html, filenames = index_html
     html = Index(filenames).to_html()
     assert html == expected_html
+
+
+def test_index_metadata_roundtrip():
+    index = Index(
+        filenames={
+            "foo-0.1.0-py3-none-any.whl": Hash("sha256", "1234" * 16),
+            "foo-0.1.0.tar.gz": None,
+        },
+        metadata={
+            "foo-0.1.0-py3-none-any.whl": FileMetadata(
+                size=1234,
+                upload_time=dt.datetime(2024, 1, 1, 12, tzinfo=dt.timezone.utc),
+                requires_python=">=3.8,<4",
+                core_metadata=Hash("sha256", "abcd" * 16),
+            ),
+        },
+    )
+
+    html = index.to_html()
+
+    assert 'data-requires-python="&gt;=3.8,&lt;4"' in html
+    assert 'data-size="1234"' in html
+    assert 'data-upload-time="2024-01-01T12:00:00+00:00"' in html
+    assert f'data-core-metadata="sha256={"abcd" * 16}"' in html
+    assert f'data-dist-info-metadata="sha256={"abcd" * 16}"' in html
+    assert Index.parse(html) == index
+
+
+def test_index_hrefs_roundtrip():
+    blob = f"../../.blobs/sha256/{'1234' * 16}/foo%2Bbar-0.1.0.tar.gz"
+    index = Index(
+        filenames={
+            "foo+bar-0.1.0.tar.gz": Hash("sha256", "1234" * 16),
+            "foo+bar-0.2.0.tar.gz": None,
+        },
+        hrefs={"foo+bar-0.1.0.tar.gz": blob},
+    )
+
+    html = index.to_html()
+
+    assert f'<a href="{blob}#sha256={"1234" * 16}">' in html
+    assert '<a href="foo%2Bbar-0.2.0.tar.gz">' in html
+    assert Index.parse(html) == index
@@ -0,0 +1,109 @@
+import pytest
+
+from s3pypi.exceptions import S3PyPiError
+from s3pypi.index import Hash
+from s3pypi.journal import Head, Journal
+from s3pypi.storage import FileStorage
+
+
+def test_journal_not_started(tmp_path):
+    s = FileStorage(tmp_path)
+
+    with s.locked_index("foo") as index:
+        index.filenames["foo-0.1.0.tar.gz"] = None
+
+    assert not s.journal.exists()
+    assert s.journal.changes_since(0) == []
+
+
+def test_journal_records_changes(tmp_path):
+    s = FileStorage(tmp_path)
+    s.create_journal = True
+    h1, h2 = Hash("sha256", "1" * 64), Hash("sha256", "2" * 64)
+
+    with s.locked_index("foo") as index:
+        index.filenames["foo-0.1.0.tar.gz"] = h1
+        index.filenames["foo-0.2.0.tar.gz"] = None
+    with s.locked_index("foo") as index:
+        pass  # Nothing changed, so nothing is recorded.
+    with s.locked_index("foo") as index:
+        index.filenames["foo-0.1.0.tar.gz"] = h2
+        del index.filenames["foo-0.2.0.tar.gz"]
+
+    first, second = s.journal.changes_since(0)
+    assert (first.seq, first.project, first.removed) == (1, "foo", [])
+    assert first.added == {"foo-0.1.0.tar.gz": h1, "foo-0.2.0.tar.gz": None}
+    assert (second.seq, second.added) == (2, {"foo-0.1.0.tar.gz": h2})
+    assert second.removed == ["foo-0.2.0.tar.gz"]
+    assert s.journal.changes_since(1) == [second]
+
+
+def test_journal_append_failure_fails_the_commit(tmp_path, monkeypatch):
+    s = FileStorage(tmp_path)
+    s.create_journal = True
+
+    def fail(*args, **kwargs):
+        raise OSError("Disk full")
+
+    monkeypatch.setattr(Journal, "append", fail)
+    with pytest.raises(S3PyPiError, match="failed to record the change"):
+        with s.locked_index("foo") as index:
+            index.filenames["foo-0.1.0.tar.gz"] = None
+
+    # The lock is released.
+    monkeypatch.undo()
+    with s.locked_index("foo") as index:
+        del index.filenames["foo-0.1.0.tar.gz"]
+
+
+def test_journal_compaction(tmp_path):
+    s = FileStorage(tmp_path)
+    journal = Journal(s, segment_size=3)
+
+    for i in range(7):
+        journal.append("foo", {f"foo-{i}.tar.gz": None}, [], create=True)
+
+    records = tmp_path / ".s3pypi" / "journal" / "records"
+    assert len(list(records.iterdir())) == 7  # Not compacted while appending.
+
+    journal.compact()
+    assert [p.name for p in records.iterdir()] == ["000000000007.json"]
+    assert [c.seq for c in journal.changes_since(0)] == list(range(1, 8))
+    assert [c.seq for c in journal.changes_since(5)] == [6, 7]
+    assert journal.changes_since(7) == []
+
+
+def test_journal_concurrent_appends(tmp_path, monkeypatch):
+    s = FileStorage(tmp_path)
+    journal = Journal(s, segment_size=3)
+    journal.append("foo", {}, ["foo-0.tar.gz"], create=True)
+    stale_head = s.get_meta(journal.head_name)
+
+    # Writers that read the same head don't overwrite each other's records.
+    journal.append("foo", {}, ["foo-1.tar.gz"])
+    s.put_meta(journal.head_name, stale_head)
+    journal.append("bar", {}, ["bar-1.tar.gz"])
+    assert [(c.seq, c.project) for c in journal.changes_since(0)] == [
+        (1, "foo"),
+        (2, "foo"),
+        (3, "bar"),
+    ]
+
+    # Readers see records beyond a head that wasn't advanced.
+    s.put_meta(journal.head_name, stale_head)
+    assert [c.seq for c in journal.changes_since(1)] == [2, 3]
+
+    # A writer with a head from before compaction doesn't reuse compacted numbers.
+    s.put_meta(journal.head_name, b'{"next": 4, "segments": []}')
+    journal.compact()
+    read_head = journal._read_head
+    stale = iter([(Head(next=2), None)])
+    monkeypatch.setattr(journal, "_read_head", lambda: next(stale, None) or read_head())
+    journal.append("baz", {}, [])
+
+    assert [(c.seq, c.project) for c in journal.changes_since(0)][-2:] == [
+        (3, "bar"),
+        (4, "baz"),
+    ]
+    records = (tmp_path / ".s3pypi/journal/records").iterdir()
+    assert sorted(p.name for p in records) == ["000000000004.json"]
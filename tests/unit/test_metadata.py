@@ -0,0 +1,38 @@
+import pytest
+
+from s3pypi.exceptions import S3PyPiError
+from s3pypi.metadata import check_archive, read_wheel_metadata
+
+WHEEL = "hello_world-0.1.0-py3-none-any.whl"
+
+
+@pytest.mark.parametrize("buffer_size", [64, 64 * 1024])
+def test_read_wheel_metadata(data_dir, buffer_size):
+    data = (data_dir / "dists" / WHEEL).read_bytes()
+    reads = []
+
+    def read_range(start: int, length: int) -> bytes:
+        reads.append((start, length))
+        return data[start : start + length]
+
+    metadata = read_wheel_metadata(WHEEL, read_range, len(data), buffer_size)
+
+    assert metadata and metadata.startswith(b"Metadata-Version: 2.1\n")
+    # The first reads come from the end of the file (the central directory).
+    assert reads[0][0] > len(data) // 2
+
+
+def test_check_archive(data_dir, tmp_path):
+    for path in (data_dir / "dists").iterdir():
+        check_archive(path)
+
+    data = (data_dir / "dists" / WHEEL).read_bytes()
+    truncated = tmp_path / WHEEL
+    truncated.write_bytes(data[: len(data) // 2])
+    with pytest.raises(S3PyPiError, match=f"Invalid archive {WHEEL}"):
+        check_archive(truncated)
+
+    sdist = tmp_path / "foo-0.1.0.tar.gz"
+    sdist.write_bytes((data_dir / "dists" / sdist.name).read_bytes()[:-20])
+    with pytest.raises(S3PyPiError, match="Invalid archive foo-0.1.0.tar.gz"):
+        check_archive(sdist)
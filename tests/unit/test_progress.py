@@ -0,0 +1,74 @@
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from s3pypi.progress import Progress, format_duration, format_size
+
+
+@pytest.mark.parametrize(
+    "n, expected",
+    [
+        (512, "512 B"),
+        (1536, "1.5 KiB"),
+        (3 * 1024**3, "3.0 GiB"),
+        (2 * 1024**4, "2048.0 GiB"),
+    ],
+)
+def test_format_size(n, expected):
+    assert format_size(n) == expected
+
+
+def test_format_duration():
+    assert format_duration(None) == "?"
+    assert format_duration(65.5) == "1:05"
+    assert format_duration(3725) == "1:02:05"
+
+
+def test_progress_bar():
+    stream = io.StringIO()
+    progress = Progress(stream, tty=True, interval=0)
+
+    with progress.track("foo-0.1.0.tar.gz", 1000) as callback:
+        callback(250)
+        assert "foo-0.1.0.tar.gz [" in stream.getvalue()
+        assert " 25% 250 B/1000 B " in stream.getvalue()
+
+        with progress.track("foo-0.1.0.zip", 1000) as other:
+            other(750)
+            assert stream.getvalue().split("\r")[-1].startswith("2 files [")
+            assert " 50% " in stream.getvalue().split("\r")[-1]
+
+    assert stream.getvalue().endswith("\r")
+
+
+def test_progress_logs(caplog):
+    caplog.set_level(logging.INFO)
+    progress = Progress(io.StringIO(), tty=False, interval=0)
+
+    def upload(name):
+        with progress.track(name, 100) as callback:
+            callback(60)
+            callback(-10)  # Retried
+            callback(50)
+
+    with ThreadPoolExecutor(2) as executor:
+        list(executor.map(upload, ["a.whl", "b.whl"]))
+
+    done = sorted(r.message for r in caplog.records if "transfer=done" in r.message)
+    assert [m.split(" seconds=")[0] for m in done] == [
+        "transfer=done file=a.whl bytes=100",
+        "transfer=done file=b.whl bytes=100",
+    ]
+    assert any("percent=60.0" in r.message for r in caplog.records)
+
+
+def test_progress_quiet_for_short_transfers(caplog):
+    caplog.set_level(logging.INFO)
+    progress = Progress(io.StringIO(), tty=False)
+
+    with progress.track("a.whl", 100) as callback:
+        callback(100)
+
+    assert not caplog.records
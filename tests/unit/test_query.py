@@ -0,0 +1,37 @@
+import datetime as dt
+
+from s3pypi.index import FileMetadata, Hash, Index
+from s3pypi.query import describe_project
+
+
+def test_describe_project():
+    index = Index(
+        filenames={
+            "foo-1.10.tar.gz": Hash("sha256", "abc"),
+            "foo-1.9-py3-none-any.whl": None,
+            "foo-1.9.tar.gz": None,
+            "README.txt": None,
+        },
+        metadata={
+            "foo-1.10.tar.gz": FileMetadata(
+                size=3, upload_time=dt.datetime(2024, 1, 2, tzinfo=dt.timezone.utc)
+            )
+        },
+    )
+
+    versions = describe_project(index)
+
+    assert list(versions) == ["", "1.9", "1.10"]
+    assert [f["filename"] for f in versions["1.9"]] == [
+        "foo-1.9-py3-none-any.whl",
+        "foo-1.9.tar.gz",
+    ]
+    assert versions["1.10"] == [
+        {
+            "filename": "foo-1.10.tar.gz",
+            "hash": "sha256=abc",
+            "size": 3,
+            "upload_time": "2024-01-02T00:00:00+00:00",
+            "requires_python": None,
+        }
+    ]
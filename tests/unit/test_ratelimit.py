@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+
+import pytest
+
+from s3pypi.exceptions import S3PyPiError
+from s3pypi.ratelimit import AdaptiveTokenBucket, RateLimiter
+
+
+def test_adaptive_token_bucket():
+    bucket = AdaptiveTokenBucket(max_rate=100, min_rate=10)
+
+    bucket.on_throttle()
+    assert bucket.rate == 50
+    assert bucket.tokens <= 0
+
+    for _ in range(3):
+        bucket.on_throttle()
+    assert bucket.rate == 10
+
+    for _ in range(200):
+        bucket.on_success()
+    assert bucket.rate == 100
+
+
+@pytest.mark.parametrize(
+    "service, operation, expected",
+    [
+        ("s3", "GetObject", "read"),
+        ("s3", "ListObjectsV2", "read"),
+        ("s3", "PutObject", "write"),
+        ("s3", "UploadPart", "write"),
+        ("dynamodb", "GetItem", "lock"),
+    ],
+)
+def test_operation_class(service, operation, expected):
+    assert RateLimiter().operation_class(service, operation) == expected
+
+
+def test_rate_limits():
+    limiter = RateLimiter({"write": "300"})
+    assert limiter.buckets["write"].rate == 300
+    assert limiter.buckets["read"].rate == RateLimiter.default_rates["read"]
+
+    with pytest.raises(S3PyPiError, match="Unknown rate limit: reads"):
+        RateLimiter({"reads": "10"})
+    with pytest.raises(S3PyPiError, match="Invalid rate limit: read=fast"):
+        RateLimiter({"read": "fast"})
+
+
+@pytest.mark.parametrize(
+    "status, code, throttled",
+    [
+        (200, None, False),
+        (404, "NoSuchKey", False),
+        (503, "SlowDown", True),
+        (400, "ProvisionedThroughputExceededException", True),
+    ],
+)
+def test_throttling_responses(status, code, throttled):
+    limiter = RateLimiter({"write": 100})
+    limiter.buckets["write"].rate = 50
+    parsed = {"Error": {"Code": code}} if code else {}
+    response = (SimpleNamespace(status_code=status), parsed)
+
+    limiter._after_attempt("needs-retry.s3.PutObject", response=response)
+    assert limiter.buckets["write"].rate == (25 if throttled else 51)
+
+    limiter._after_attempt("needs-retry.s3.PutObject", response=None)
+    assert limiter.buckets["write"].rate == (25 if throttled else 51)
@@ -0,0 +1,26 @@
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = ["boto3", "botocore", "mypy_boto3_s3", "mypy_boto3_dynamodb"]
+
+script = f"""
+import sys
+from s3pypi.__main__ import main
+try:
+    main(*sys.argv[1:])
+except SystemExit:
+    pass
+print("IMPORTED:", [m for m in {HEAVY_MODULES!r} if m in sys.modules])
+"""
+
+
+@pytest.mark.parametrize(
+    "args", [["--version"], ["--help"], ["upload", "--help"], ["upload"]]
+)
+def test_cli_startup_does_not_import_aws_sdk(args):
+    result = subprocess.run(
+        [sys.executable, "-c", script, *args], capture_output=True, text=True
+    )
+    assert result.stdout.splitlines()[-1] == "IMPORTED: []"
@@ -0,0 +1,59 @@
+from s3pypi.index import Hash
+from s3pypi.transaction import TransactionLog
+
+
+def test_transaction_log_resume(tmp_path):
+    path = tmp_path / "log.jsonl"
+    h1, h2 = Hash("sha256", "1" * 64), Hash("sha256", "2" * 64)
+
+    txlog = TransactionLog(path)
+    txlog.uploaded("foo", "foo-0.1.0.tar.gz", h1, '"etag1"')
+    txlog.committed("foo")
+    txlog.uploaded("bar", "bar-0.1.0.tar.gz", h2, None)
+    with open(path, "a") as f:
+        f.write('{"event": "commi')  # Interrupted while writing.
+
+    state = TransactionLog(path, resume=True).state
+    assert state.committed == {"foo"}
+    assert state.uploaded[("foo", "foo-0.1.0.tar.gz")].hash == h1
+    assert state.uploaded[("foo", "foo-0.1.0.tar.gz")].etag == '"etag1"'
+    assert state.uploaded[("bar", "bar-0.1.0.tar.gz")].etag is None
+
+    # Without resuming, the previous log is discarded.
+    txlog = TransactionLog(path)
+    assert not txlog.state.uploaded
+    txlog.remove()
+    assert not path.exists()
+    assert not TransactionLog(path, resume=True).state.uploaded
+
+
+def test_transaction_log_default_path(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    dists = [tmp_path / "b.whl", tmp_path / "a.whl"]
+
+    path = TransactionLog.default_path("s3://bucket", dists)
+
+    assert path.parent == tmp_path / "s3pypi" / "transactions"
+    assert path == TransactionLog.default_path("s3://bucket", dists[::-1])
+    assert path != TransactionLog.default_path("s3://bucket/prefix", dists)
+
+
+def test_transaction_log_is_created_lazily(tmp_path):
+    path = tmp_path / "transactions" / "log.jsonl"
+
+    txlog = TransactionLog(path)
+    assert not path.parent.exists()
+
+    txlog.committed("foo")
+    assert path.read_text() == '{"event": "committed", "directory": "foo"}\n'
+
+
+def test_transaction_log_write_failure_is_not_fatal(tmp_path, caplog):
+    (tmp_path / "readonly").write_text("")
+    txlog = TransactionLog(tmp_path / "readonly" / "log.jsonl")
+
+    txlog.committed("foo")
+    txlog.committed("bar")
+    txlog.remove()
+
+    assert [r.levelname for r in caplog.records] == ["WARNING"]